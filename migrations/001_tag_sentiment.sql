@@ -0,0 +1,10 @@
+-- 001_tag_sentiment.sql
+-- 태그 sentiment (리뷰 저장 시 한 번 기록, 1/0/-1). schemas.TagSentiment
+-- 배포 전에 한 번 실행: mysql -u $MYSQL_USER -p $MYSQL_DATABASE < migrations/001_tag_sentiment.sql
+
+CREATE TABLE IF NOT EXISTS `tagSentiment` (
+    `tagId` BIGINT NOT NULL,
+    `sentiment` SMALLINT NOT NULL,
+    PRIMARY KEY (`tagId`),
+    CONSTRAINT `fk_tagSentiment_tag` FOREIGN KEY (`tagId`) REFERENCES `Tag` (`id`) ON DELETE CASCADE
+);
@@ -0,0 +1,230 @@
+# bench_rec.py
+# 추천 모델 오프라인 평가/학습 비용 벤치마크
+#
+#   python bench_rec.py --sizes 1000x500,10000x2000 --components 16,32 --epochs 10,30 --threads 1,4 --output bench.json
+#   python bench_rec.py ... --baseline bench.json   (같은 설정의 이전 결과와 비교)
+#
+# DB 없이 db_connect.get_user_info / get_place_info / get_userplace_interactions와 같은 모양의
+# 합성 데이터를 만들고, 설정마다 별도 프로세스에서 학습/예측해서 peak RSS를 따로 잰다.
+
+import argparse
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from features import age_feature, menu_feature, activity_feature
+
+MENUS = ["아메리카노", "카페라떼", "바닐라라떼", "콜드브루", "녹차", "케이크", "마카롱", "크로플", "스무디", "에이드"]
+ACTIVITIES = ["공부", "작업", "수다", "데이트", "독서", "산책", "사진", "모임"]
+# vdb.sentiment_weight와 같은 가중치 (negative -1, neutral 1, positive 2)
+SENTIMENT_WEIGHTS = np.array([-1.0, 1.0, 2.0])
+
+@dataclasses.dataclass
+class SyntheticData:
+    user_features: List[Tuple[int, str]]
+    place_features: List[Tuple[int, Union[int, str]]]
+    interactions: List[Tuple[int, int, float]]
+    test_interactions: List[Tuple[int, int, float]]
+
+def generate(num_users: int, num_places: int, reviews_per_user: int, num_clusters: int = 8, num_tags: int = 200, test_fraction: float = 0.2, seed: int = 42) -> SyntheticData:
+    """
+    user/place를 취향 cluster로 나누고 user는 자기 cluster place를 주로 리뷰하게 해서,
+    모델이 feature와 interaction으로 cluster를 배울 수 있는 데이터를 만듭니다.
+
+    :return: get_user_info, get_place_info, get_userplace_interactions와 같은 모양의 리스트
+    """
+    rs = np.random.RandomState(seed)
+    user_cluster = rs.randint(num_clusters, size=num_users)
+    place_cluster = rs.randint(num_clusters, size=num_places)
+    cluster_age = rs.randint(18, 60, size=num_clusters)
+    cluster_menus = [rs.choice(len(MENUS), 3, replace=False) for _ in range(num_clusters)]
+    cluster_activities = [rs.choice(len(ACTIVITIES), 2, replace=False) for _ in range(num_clusters)]
+    cluster_tags = [rs.choice(num_tags, 10, replace=False) + 1 for _ in range(num_clusters)]
+
+    user_features = []
+    for user_id, cluster in enumerate(user_cluster.tolist(), start=1):
+        user_features.append((user_id, age_feature(int(cluster_age[cluster] + rs.randint(-5, 6)))))
+        user_features.append((user_id, menu_feature(MENUS[rs.choice(cluster_menus[cluster])])))
+        user_features.append((user_id, activity_feature(ACTIVITIES[rs.choice(cluster_activities[cluster])])))
+
+    place_features = []
+    places_by_cluster = [[] for _ in range(num_clusters)]
+    for place_id, cluster in enumerate(place_cluster.tolist(), start=1):
+        places_by_cluster[cluster].append(place_id)
+        for tag_id in rs.choice(cluster_tags[cluster], 3, replace=False).tolist():
+            place_features.append((place_id, tag_id))
+        place_features.append((place_id, age_feature(float(cluster_age[cluster] + rs.randn() * 3))))
+
+    interactions = {}
+    for user_id, cluster in enumerate(user_cluster.tolist(), start=1):
+        own = places_by_cluster[cluster] or list(range(1, num_places + 1))
+        for _ in range(reviews_per_user):
+            # 80%는 자기 cluster place, 나머지는 아무 place
+            in_cluster = rs.rand() < 0.8
+            place_id = int(rs.choice(own)) if in_cluster else int(rs.randint(1, num_places + 1))
+            # 리뷰 하나에 태그 1~3개, 점수는 태그 sentiment 가중치의 합
+            sentiments = rs.choice(3, size=rs.randint(1, 4), p=[0.1, 0.3, 0.6] if in_cluster else [0.4, 0.4, 0.2])
+            interactions[(user_id, place_id)] = interactions.get((user_id, place_id), 0.0) + float(SENTIMENT_WEIGHTS[sentiments].sum())
+
+    rows = [(user_id, place_id, score) for (user_id, place_id), score in interactions.items()]
+    held_out = rs.rand(len(rows)) < test_fraction
+    train = [row for row, test in zip(rows, held_out) if not test]
+    # 평가는 좋게 평가한 (score > 0) interaction만 정답으로 사용
+    test = [row for row, test in zip(rows, held_out) if test and row[2] > 0]
+    return SyntheticData(user_features, place_features, train, test)
+
+def _peak_rss_bytes() -> int:
+    # Linux는 KB, macOS는 byte 단위
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def run_config(config: Dict[str, int]) -> Dict[str, Optional[float]]:
+    """
+    설정 하나를 학습/평가합니다. peak RSS가 설정끼리 섞이지 않도록 새 프로세스에서 실행됩니다.
+    """
+    from lightfm.evaluation import auc_score, precision_at_k
+    from rc_graph import build_training_set, train_model, rank_known
+    from features import user_feature_vocabulary, item_feature_vocabulary
+
+    data = generate(config["users"], config["places"], config["reviews_per_user"], seed=config["seed"])
+    rss_before = _peak_rss_bytes()
+
+    started = time.perf_counter()
+    training_set = build_training_set(
+        data.user_features, data.place_features, data.interactions,
+        user_feature_vocabulary(), item_feature_vocabulary()
+    )
+    build_seconds = time.perf_counter() - started
+
+    model_version = train_model(
+        training_set, "bench", epochs=config["epochs"], no_components=config["no_components"],
+        num_threads=config["threads"], validation_fraction=0.0
+    )
+    fit_seconds = model_version.training_report["fit_seconds"]
+
+    # 학습에 없던 user/place가 들어간 test interaction은 제외
+    user_id_map, _, item_id_map, _ = training_set.dataset.mapping()
+    test_rows = [row for row in data.test_interactions if row[0] in user_id_map and row[1] in item_id_map]
+    test = training_set.dataset.build_interactions(test_rows)[0]
+    eval_args = dict(
+        train_interactions=training_set.interactions,
+        user_features=training_set.user_feature_matrix,
+        item_features=training_set.item_feature_matrix,
+        num_threads=config["threads"]
+    )
+    auc = float(auc_score(model_version.model, test, **eval_args).mean()) if test.nnz else None
+    precision = float(precision_at_k(model_version.model, test, k=config["k"], **eval_args).mean()) if test.nnz else None
+
+    # /get_recs/ai와 같은 요청: user 하나 x 후보 place candidates개
+    rs = np.random.RandomState(config["seed"])
+    latencies = []
+    for _ in range(config["requests"]):
+        user_id = int(rs.randint(1, config["users"] + 1))
+        place_ids = rs.randint(1, config["places"] + 1, size=config["candidates"]).tolist()
+        started = time.perf_counter()
+        rank_known(model_version, [user_id], [place_ids], config["k"])
+        latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies) * 1000
+
+    return {
+        "interactions": len(data.interactions),
+        "test_interactions": len(test_rows),
+        "precision_at_k": precision,
+        "auc": auc,
+        "build_seconds": build_seconds,
+        "fit_seconds": fit_seconds,
+        "predict_p50_ms": float(np.percentile(latencies, 50)),
+        "predict_p95_ms": float(np.percentile(latencies, 95)),
+        "predict_per_second": float(1000 / latencies.mean()),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "rss_growth_bytes": _peak_rss_bytes() - rss_before,
+    }
+
+def _parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def _parse_sizes(value: str) -> List[Tuple[int, int]]:
+    # "1000x500,10000x2000" -> [(user 수, place 수), ...]
+    return [tuple(int(part) for part in item.split("x")) for item in value.split(",") if item]
+
+CONFIG_KEYS = ("users", "places", "reviews_per_user", "no_components", "epochs", "threads", "k", "candidates")
+
+def _config_key(config: Dict[str, int]) -> Tuple[int, ...]:
+    return tuple(config[key] for key in CONFIG_KEYS)
+
+def compare(results: List[dict], baseline: List[dict]) -> None:
+    # 같은 설정의 baseline 결과 대비 비율 (현재 / baseline)
+    previous = {_config_key(item["config"]): item["metrics"] for item in baseline}
+    for item in results:
+        base = previous.get(_config_key(item["config"]))
+        if base is None:
+            continue
+        item["vs_baseline"] = {
+            name: value / base[name]
+            for name, value in item["metrics"].items()
+            if isinstance(value, (int, float)) and isinstance(base.get(name), (int, float)) and base[name]
+        }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LightFM 추천 모델 품질/비용 벤치마크 (합성 데이터)")
+    parser.add_argument("--sizes", default="1000x500,5000x2000", help="user 수 x place 수 목록")
+    parser.add_argument("--reviews-per-user", type=int, default=10)
+    parser.add_argument("--components", default="16,32", help="no_components 목록")
+    parser.add_argument("--epochs", default="10,30", help="epoch 목록")
+    parser.add_argument("--threads", default="1,4", help="학습 thread 수 목록")
+    parser.add_argument("--k", type=int, default=10, help="precision@k, 요청 top_k")
+    parser.add_argument("--candidates", type=int, default=50, help="예측 요청 하나의 후보 place 수")
+    parser.add_argument("--requests", type=int, default=200, help="예측 지연 측정 요청 수")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="결과 JSON 경로 (없으면 stdout)")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    args = parser.parse_args()
+
+    configs = [
+        {
+            "users": users, "places": places, "reviews_per_user": args.reviews_per_user,
+            "no_components": components, "epochs": epochs, "threads": threads,
+            "k": args.k, "candidates": args.candidates, "requests": args.requests, "seed": args.seed,
+        }
+        for (users, places), components, epochs, threads in itertools.product(
+            _parse_sizes(args.sizes), _parse_ints(args.components), _parse_ints(args.epochs), _parse_ints(args.threads)
+        )
+    ]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        with context.Pool(1) as pool:
+            metrics = pool.apply(run_config, (config,))
+        results.append({"config": config, "metrics": metrics})
+        print(json.dumps(results[-1], ensure_ascii=False), file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# bench_vdb.py
+# 해시태그 정규화(중복 판정) 벤치마크: vdb.embed_hashtags / find_similar_hashtag / tags_valid
+#
+#   python bench_vdb.py --sizes 1000,5000,10000 --backends chroma,numpy --output bench_vdb.json
+#   python bench_vdb.py --embed-backends torch,onnx --hnsw-m 16,32 --hnsw-ef 10,100
+#   python bench_vdb.py ... --baseline bench_vdb.json   (같은 설정의 이전 결과와 비교)
+#
+# 카페 해시태그 합성 코퍼스 (기본 해시태그 + 같은 뜻의 변형 / 반대 뜻 / 다른 대상)를 만들고,
+# 설정마다 별도 프로세스에서 임시 디렉토리의 벡터 저장소를 채워 측정한다.
+# 임베딩 모델은 로컬 캐시만 사용하고 네트워크에 접근하지 않는다. (HF_HUB_OFFLINE)
+
+import argparse
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SUBJECTS = [
+    "아메리카노", "카페라떼", "바닐라라떼", "콜드브루", "녹차라떼", "밀크티", "케이크", "치즈케이크", "마카롱", "크로플",
+    "스무디", "에이드", "디저트", "빵", "커피", "원두", "분위기", "인테리어", "좌석", "직원",
+    "사장님", "서비스", "주차", "뷰", "테라스", "화장실", "음악", "조명", "가격", "포장",
+]
+# (기본형, 같은 뜻 변형, 반대 뜻)
+PREDICATES = [
+    ("맛집", ["맛집이에요", "맛집 인정"], "별로"),
+    ("맛있음", ["맛있어요", "맛있다"], "맛없음"),
+    ("좋아요", ["좋음", "좋다"], "나빠요"),
+    ("최고", ["최고예요", "최고임"], "최악"),
+    ("깔끔함", ["깔끔해요", "깔끔하다"], "지저분함"),
+    ("친절함", ["친절해요", "친절하다"], "불친절함"),
+    ("넓음", ["넓어요", "넓다"], "좁음"),
+    ("예쁨", ["예뻐요", "예쁘다"], "안예쁨"),
+    ("저렴함", ["저렴해요", "싸요"], "비쌈"),
+    ("편리함", ["편리해요", "편해요"], "불편함"),
+    ("조용함", ["조용해요", "조용하다"], "시끄러움"),
+    ("추천", ["추천해요", "강추"], "비추"),
+]
+MODIFIERS = [
+    "", "분위기 좋은", "조용한", "넓은", "아늑한", "감성", "동네", "신상", "24시", "애견동반",
+    "대형", "루프탑", "한옥", "작업하기 좋은", "데이트하기 좋은", "공부하기 좋은", "빈티지", "모던한", "우드톤", "통창",
+    "주말", "평일", "아침", "심야", "역앞", "골목", "바다뷰", "숲속", "북카페", "브런치",
+]
+INTENSIFIERS = ["정말", "진짜", "완전"]
+# vdb.SIMILAR_DISTANCE와 같은 기본값 (vdb를 import하면 모델/저장소를 열기 때문에 부모 프로세스에서는 import하지 않음)
+SIMILAR_DISTANCE = 0.2
+
+@dataclasses.dataclass
+class Corpus:
+    phrases: List[str]                    # 저장소에 넣을 정규 해시태그 (앞쪽 bases개가 probe의 기준)
+    positives: List[Tuple[str, str]]      # (기준, 같은 뜻 변형)
+    negatives: List[Tuple[str, str]]      # (기준, 반대 뜻 / 다른 대상)
+    novel: List[str]                      # 저장소에 없는 신규 해시태그 (tags_valid 비용 측정)
+
+def generate(size: int, bases: int = 200, novel: int = 200, seed: int = 42) -> Corpus:
+    """
+    size개의 정규 해시태그와 라벨이 붙은 변형 쌍을 만듭니다.
+    정규 해시태그는 기본형 술어만 쓰므로 반대 뜻 해시태그는 저장소에 없습니다.
+    """
+    rs = np.random.RandomState(seed)
+    space = [
+        f"{modifier} {subject} {predicate}".strip()
+        for modifier, subject, (predicate, _, _) in itertools.product(MODIFIERS, SUBJECTS, PREDICATES)
+    ]
+    base_space = [f"{subject} {predicate}" for subject, (predicate, _, _) in itertools.product(SUBJECTS, PREDICATES)]
+    base_rows = rs.choice(len(base_space), min(bases, len(base_space)), replace=False)
+    base_phrases = [base_space[row] for row in base_rows]
+    chosen = set(base_phrases)
+    rest = [phrase for phrase in space if phrase not in chosen]
+    fill = [rest[row] for row in rs.permutation(len(rest))[:max(0, size - len(base_phrases))]]
+
+    paraphrases = {predicate: (variants, antonym) for predicate, variants, antonym in PREDICATES}
+    positives, negatives = [], []
+    for phrase in base_phrases:
+        subject, predicate = phrase.split(" ", 1)
+        variants, antonym = paraphrases[predicate]
+        positives.append((phrase, f"{subject} {variants[rs.randint(len(variants))]}"))
+        positives.append((phrase, f"{subject}{predicate}"))  # 띄어쓰기 없음
+        positives.append((phrase, f"{INTENSIFIERS[rs.randint(len(INTENSIFIERS))]} {phrase}"))
+        negatives.append((phrase, f"{subject} {antonym}"))
+        other = SUBJECTS[rs.randint(len(SUBJECTS))]
+        if other != subject:
+            negatives.append((phrase, f"{other} {predicate}"))
+
+    novel_phrases = [
+        f"{subject} {antonym} {INTENSIFIERS[rs.randint(len(INTENSIFIERS))]}"
+        for subject, (_, _, antonym) in itertools.product(SUBJECTS, PREDICATES)
+    ]
+    novel_phrases = [novel_phrases[row] for row in rs.permutation(len(novel_phrases))[:novel]]
+    return Corpus(base_phrases + fill, positives, negatives, novel_phrases)
+
+def _peak_rss_bytes() -> int:
+    # Linux는 KB, macOS는 byte 단위
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def _percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+def _precision_recall(predicted: np.ndarray, correct: np.ndarray, positives: int) -> Dict[str, Optional[float]]:
+    merged = int(predicted.sum())
+    hits = int((predicted & correct).sum())
+    return {
+        "precision": hits / merged if merged else None,
+        "recall": hits / positives if positives else None,
+    }
+
+def run_config(config: dict) -> dict:
+    """
+    설정 하나를 측정합니다. 설정(환경 변수)과 peak RSS가 섞이지 않도록 새 프로세스에서 실행됩니다.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench_vdb_")
+    # vdb import 전에 설정: 임시 저장소, 임베딩 backend, 네트워크 사용 안 함
+    os.environ["VDB_BACKEND"] = config["backend"]
+    os.environ["VDB_PATH"] = os.path.join(workdir, "chroma_default")
+    os.environ["VDB_NUMPY_PATH"] = os.path.join(workdir, "numpy_default")
+    os.environ["EMBED_BACKEND"] = config["embed_backend"]
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    os.environ.setdefault("OPENAI_API_KEY", "")
+
+    rss_before = _peak_rss_bytes()
+    import vdb
+    from vector_store import NumpyCollection, open_chroma_collection
+
+    store_path = os.path.join(workdir, "store")
+    if config["backend"] == "chroma":
+        vdb.db = open_chroma_collection(store_path, {
+            "hnsw:M": config["hnsw_m"], "hnsw:construction_ef": config["hnsw_ef"], "hnsw:search_ef": config["hnsw_ef"]
+        })
+    else:
+        vdb.db = NumpyCollection(store_path)
+    rss_model = _peak_rss_bytes()
+
+    corpus = generate(config["size"], seed=config["seed"])
+    threshold = config["threshold"]
+
+    # 1. encode 처리량
+    batch = config["encode_batch"]
+    started = time.perf_counter()
+    embeddings = np.concatenate([
+        np.asarray(vdb.embed_hashtags(corpus.phrases[start:start + batch]), dtype=np.float32)
+        for start in range(0, len(corpus.phrases), batch)
+    ])
+    encode_seconds = time.perf_counter() - started
+
+    # 2. 저장소 채우기 (batch add)
+    started = time.perf_counter()
+    for start in range(0, len(corpus.phrases), 1000):
+        end = min(start + 1000, len(corpus.phrases))
+        vdb.db.add(
+            ids=[str(row) for row in range(start, end)],
+            documents=corpus.phrases[start:end],
+            embeddings=embeddings[start:end].tolist(),
+            metadatas=[{"count": 1, "sentiment": 1}] * (end - start),
+        )
+    load_seconds = time.perf_counter() - started
+
+    # 3. 쌍 단위 distance (저장소와 무관한 임베딩/threshold 품질)
+    pairs = corpus.positives + corpus.negatives
+    left = np.asarray(vdb.embed_hashtags([a for a, _ in pairs]), dtype=np.float32)
+    right = np.asarray(vdb.embed_hashtags([b for _, b in pairs]), dtype=np.float32)
+    left /= np.maximum(np.linalg.norm(left, axis=1, keepdims=True), 1e-12)
+    right /= np.maximum(np.linalg.norm(right, axis=1, keepdims=True), 1e-12)
+    pair_distances = 1.0 - (left * right).sum(axis=1)
+    is_positive = np.arange(len(pairs)) < len(corpus.positives)
+    pair_metrics = {
+        f"{t:g}": _precision_recall(pair_distances < t, is_positive, len(corpus.positives))
+        for t in sorted(set(config["thresholds"]) | {threshold})
+    }
+
+    # 4. 저장소 대상 find_similar_hashtag (변형은 기준 해시태그를, 반대 뜻은 아무것도 찾지 않아야 함)
+    probes = [(variant, base) for base, variant in corpus.positives] + [(negative, None) for _, negative in corpus.negatives]
+    probe_embeddings = np.asarray(vdb.embed_hashtags([probe for probe, _ in probes]), dtype=np.float32)
+    latencies, merged, correct = [], [], []
+    for (_, expected), embedding in zip(probes, probe_embeddings):
+        started = time.perf_counter()
+        _, document, distance, _, _ = vdb.find_similar_hashtag(embedding.tolist())
+        latencies.append(time.perf_counter() - started)
+        is_merged = document is not None and distance[0] < threshold
+        merged.append(is_merged)
+        correct.append(is_merged and expected is not None and document[0] == expected)
+    probe_metrics = _precision_recall(np.array(merged), np.array(correct), len(corpus.positives))
+
+    # 5. tags_valid 한 번의 비용 (encode + query + add, 신규 해시태그)
+    valid_latencies = []
+    for phrase in corpus.novel:
+        started = time.perf_counter()
+        vdb.tags_valid([(phrase, -1)])
+        valid_latencies.append(time.perf_counter() - started)
+    vdb.tag_counter.shutdown()
+    vdb.embedding_service.shutdown()
+    store_bytes = _dir_bytes(store_path)
+    collection_size = vdb.db.count()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "collection_size": collection_size,
+        "encode_per_second": len(corpus.phrases) / encode_seconds,
+        "load_seconds": load_seconds,
+        "load_per_1000_ms": load_seconds / len(corpus.phrases) * 1000 * 1000,
+        "query": _percentiles(latencies),
+        "tags_valid": _percentiles(valid_latencies),
+        "pairs": {"positive": len(corpus.positives), "negative": len(corpus.negatives), "by_threshold": pair_metrics},
+        "probes": {**probe_metrics, "threshold": threshold},
+        "positive_distance_mean": float(pair_distances[is_positive].mean()),
+        "negative_distance_mean": float(pair_distances[~is_positive].mean()),
+        "store_bytes": store_bytes,
+        "model_rss_bytes": rss_model - rss_before,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+def _parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def _parse_strs(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+CONFIG_KEYS = ("backend", "embed_backend", "size", "hnsw_m", "hnsw_ef", "threshold")
+
+def _config_key(config: dict) -> tuple:
+    return tuple(config[key] for key in CONFIG_KEYS)
+
+def _flatten(metrics: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+def compare(results: List[dict], baseline: List[dict]) -> None:
+    # 같은 설정의 baseline 결과 대비 비율 (현재 / baseline)
+    previous = {_config_key(item["config"]): _flatten(item["metrics"]) for item in baseline}
+    for item in results:
+        base = previous.get(_config_key(item["config"]))
+        if base is None:
+            continue
+        item["vs_baseline"] = {
+            name: value / base[name]
+            for name, value in _flatten(item["metrics"]).items()
+            if base.get(name)
+        }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="해시태그 중복 판정 (vdb) 품질/지연 벤치마크 (합성 코퍼스, 오프라인)")
+    parser.add_argument("--sizes", default="1000,5000,10000", help="저장소 해시태그 수 목록")
+    parser.add_argument("--backends", default="chroma,numpy", help="벡터 저장소 backend 목록 (VDB_BACKEND)")
+    parser.add_argument("--embed-backends", default="torch", help="임베딩 backend 목록 (EMBED_BACKEND)")
+    parser.add_argument("--hnsw-m", default="16", help="chroma hnsw:M 목록")
+    parser.add_argument("--hnsw-ef", default="100", help="chroma hnsw:construction_ef / search_ef 목록")
+    parser.add_argument("--threshold", type=float, default=SIMILAR_DISTANCE, help="중복 판정 cosine distance")
+    parser.add_argument("--thresholds", default="0.1,0.15,0.2,0.25,0.3", help="쌍 단위 precision/recall을 같이 볼 threshold 목록")
+    parser.add_argument("--encode-batch", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="결과 JSON 경로 (없으면 stdout)")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    args = parser.parse_args()
+
+    configs = []
+    for backend, embed_backend, size in itertools.product(_parse_strs(args.backends), _parse_strs(args.embed_backends), _parse_ints(args.sizes)):
+        # HNSW 설정은 chroma에만 해당
+        hnsw = itertools.product(_parse_ints(args.hnsw_m), _parse_ints(args.hnsw_ef)) if backend == "chroma" else [(None, None)]
+        for hnsw_m, hnsw_ef in hnsw:
+            configs.append({
+                "backend": backend, "embed_backend": embed_backend, "size": size,
+                "hnsw_m": hnsw_m, "hnsw_ef": hnsw_ef, "threshold": args.threshold,
+                "thresholds": [float(item) for item in _parse_strs(args.thresholds)],
+                "encode_batch": args.encode_batch, "seed": args.seed,
+            })
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        with context.Pool(1) as pool:
+            metrics = pool.apply(run_config, (config,))
+        results.append({"config": config, "metrics": metrics})
+        print(json.dumps(results[-1], ensure_ascii=False), file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# cold_start.py
+
+import asyncio
+import datetime
+import logging
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from config import REC_COLD_START_REFRESH, REC_COLD_START_MIN_INTERACTIONS
+from db_connect import AsyncSessionLocal, get_user_info, get_all_user_info, get_place_visits, get_representative_tags, get_all_user_reviews
+from features import age_feature, age_vocabulary
+from rc_graph import ServingModel
+
+logger = logging.getLogger(__name__)
+
+# 순위에 더하는 전체 인기도 비중 (segment 정보가 없는 place끼리의 정렬용)
+GLOBAL_WEIGHT = 0.1
+
+def _normalize(scores: Dict[int, float]) -> Dict[int, float]:
+    top = max(scores.values(), default=0.0)
+    if top <= 0:
+        return {}
+    return {place_id: score / top for place_id, score in scores.items() if score > 0}
+
+def build_segment_scores(
+    visits: List[Tuple[int, int, float]],
+    representative_tags: List[Tuple[int, int]],
+    user_features: List[Tuple[int, str]],
+    reviews: List[Tuple[int, int, int]]
+) -> Tuple[Dict[int, float], Dict[str, Dict[int, float]]]:
+    """
+    segment(user feature 이름: age:20-24, menu#17, activity#3)별 place 점수를 계산합니다.
+
+    - 나이 구간: placeVisit의 방문 수와 평균 방문 나이가 가까운 place일수록 높은 점수
+    - 모든 segment: 그 segment user들이 리뷰한 place 수 + 그 user들이 많이 쓴 tag가 대표 tag인 place
+
+    :return: (전체 인기도, segment별 점수) 모두 최댓값 1로 정규화
+    """
+    ages = age_vocabulary()
+    age_index = {name: idx for idx, name in enumerate(ages)}
+
+    popularity: Dict[int, float] = defaultdict(float)
+    place_age: Dict[int, int] = {}
+    for place_id, visit, age in visits:
+        popularity[place_id] += math.log1p(max(visit or 0, 0))
+        if age:
+            place_age[place_id] = age_index[age_feature(age)]
+
+    segments: Dict[str, Dict[int, float]] = {}
+    for name, idx in age_index.items():
+        segments[name] = _normalize({
+            place_id: popularity[place_id] / (1 + abs(place_idx - idx))
+            for place_id, place_idx in place_age.items()
+        })
+
+    features_by_user = defaultdict(list)
+    for user_id, feature in user_features:
+        if feature is not None:
+            features_by_user[user_id].append(feature)
+
+    reviewed = defaultdict(lambda: defaultdict(float))
+    tag_usage = defaultdict(lambda: defaultdict(float))
+    for user_id, place_id, tag_id in reviews:
+        for feature in features_by_user.get(user_id, ()):
+            reviewed[feature][place_id] += 1
+            tag_usage[feature][tag_id] += 1
+
+    tags_by_place = defaultdict(list)
+    for place_id, tag_id in representative_tags:
+        tags_by_place[place_id].append(tag_id)
+
+    for feature in reviewed:
+        usage = tag_usage[feature]
+        total = sum(usage.values())
+        tag_scores = _normalize({
+            place_id: sum(usage.get(tag_id, 0.0) for tag_id in tag_ids) / total
+            for place_id, tag_ids in tags_by_place.items()
+        })
+        review_scores = _normalize(reviewed[feature])
+        combined = defaultdict(float, segments.get(feature, {}))
+        for scores in (review_scores, tag_scores):
+            for place_id, score in scores.items():
+                combined[place_id] += score
+        segments[feature] = _normalize(combined)
+
+    return _normalize(popularity), segments
+
+@dataclass(frozen=True)
+class SegmentRankings:
+    version: str
+    refreshed_at: datetime.datetime
+    popularity: Dict[int, float]
+    segments: Dict[str, Dict[int, float]]
+    user_segments: Dict[int, Tuple[str, ...]]
+    sparse_users: FrozenSet[int]        # 리뷰한 place가 REC_COLD_START_MIN_INTERACTIONS보다 적은 user
+    reviewed_users: FrozenSet[int]
+
+    def is_sparse(self, user_id: int) -> bool:
+        return user_id not in self.reviewed_users or user_id in self.sparse_users
+
+    def rank(self, segments: Tuple[str, ...], place_ids: List[int], top_k: Optional[int] = None) -> List[int]:
+        """
+        user segment 점수 합 (+ 전체 인기도)으로 place_ids를 정렬합니다. 점수가 같으면 요청 순서를 유지합니다.
+        """
+        tables = [self.segments[name] for name in segments if name in self.segments]
+
+        def score(place_id: int) -> float:
+            return GLOBAL_WEIGHT * self.popularity.get(place_id, 0.0) + sum(table.get(place_id, 0.0) for table in tables)
+
+        place_ids = list(dict.fromkeys(place_ids))
+        return sorted(place_ids, key=score, reverse=True)[:top_k]
+
+class ColdStartRankings:
+    """
+    모델이 모르거나 리뷰가 적은 user를 위한 segment별 place 점수를 백그라운드에서 미리 계산한다.
+    요청에서는 user의 segment 점수를 더해 정렬만 하므로 모델을 거치지 않는다.
+    """
+    def __init__(self, interval: float = REC_COLD_START_REFRESH, min_interactions: int = REC_COLD_START_MIN_INTERACTIONS):
+        self.interval = interval
+        self.min_interactions = min_interactions
+        self._current: Optional[SegmentRankings] = None
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[SegmentRankings]:
+        return self._current
+
+    def is_cold(self, user_id: int, model_version: Optional[ServingModel]) -> bool:
+        # 모델이 없거나 모델이 모르는 user, 또는 리뷰가 적은 user
+        if model_version is None or model_version.user_indices([user_id])[0] < 0:
+            return True
+        return self._current is not None and self._current.is_sparse(user_id)
+
+    async def refresh(self) -> SegmentRankings:
+        async with AsyncSessionLocal() as session:
+            visits = await get_place_visits(session)
+            representative_tags = await get_representative_tags(session)
+            user_features = await get_all_user_info(session)
+            reviews = await get_all_user_reviews(session)
+
+        popularity, segments = await asyncio.to_thread(build_segment_scores, visits, representative_tags, user_features, reviews)
+
+        user_segments = defaultdict(list)
+        for user_id, feature in user_features:
+            if feature is not None:
+                user_segments[user_id].append(feature)
+        reviewed_places = defaultdict(set)
+        for user_id, place_id, _ in reviews:
+            reviewed_places[user_id].add(place_id)
+
+        refreshed_at = datetime.datetime.now()
+        self._current = SegmentRankings(
+            version=f"cold-start-{refreshed_at.strftime('%Y%m%d%H%M%S')}",
+            refreshed_at=refreshed_at,
+            popularity=popularity,
+            segments=segments,
+            user_segments={user_id: tuple(features) for user_id, features in user_segments.items()},
+            sparse_users=frozenset(user_id for user_id, places in reviewed_places.items() if len(places) < self.min_interactions),
+            reviewed_users=frozenset(reviewed_places),
+        )
+        self.last_error = None
+        logger.info(f"[cold-start] refreshed {len(segments)} segments")
+        return self._current
+
+    async def rank(self, user_id: int, place_ids: List[int], top_k: Optional[int] = None) -> Tuple[Optional[str], List[int]]:
+        """
+        segment 순위로 place_ids를 정렬합니다. 아직 계산 전이면 요청 순서를 그대로 반환합니다.
+
+        :return: (segment 순위 버전, 정렬된 place id 리스트)
+        """
+        current = self._current
+        if current is None:
+            return None, place_ids[:top_k]
+        segments = current.user_segments.get(user_id)
+        if segments is None:
+            # 마지막 갱신 이후 가입한 user는 feature만 조회
+            async with AsyncSessionLocal() as session:
+                segments = tuple(feature for _, feature in await get_user_info(session, [user_id]) if feature is not None)
+        return current.version, current.rank(segments, place_ids, top_k)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[cold-start] refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            "version": current.version if current else None,
+            "segments": len(current.segments) if current else 0,
+            "sparse_users": len(current.sparse_users) if current else 0,
+            "last_error": self.last_error,
+        }
+
+cold_start_rankings = ColdStartRankings()
@@ -17,5 +17,85 @@ MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "airoot")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "ai_db")
 
 VDB_PATH = os.getenv("VDB_PATH", "../vectordb")
+VDB_BACKEND = os.getenv("VDB_BACKEND", "chroma")  # "chroma" 또는 "numpy" (메모리 행렬 정확 검색)
+VDB_NUMPY_PATH = os.getenv("VDB_NUMPY_PATH", "../vectordb_numpy")  # numpy backend 저장 위치
+VDB_NUMPY_COMPACT_LINES = int(os.getenv("VDB_NUMPY_COMPACT_LINES", 1000))  # numpy backend 변경 로그를 index.json으로 합치는 줄 수
 
-S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "pinpung-s3")
\ No newline at end of file
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "pinpung-s3")
+
+# 추천 모델 학습 설정
+REC_TRAIN_INTERVAL = int(os.getenv("REC_TRAIN_INTERVAL", 3600))  # 전체 재학습 주기 (초)
+REC_EPOCHS = int(os.getenv("REC_EPOCHS", 30))
+REC_NO_COMPONENTS = int(os.getenv("REC_NO_COMPONENTS", 30))
+REC_PARTIAL_INTERVAL = float(os.getenv("REC_PARTIAL_INTERVAL", 5))  # 신규 리뷰 반영 주기 (초)
+REC_PARTIAL_EPOCHS = int(os.getenv("REC_PARTIAL_EPOCHS", 5))
+REC_PARTIAL_MAX_UPDATES = int(os.getenv("REC_PARTIAL_MAX_UPDATES", 200))  # 이 횟수만큼 증분 학습하면 전체 재학습
+# 모델 스냅샷 (여러 worker가 mmap으로 공유). 설정하지 않으면 사용하지 않음
+REC_SNAPSHOT_DIR = os.getenv("REC_SNAPSHOT_DIR")
+REC_SNAPSHOT_POLL = float(os.getenv("REC_SNAPSHOT_POLL", 5))  # 새 스냅샷 확인 주기 (초)
+REC_SNAPSHOT_KEEP = int(os.getenv("REC_SNAPSHOT_KEEP", 3))  # 보관할 스냅샷 버전 수
+# 추천 연산 executor ("thread" 또는 "process")
+REC_EXECUTOR = os.getenv("REC_EXECUTOR", "thread")
+REC_EXECUTOR_WORKERS = int(os.getenv("REC_EXECUTOR_WORKERS", 0))  # 0이면 CPU 수
+REC_EXECUTOR_QUEUE = int(os.getenv("REC_EXECUTOR_QUEUE", 32))  # 실행 + 대기 중인 작업 최대 수
+REC_TASK_TIMEOUT = float(os.getenv("REC_TASK_TIMEOUT", 10))  # 추천 요청 작업 timeout (초)
+REC_TRAIN_TIMEOUT = float(os.getenv("REC_TRAIN_TIMEOUT", 1800))  # 학습 작업 timeout (초)
+# 전체 카탈로그 top-K 조회
+REC_ANN_MIN_ITEMS = int(os.getenv("REC_ANN_MIN_ITEMS", 50000))  # place 수가 이보다 많으면 hnswlib ANN 사용
+REC_ANN_M = int(os.getenv("REC_ANN_M", 16))
+REC_ANN_EF = int(os.getenv("REC_ANN_EF", 100))
+# 추천 feature 설정 (feature 차원을 고정)
+REC_AGE_BUCKET_WIDTH = int(os.getenv("REC_AGE_BUCKET_WIDTH", 5))  # 나이 구간 폭
+REC_AGE_MAX = int(os.getenv("REC_AGE_MAX", 80))  # 이 나이 이상은 한 구간
+REC_MENU_HASH_BUCKETS = int(os.getenv("REC_MENU_HASH_BUCKETS", 64))
+REC_ACTIVITY_HASH_BUCKETS = int(os.getenv("REC_ACTIVITY_HASH_BUCKETS", 64))
+REC_USER_HASH_BUCKETS = int(os.getenv("REC_USER_HASH_BUCKETS", 1024))  # /popular 모델의 tag feature (사용한 userId)
+# 학습 thread 수와 early stopping
+REC_TRAIN_THREADS = int(os.getenv("REC_TRAIN_THREADS", 0))  # 0이면 cgroup quota/affinity 기준 사용 가능한 CPU 수
+REC_VALIDATION_FRACTION = float(os.getenv("REC_VALIDATION_FRACTION", 0.1))  # 0이면 early stopping 없이 REC_EPOCHS 만큼 학습
+REC_EARLY_STOP_PATIENCE = int(os.getenv("REC_EARLY_STOP_PATIENCE", 3))
+# 추천 결과 캐시
+REC_CACHE_SIZE = int(os.getenv("REC_CACHE_SIZE", 10000))  # 최대 항목 수 (LRU)
+REC_CACHE_TTL = float(os.getenv("REC_CACHE_TTL", 300))  # 초
+# /get_recs/popular 사전 계산 순위
+REC_POPULAR_INTERVAL = float(os.getenv("REC_POPULAR_INTERVAL", 600))  # 갱신 주기 (초)
+REC_POPULAR_PATH = os.getenv("REC_POPULAR_PATH", "../popular_rankings.json")  # 마지막 결과 저장 위치 (재시작/갱신 실패 시 사용)
+# 위치 기반 후보 place 검색
+REC_GEO_REFRESH = float(os.getenv("REC_GEO_REFRESH", 60))  # Place 좌표 증분 갱신 주기 (초)
+REC_GEO_DEFAULT_RADIUS = float(os.getenv("REC_GEO_DEFAULT_RADIUS", 1000))  # 기본 반경 (m)
+REC_GEO_MAX_RADIUS = float(os.getenv("REC_GEO_MAX_RADIUS", 20000))  # 최대 반경 (m)
+REC_GEO_MAX_CANDIDATES = int(os.getenv("REC_GEO_MAX_CANDIDATES", 500))  # 반경 안에서 가까운 순으로 최대 후보 수
+# 신규/데이터가 적은 user용 segment 순위
+REC_COLD_START_REFRESH = float(os.getenv("REC_COLD_START_REFRESH", 3600))  # 갱신 주기 (초)
+REC_COLD_START_MIN_INTERACTIONS = int(os.getenv("REC_COLD_START_MIN_INTERACTIONS", 3))  # 리뷰한 place가 이보다 적으면 segment 순위 사용
+# 비슷한 place (placeTag TF-IDF 코사인 유사도 이웃 테이블)
+REC_SIMILAR_REFRESH = float(os.getenv("REC_SIMILAR_REFRESH", 300))  # 변경된 place 증분 반영 주기 (초)
+REC_SIMILAR_FULL_REBUILD = float(os.getenv("REC_SIMILAR_FULL_REBUILD", 86400))  # 전체 재계산 주기 (초, IDF 갱신)
+REC_SIMILAR_TOP_N = int(os.getenv("REC_SIMILAR_TOP_N", 50))  # place마다 저장할 이웃 수
+REC_SIMILAR_CHUNK = int(os.getenv("REC_SIMILAR_CHUNK", 1024))  # 유사도를 한 번에 계산할 place 행 수 (메모리 상한)
+REC_SIMILAR_REPRESENTATIVE_BOOST = float(os.getenv("REC_SIMILAR_REPRESENTATIVE_BOOST", 2.0))  # 대표 tag 가중치
+REC_SIMILAR_EMBEDDING_WEIGHT = float(os.getenv("REC_SIMILAR_EMBEDDING_WEIGHT", 0.3))  # LightFM item embedding 유사도 비중 (0이면 사용 안 함, 지역별 모델 모드에서는 place 지역 모델의 embedding)
+# 지역별 추천 모델 (/get_recs/ai). 설정하지 않으면 전체 place로 모델 하나만 학습
+REC_REGION_LEVEL = os.getenv("REC_REGION_LEVEL", "")  # "sido" (서울, 경기 ...) 또는 "sigungu" (서울 강남구 ...)
+REC_REGION_GRID = float(os.getenv("REC_REGION_GRID", 0.5))  # 주소가 없는 place는 좌표 격자(도)로 지역 결정
+REC_REGION_REFRESH = float(os.getenv("REC_REGION_REFRESH", 3600))  # place 지역 목록 갱신 주기 (초)
+REC_PARTITION_COUNT = int(os.getenv("REC_PARTITION_COUNT", 1))  # 지역을 나눠 맡는 노드(배포) 수
+REC_PARTITION_INDEX = int(os.getenv("REC_PARTITION_INDEX", 0))  # 이 노드가 맡는 번호 (crc32(지역) % COUNT == INDEX)
+# 해시태그 임베딩 micro-batching
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 64))  # 한 번에 encode할 최대 해시태그 수
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", 5))  # 첫 요청 이후 batch를 모으는 최대 대기 시간 (ms)
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "snunlp/KR-SBERT-V40K-klueNLI-augSTS")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # "torch" (SentenceTransformer) 또는 "onnx" (int8 양자화 ONNX Runtime)
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", "../onnx_embedder")  # ONNX 모델/토크나이저 위치 (python embedding.py export로 생성, 없으면 torch로 실행)
+EMBED_PARITY_TOLERANCE = float(os.getenv("EMBED_PARITY_TOLERANCE", 0.02))  # torch 대비 cosine distance 최대 허용 차이
+
+# 인기 해시태그 (hot_tags)
+REC_HOT_TAGS_PATH = os.getenv("REC_HOT_TAGS_PATH", "../hot_tags.json")  # count/시간 버킷 저장 위치
+REC_HOT_TAGS_SAVE_INTERVAL = float(os.getenv("REC_HOT_TAGS_SAVE_INTERVAL", 60))  # 저장 주기 (초)
+REC_HOT_TAGS_REBUILD = float(os.getenv("REC_HOT_TAGS_REBUILD", 3600))  # 벡터 디비 count로 다시 맞추는 주기 (초)
+REC_HOT_TAGS_BUCKET = int(os.getenv("REC_HOT_TAGS_BUCKET", 3600))  # 최근 window 조회용 시간 버킷 크기 (초)
+REC_HOT_TAGS_RETENTION = float(os.getenv("REC_HOT_TAGS_RETENTION", 7 * 86400))  # 시간 버킷 보관 기간 (초)
+
+# 해시태그 사용 횟수 write-behind 저장
+TAG_COUNT_FLUSH_INTERVAL = float(os.getenv("TAG_COUNT_FLUSH_INTERVAL", 5))  # 증가분 저장 주기 (초)
+TAG_COUNT_FLUSH_DELTA = int(os.getenv("TAG_COUNT_FLUSH_DELTA", 100))  # 모인 증가분이 이 값을 넘으면 주기 전에 저장
@@ -5,14 +5,18 @@ import datetime
 import pandas as pd
 import logging
 from collections import defaultdict
-from typing import List, Tuple, Union
+from typing import Dict, List, Tuple, Union
 from sqlalchemy import select, update, func
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from config import MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
-from schemas import Place, Tag, User, PlaceTag, PlaceVisit, UserPlaceTag, UserMenu, UserActivity
-from vdb import get_tag_sentiment, get_best_tags
+from schemas import Place, Tag, User, PlaceTag, PlaceVisit, UserPlaceTag, UserMenu, UserActivity, TagSentiment
+from vdb import get_tag_sentiment
+from hot_tags import hot_tags
+from features import age_feature, menu_feature, activity_feature, tag_user_feature
+from tag_sentiment import tag_sentiments
 
 # 개별 로거 생성
 logger = logging.getLogger('db_connect')
@@ -321,7 +325,7 @@ async def main():
 async def get_top_tags_vdb(
     session: AsyncSession
 ) -> List[Union[int, str]]:
-    stmt = select(Tag.id).where(Tag.tagName.in_(get_best_tags()))
+    stmt = select(Tag.id).where(Tag.tagName.in_(hot_tags.top()))
     result = await session.execute(stmt)
     top_tags = result.scalars().all()
 
@@ -363,7 +367,7 @@ async def get_tag_feature(
         PlaceTag.placeId.in_(place_ids),
         PlaceTag.isRepresentative == True
     )
-    stmt_besttag = select(Tag.id).where(Tag.tagName.in_(get_best_tags()))
+    stmt_besttag = select(Tag.id).where(Tag.tagName.in_(hot_tags.top()))
     
     usertag_result = await session.execute(stmt_usertag)
     placetag_result = await session.execute(stmt_placetag)
@@ -374,7 +378,7 @@ async def get_tag_feature(
     stmt_taguser = select(UserPlaceTag.tagId, UserPlaceTag.userId).where(UserPlaceTag.tagId.in_(combined_tags))
     taguser_result = await session.execute(stmt_taguser)
 
-    rows = taguser_result.fetchall()
+    rows = [(tag_id, tag_user_feature(user_id)) for tag_id, user_id in taguser_result.fetchall()]
     rows = sorted(rows, key=lambda x: x[0])
     # print("taguser result", rows)
 
@@ -441,6 +445,10 @@ async def get_user_info(
     # print("userage", userage)
     # print("usermenu", usermenu)
     # print("useractivity", useractivity)
+    # 나이는 구간, 메뉴/활동 이름은 해시 버킷으로 feature 차원을 고정 (features.py)
+    userage = [(user_id, age_feature(age)) for user_id, age in userage]
+    usermenu = [(user_id, menu_feature(menu_name)) for user_id, menu_name in usermenu]
+    useractivity = [(user_id, activity_feature(activity_name)) for user_id, activity_name in useractivity]
     userfeature = userage + usermenu + useractivity
 
     return userfeature
@@ -458,7 +466,7 @@ async def get_place_info(
 
     placereptag = placereptag_result.fetchall()
     placeavgage = placeavgage_result.fetchall()
-    placeavgage = [(place_id, round(age, 1)) for place_id, age in placeavgage]
+    placeavgage = [(place_id, age_feature(age)) for place_id, age in placeavgage]
 
     # print("placereptag", placereptag)
     # print("placeavgage", placeavgage)
@@ -472,47 +480,243 @@ async def get_userplace_interactions(
     user_ids: List[int],
     place_ids: List[int]
 ) -> List[Union[int, str]]:
-    stmt_tagsentiment = select(UserPlaceTag.tagId).where(
-        UserPlaceTag.userId.in_(user_ids),
-        UserPlaceTag.placeId.in_(place_ids)
-    ).distinct()
-    tagsentiment_result = await session.execute(stmt_tagsentiment)
-    tagsentiment = tagsentiment_result.scalars().all()
-    sentiment_map = get_tag_sentiment(tagsentiment)
-    # print("sentiment_map", sentiment_map)
-    
+    """
+    (userId, placeId, 태그 sentiment 가중치의 합) interaction을 만듭니다.
+    가중치는 tagSentiment 메모리 사본에서 배열로 한 번에 찾습니다. (임베딩/벡터 디비 조회 없음)
+    """
     stmt_interactions = select(UserPlaceTag.userId, UserPlaceTag.placeId, UserPlaceTag.tagId).where(
         UserPlaceTag.userId.in_(user_ids),
         UserPlaceTag.placeId.in_(place_ids)
     )
     interactions_result = await session.execute(stmt_interactions)
     interactions = interactions_result.fetchall()
-    # print("interactions", interactions)
-    
-    processed_interactions = []
-    for user_id, place_id, tag_id in interactions:
-        # print("interaction to map",user_id, place_id, tag_id, sentiment_map.get(tag_id))
-        processed_interactions.append([user_id, place_id, sentiment_map.get(tag_id, 0)])  # 기본값 0 설정
-    
-    sentiment_sum = defaultdict(float)
-    sentiment_count = defaultdict(int)
-    
-    for user_id, place_id, sentiment in processed_interactions:
-        key = (user_id, place_id)
-        sentiment_sum[key] += sentiment
-        sentiment_count[key] += 1
-    
-    averaged_interactions = [
-        (user_id, place_id, sentiment_sum[key])# round(sentiment_sum[key] / sentiment_count[key], 3))
-        for key, user_id, place_id in [
-            (key, key[0], key[1]) for key in sentiment_sum
-        ]
-    ]
-    
-    # print("averaged_interactions", averaged_interactions)
-    
-    
-    return averaged_interactions
+    if not interactions:
+        return []
+
+    frame = pd.DataFrame(interactions, columns=["userId", "placeId", "tagId"])
+    await load_tag_sentiments(session, tag_sentiments.missing(frame["tagId"].unique()))
+    frame["score"] = tag_sentiments.weights(frame["tagId"].to_numpy())
+    summed = frame.groupby(["userId", "placeId"], sort=False)["score"].sum()
+
+    return [(int(user_id), int(place_id), float(score)) for (user_id, place_id), score in summed.items()]
+
+async def load_tag_sentiments(
+    session: AsyncSession,
+    tag_ids: List[int] = None
+) -> Dict[int, int]:
+    """
+    tagSentiment 테이블을 메모리 사본 (tag_sentiment.tag_sentiments)에 읽어 옵니다.
+
+    :param tag_ids: 지정하면 이 태그만 읽습니다. (다른 worker가 기록한 태그)
+    :return: 읽어 온 tagId -> sentiment.
+    """
+    stmt = select(TagSentiment.tagId, TagSentiment.sentiment)
+    if tag_ids is not None:
+        if not tag_ids:
+            return {}
+        stmt = stmt.where(TagSentiment.tagId.in_(tag_ids))
+    result = await session.execute(stmt)
+    rows = result.fetchall()
+    tag_sentiments.update(rows)
+    return {tag_id: sentiment for tag_id, sentiment in rows}
+
+async def add_tag_sentiments(
+    session: AsyncSession,
+    rows: List[Tuple[int, int]]
+) -> Dict[int, int]:
+    """
+    태그 sentiment를 기록합니다. 이미 기록된 태그는 처음 값을 유지합니다. (벡터 디비의 정규화 태그와 같음)
+
+    :param rows: (tagId, sentiment) 리스트. sentiment는 1/0/-1.
+    :return: 테이블에 저장된 (처음 기록된) tagId -> sentiment.
+    """
+    first = {}
+    for tag_id, sentiment in rows:
+        first.setdefault(tag_id, sentiment)
+    rows = list(first.items())
+    if not rows:
+        return {}
+    stmt = insert(TagSentiment).values([{"tagId": tag_id, "sentiment": sentiment} for tag_id, sentiment in rows]).prefix_with("IGNORE")
+    await session.execute(stmt)
+    await session.commit()
+    return await load_tag_sentiments(session, [tag_id for tag_id, _ in rows])
+
+async def backfill_tag_sentiments(
+    session: AsyncSession
+) -> int:
+    """
+    tagSentiment에 없는 (테이블이 생기기 전에 리뷰된) 태그의 sentiment를 벡터 디비에서 찾아 채웁니다.
+
+    :return: 채운 태그 수.
+    """
+    stmt = select(Tag.id, Tag.tagName).where(
+        Tag.id.in_(select(UserPlaceTag.tagId).distinct()),
+        Tag.id.not_in(select(TagSentiment.tagId))
+    )
+    result = await session.execute(stmt)
+    tags = result.fetchall()
+    if not tags:
+        return 0
+    found = await asyncio.to_thread(get_tag_sentiment, [tag_name for _, tag_name in tags])
+    rows = [(tag_id, found[tag_name]) for tag_id, tag_name in tags if tag_name in found]
+    await add_tag_sentiments(session, rows)
+    return len(rows)
+
+async def prepare_tag_sentiments() -> None:
+    # 서버 시작 시: 기존 태그 채우기, 전체를 메모리로 읽기 (테이블은 migrations/001_tag_sentiment.sql로 생성)
+    async with AsyncSessionLocal() as session:
+        filled = await backfill_tag_sentiments(session)
+        await load_tag_sentiments(session)
+    logger.info(f"tag sentiments loaded: {tag_sentiments.metrics()}, backfilled {filled}")
+
+async def make_full_frame(
+    session: AsyncSession
+) -> Tuple[List[int], List[int]]:
+    """
+    모델 전체 학습에 사용할 user/place 목록을 가져옵니다.
+    make_frame과 달리 요청 place_ids에 한정하지 않고 userPlaceTag, placeTag 전체를 사용합니다.
+
+    :param session: 활성화된 AsyncSession.
+    :return: (user_id 리스트, place_id 리스트)
+    """
+    res_userframe = await session.execute(select(UserPlaceTag.userId).distinct())
+    user_list = res_userframe.scalars().all()
+
+    res_placeframe = await session.execute(select(UserPlaceTag.placeId).distinct())
+    res_placetagframe = await session.execute(select(PlaceTag.placeId).distinct())
+    place_list = list(set(res_placeframe.scalars().all()) | set(res_placetagframe.scalars().all()))
+
+    return list(user_list), place_list
+
+async def make_region_frame(
+    session: AsyncSession,
+    region_place_ids: List[int]
+) -> Tuple[List[int], List[int]]:
+    """
+    지역 하나의 모델 학습에 사용할 user/place 목록을 가져옵니다.
+    make_full_frame과 같지만 place를 region_place_ids로 한정하고, 그 place를 리뷰한 user만 사용합니다.
+
+    :param region_place_ids: 지역에 속한 place id 리스트.
+    :return: (user_id 리스트, place_id 리스트)
+    """
+    res_userframe = await session.execute(select(UserPlaceTag.userId).where(UserPlaceTag.placeId.in_(region_place_ids)).distinct())
+    user_list = res_userframe.scalars().all()
+
+    res_placeframe = await session.execute(select(UserPlaceTag.placeId).where(UserPlaceTag.placeId.in_(region_place_ids)).distinct())
+    res_placetagframe = await session.execute(select(PlaceTag.placeId).where(PlaceTag.placeId.in_(region_place_ids)).distinct())
+    place_list = list(set(res_placeframe.scalars().all()) | set(res_placetagframe.scalars().all()))
+
+    return list(user_list), place_list
+
+async def get_all_tag_features(
+    session: AsyncSession
+) -> List[Union[int, str]]:
+    """
+    /popular 모델용 tag feature (tagId, userId)를 전체 userPlaceTag에서 가져옵니다.
+    """
+    result = await session.execute(select(UserPlaceTag.tagId, UserPlaceTag.userId).distinct())
+    rows = [(tag_id, tag_user_feature(user_id)) for tag_id, user_id in result.fetchall()]
+    return sorted(rows, key=lambda x: x[0])
+
+async def get_tag_users(
+    session: AsyncSession,
+    tag_ids: List[int]
+) -> List[Union[int, str]]:
+    """
+    주어진 태그들의 tag feature (tagId, userId)를 가져옵니다.
+    """
+    stmt = select(UserPlaceTag.tagId, UserPlaceTag.userId).where(UserPlaceTag.tagId.in_(tag_ids)).distinct()
+    result = await session.execute(stmt)
+    rows = [(tag_id, tag_user_feature(user_id)) for tag_id, user_id in result.fetchall()]
+    return sorted(rows, key=lambda x: x[0])
+
+async def get_all_tagplace_interactions(
+    session: AsyncSession
+) -> List[Union[int, str]]:
+    """
+    /popular 모델용 (tagId, placeId, 사용 횟수) interaction을 전체 userPlaceTag에서 집계합니다.
+    """
+    stmt = select(
+        UserPlaceTag.tagId,
+        UserPlaceTag.placeId,
+        func.count(UserPlaceTag.id)
+    ).group_by(UserPlaceTag.tagId, UserPlaceTag.placeId)
+    result = await session.execute(stmt)
+    return [[tag_id, place_id, count] for tag_id, place_id, count in result.fetchall()]
+
+async def get_place_coordinates(
+    session: AsyncSession,
+    updated_after: datetime.datetime = None
+) -> List[Tuple[int, str, str, datetime.datetime]]:
+    """
+    place 좌표 (id, x, y, updatedAt)를 가져옵니다.
+
+    :param updated_after: 지정하면 이 시각 이후 수정된 place만 가져옵니다. (증분 갱신)
+    """
+    stmt = select(Place.id, Place.x, Place.y, Place.updatedAt)
+    if updated_after is not None:
+        stmt = stmt.where(Place.updatedAt >= updated_after)
+    result = await session.execute(stmt)
+    return result.fetchall()
+
+async def count_places(
+    session: AsyncSession
+) -> int:
+    result = await session.execute(select(func.count(Place.id)))
+    return result.scalar_one()
+
+async def get_all_user_info(
+    session: AsyncSession
+) -> List[Union[int, str]]:
+    """
+    전체 user의 (userId, feature)를 가져옵니다. feature 규칙은 get_user_info와 같습니다.
+    """
+    userage_result = await session.execute(select(User.id, User.age))
+    usermenu_result = await session.execute(select(UserMenu.userId, UserMenu.menuName))
+    useractivity_result = await session.execute(select(UserActivity.userId, UserActivity.activityName))
+
+    userage = [(user_id, age_feature(age)) for user_id, age in userage_result.fetchall()]
+    usermenu = [(user_id, menu_feature(menu_name)) for user_id, menu_name in usermenu_result.fetchall()]
+    useractivity = [(user_id, activity_feature(activity_name)) for user_id, activity_name in useractivity_result.fetchall()]
+
+    return userage + usermenu + useractivity
+
+async def get_place_visits(
+    session: AsyncSession
+) -> List[Tuple[int, int, float]]:
+    # (placeId, 방문 수, 평균 방문 나이)
+    result = await session.execute(select(PlaceVisit.placeId, PlaceVisit.visit, PlaceVisit.age))
+    return result.fetchall()
+
+async def get_representative_tags(
+    session: AsyncSession
+) -> List[Tuple[int, int]]:
+    # (placeId, 대표 tagId)
+    stmt = select(PlaceTag.placeId, PlaceTag.tagId).where(PlaceTag.isRepresentative == True)
+    result = await session.execute(stmt)
+    return result.fetchall()
+
+async def get_all_user_reviews(
+    session: AsyncSession
+) -> List[Tuple[int, int, int]]:
+    # (userId, placeId, tagId)
+    result = await session.execute(select(UserPlaceTag.userId, UserPlaceTag.placeId, UserPlaceTag.tagId))
+    return result.fetchall()
+
+async def get_place_tag_profiles(
+    session: AsyncSession
+) -> List[Tuple[int, int, int, bool]]:
+    # (placeId, tagId, tagCount, isRepresentative)
+    stmt = select(PlaceTag.placeId, PlaceTag.tagId, PlaceTag.tagCount, PlaceTag.isRepresentative)
+    result = await session.execute(stmt)
+    return result.fetchall()
+
+async def get_place_locations(
+    session: AsyncSession
+) -> List[Tuple[int, str, str, str]]:
+    # (id, address, x, y)
+    result = await session.execute(select(Place.id, Place.address, Place.x, Place.y))
+    return result.fetchall()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
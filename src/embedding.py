@@ -0,0 +1,342 @@
+# embedding.py
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from config import EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS, EMBED_MODEL_NAME, EMBED_BACKEND, EMBED_ONNX_DIR, EMBED_PARITY_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+ONNX_FILE = "model_quantized.onnx"
+POOLING_FILE = "pooling.json"
+
+def load_torch_model(model_name: str = EMBED_MODEL_NAME):
+    # torch/sentence_transformers는 이 backend를 쓸 때만 import
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name_or_path=model_name, device='cpu')
+
+def export_onnx(model_name: str = EMBED_MODEL_NAME, out_dir: str = EMBED_ONNX_DIR) -> str:
+    """
+    SentenceTransformer의 transformer 부분을 ONNX로 export하고 int8 dynamic quantization을 적용합니다.
+    토크나이저와 pooling 설정도 같이 저장해서 실행 시에는 torch 없이 onnxruntime만 사용합니다.
+
+    :return: 양자화된 ONNX 모델 경로
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = load_torch_model(model_name)
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+
+    sample = tokenizer(["아메리카노 맛집", "조용한 분위기"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+    quantized_path = os.path.join(out_dir, ONNX_FILE)
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.save_pretrained(out_dir)
+    pooling = model[1]
+    with open(os.path.join(out_dir, POOLING_FILE), "w") as f:
+        json.dump({
+            "mode": pooling.get_pooling_mode_str(),
+            "max_seq_length": model.max_seq_length,
+            "model_name": model_name,
+        }, f)
+    logger.info(f"exported quantized ONNX embedder to {quantized_path}")
+    return quantized_path
+
+class OnnxEmbedder:
+    """
+    export_onnx로 만든 int8 양자화 모델을 ONNX Runtime (CPU)으로 실행한다.
+    SentenceTransformer.encode와 같은 pooling을 적용해 같은 공간의 embedding을 반환한다.
+    """
+    def __init__(self, model_dir: str = EMBED_ONNX_DIR):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, POOLING_FILE)) as f:
+            config = json.load(f)
+        self.pooling = config["mode"]
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, ONNX_FILE), options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+        mask = tokens["attention_mask"][:, :, None].astype(np.float32)
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        if self.pooling == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+def load_embedder(backend: str = EMBED_BACKEND, fallback: bool = True) -> Callable[[List[str]], np.ndarray]:
+    """
+    설정한 backend의 encode 함수를 반환합니다.
+    onnx 모델은 배포 단계에서 미리 만들어 둔다 (python embedding.py export). 없으면 fallback이면 torch로 대신 실행합니다.
+    """
+    started = time.perf_counter()
+    if backend == "onnx" and not os.path.exists(os.path.join(EMBED_ONNX_DIR, ONNX_FILE)):
+        if not fallback:
+            raise FileNotFoundError(f"{os.path.join(EMBED_ONNX_DIR, ONNX_FILE)} not found (run: python embedding.py export)")
+        logger.warning(f"ONNX embedder not found in {EMBED_ONNX_DIR}, falling back to torch (run: python embedding.py export)")
+        backend = "torch"
+    if backend == "onnx":
+        encode = OnnxEmbedder().encode
+    elif backend == "torch":
+        encode = load_torch_model().encode
+    else:
+        raise ValueError(f"unknown EMBED_BACKEND: {backend}")
+    logger.info(f"loaded {backend} embedder in {time.perf_counter() - started:.1f}s")
+    return encode
+
+def _cosine_distances(embeddings: np.ndarray) -> np.ndarray:
+    normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return 1.0 - normalized @ normalized.T
+
+PARITY_TEXTS = [
+    "아메리카노 맛집", "아이스아메리카노 맛집", "커피 맛집", "케이크 맛집", "디저트 맛집",
+    "조용한 분위기", "공부하기 좋은", "작업하기 좋은 카페", "깔끔한 인테리어", "인테리어 예쁨",
+    "직원 친절", "직원이 불친절", "가격이 비쌈", "가성비 좋음", "주차 편리", "주차 불편",
+    "녹차 좋아", "라떼 맛있음", "넓은 좌석", "좌석이 좁음",
+]
+
+def _rss_bytes() -> int:
+    # 현재 RSS (Linux /proc)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _percentile_ms(seconds: List[float], q: float) -> float:
+    return float(np.percentile(np.asarray(seconds) * 1000, q))
+
+def measure_backend(backend: str, texts: Sequence[str] = PARITY_TEXTS, repeats: int = 20) -> dict:
+    """
+    backend 하나를 읽고 embedding과 비용 지표를 반환합니다. (parity_check가 backend마다 새 프로세스에서 실행)
+
+    :return: embeddings, load_seconds, rss_bytes (읽기 전 대비 늘어난 RSS), max_rss_bytes,
+             해시태그 1개 / 전체 batch encode 지연 p50·p95 (ms).
+    """
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    encode = load_embedder(backend, fallback=False)
+    load_seconds = time.perf_counter() - started
+    embeddings = np.asarray(encode(list(texts)), dtype=np.float32)  # warm-up
+
+    single, batch = [], []
+    for idx in range(repeats):
+        started = time.perf_counter()
+        encode([texts[idx % len(texts)]])
+        single.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        encode(list(texts))
+        batch.append(time.perf_counter() - started)
+    return {
+        "embeddings": embeddings,
+        "load_seconds": load_seconds,
+        "rss_bytes": _rss_bytes() - rss_before,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "single_ms_p50": _percentile_ms(single, 50),
+        "single_ms_p95": _percentile_ms(single, 95),
+        "batch_size": len(texts),
+        "batch_ms_p50": _percentile_ms(batch, 50),
+        "batch_ms_p95": _percentile_ms(batch, 95),
+    }
+
+def parity_check(texts: Sequence[str] = PARITY_TEXTS, tolerance: float = EMBED_PARITY_TOLERANCE, threshold: float = 0.2) -> dict:
+    """
+    torch와 onnx backend의 해시태그 간 cosine distance를 비교합니다.
+    vdb의 중복 판정(distance < 0.2)이 distance에 의존하므로 최대 차이와 판정이 바뀌는 쌍 수를 같이 봅니다.
+    load 시간, RSS, encode 지연도 backend마다 따로 재도록 각각 새 프로세스에서 읽습니다.
+    """
+    measured = {}
+    for backend in ("torch", "onnx"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            measured[backend] = pool.submit(measure_backend, backend, list(texts)).result()
+    reference = _cosine_distances(measured["torch"].pop("embeddings"))
+    candidate = _cosine_distances(measured["onnx"].pop("embeddings"))
+    upper = np.triu_indices(len(texts), k=1)
+    diff = np.abs(reference - candidate)[upper]
+    flips = int(((reference[upper] < threshold) != (candidate[upper] < threshold)).sum())
+    return {
+        "pairs": int(len(diff)),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "threshold_flips": flips,
+        "tolerance": tolerance,
+        "ok": bool(diff.max() <= tolerance),
+        "torch": measured["torch"],
+        "onnx": measured["onnx"],
+    }
+
+class EmbeddingBatcher:
+    """
+    해시태그 encode 요청을 전용 worker thread 하나에서 micro-batch로 모아 처리한다.
+
+    첫 요청이 들어오면 max_wait 동안 (또는 max_batch개가 찰 때까지) 다른 요청을 더 모아
+    encode를 한 번만 호출하고, 결과를 요청별로 나눠 각자의 Future에 넣는다.
+    event loop에서는 encode()를 await하고, thread에서는 encode_sync()를 호출한다.
+    encode 대신 loader를 주면 첫 batch에서 worker thread가 모델을 읽는다. (import만 해서는 모델을 읽지 않음)
+    """
+    def __init__(
+        self,
+        encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+        max_batch: int = EMBED_MAX_BATCH,
+        max_wait: float = EMBED_MAX_WAIT_MS / 1000,
+        loader: Optional[Callable[[], Callable[[List[str]], np.ndarray]]] = None
+    ):
+        if encode is None and loader is None:
+            raise ValueError("encode or loader is required")
+        self._encode = encode
+        self._loader = loader
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._texts = 0
+        self._max_batch_seen = 0
+        self._last_batch = 0
+        self._encode_seconds = 0.0
+        self._failed = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        future: Future = Future()
+        if not texts:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+        self._ensure_started()
+        self._queue.put((list(texts), future))
+        return future
+
+    async def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def encode_sync(self, texts: Sequence[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _collect(self, first) -> list:
+        # 첫 요청 이후 max_wait 안에 들어온 요청을 max_batch개 (해시태그 수 기준)까지 모은다.
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _worker(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                if self._encode is None:
+                    # 읽기에 실패하면 이 batch만 실패시키고 다음 batch에서 다시 읽는다
+                    self._encode = self._loader()
+                started = time.perf_counter()
+                embeddings = np.asarray(self._encode(texts))
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"embedding batch of {len(texts)} failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._encode_seconds += time.perf_counter() - started
+            self._requests += len(batch)
+            self._batches += 1
+            self._texts += len(texts)
+            self._last_batch = len(texts)
+            self._max_batch_seen = max(self._max_batch_seen, len(texts))
+
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def metrics(self) -> dict:
+        return {
+            "loaded": self._encode is not None,
+            "queue_depth": self._queue.qsize(),
+            "requests": self._requests,
+            "batches": self._batches,
+            "texts": self._texts,
+            "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+            "last_batch_size": self._last_batch,
+            "max_batch_size": self._max_batch_seen,
+            "encode_seconds": self._encode_seconds,
+            "failed_batches": self._failed,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+embedding_service = EmbeddingBatcher(loader=load_embedder)
+
+if __name__ == "__main__":
+    # python embedding.py export   : 양자화 ONNX 모델 생성
+    # python embedding.py parity   : torch 대비 cosine distance 비교와 backend별 load 시간/RSS/encode 지연 (허용 범위를 넘으면 exit 1)
+    parser = argparse.ArgumentParser(description="해시태그 임베딩 ONNX export / parity check")
+    parser.add_argument("command", choices=["export", "parity"])
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx()
+    else:
+        report = parity_check()
+        print(json.dumps(report, ensure_ascii=False))
+        sys.exit(0 if report["ok"] else 1)
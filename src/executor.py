@@ -0,0 +1,165 @@
+# executor.py
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from config import REC_EXECUTOR, REC_EXECUTOR_WORKERS, REC_EXECUTOR_QUEUE, REC_TASK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+def usable_cpu_count() -> int:
+    """
+    이 프로세스가 실제로 쓸 수 있는 CPU 수.
+    os.cpu_count()는 호스트 전체 코어 수라서, 컨테이너의 CPU affinity와
+    cgroup CPU quota (v2: cpu.max, v1: cpu.cfs_quota_us / cpu.cfs_period_us) 중 작은 값을 쓴다.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            max_quota, period = f.read().split()
+            if max_quota != "max":
+                quota = int(max_quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                max_quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if max_quota > 0 and period > 0:
+                quota = max_quota / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        count = min(count, math.ceil(quota))
+    return max(count, 1)
+
+class ComputeQueueFull(Exception):
+    pass
+
+class ComputeTimeout(Exception):
+    pass
+
+class ComputeExecutor:
+    """
+    LightFM 학습/추론처럼 CPU를 오래 쓰는 작업을 event loop 밖에서 실행한다.
+
+    - kind="process": spawn 방식 process pool. 인자와 결과는 pickle되므로 작은 payload만 넘긴다.
+    - kind="thread": thread pool. LightFM fit/predict와 numpy 행렬 연산은 GIL을 놓기 때문에 병렬로 돈다.
+
+    실행 중 + 대기 중인 작업 수가 max_queue를 넘으면 ComputeQueueFull을 던지고,
+    timeout을 넘기면 ComputeTimeout을 던진다. 이미 시작된 작업 자체는 끝까지 실행되므로
+    자리는 timeout이 아니라 작업이 실제로 끝날 때 반납한다.
+    """
+    def __init__(self, kind: str, max_workers: int, max_queue: int, timeout: float):
+        self.kind = kind
+        self.max_workers = max_workers or usable_cpu_count()
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool: Optional[Executor] = None
+        # 공유 메모리의 객체를 다뤄야 하는 작업용 (kind="thread"면 _pool과 같음)
+        self._local_pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _get_pool(self, local: bool) -> Executor:
+        if self._local_pool is None:
+            self._local_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rec-compute")
+        if local or self.kind != "process":
+            return self._local_pool
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _release(self, _future) -> None:
+        # pool thread에서 호출될 수 있음
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    async def _submit(self, local: bool, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        with self._in_flight_lock:
+            if self._in_flight >= self.max_queue:
+                self._rejected += 1
+                raise ComputeQueueFull(f"compute queue is full ({self.max_queue})")
+            self._in_flight += 1
+
+        self._submitted += 1
+        started = time.perf_counter()
+        try:
+            concurrent_future = self._get_pool(local).submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # timeout 후에도 작업이 끝날 때까지 자리를 차지한다 (아직 시작 전이면 취소되면서 반납)
+        concurrent_future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(concurrent_future), timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise ComputeTimeout(f"{getattr(fn, '__name__', fn)} timed out")
+        except Exception:
+            self._failed += 1
+            raise
+
+        elapsed = time.perf_counter() - started
+        self._completed += 1
+        self._total_seconds += elapsed
+        self._max_seconds = max(self._max_seconds, elapsed)
+        return result
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        설정된 pool(process 또는 thread)에서 fn(*args)를 실행합니다.
+        process pool에서는 fn이 import 부작용이 없는 모듈 (rec_tasks.py)의 최상위 함수여야 합니다.
+        """
+        return await self._submit(False, fn, *args, timeout=timeout)
+
+    async def run_local(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        같은 프로세스의 thread pool에서 fn(*args)를 실행합니다.
+        메모리에 있는 모델처럼 pickle하기 비싼 객체를 다룰 때 사용합니다.
+        """
+        return await self._submit(True, fn, *args, timeout=timeout)
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "timeouts": self._timeouts,
+            "avg_seconds": self._total_seconds / self._completed if self._completed else 0.0,
+            "max_seconds": self._max_seconds,
+        }
+
+    def shutdown(self) -> None:
+        for pool in (self._pool, self._local_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._local_pool = None
+
+compute_executor = ComputeExecutor(REC_EXECUTOR, REC_EXECUTOR_WORKERS, REC_EXECUTOR_QUEUE, REC_TASK_TIMEOUT)
@@ -0,0 +1,58 @@
+# features.py
+
+import zlib
+from typing import List, Optional, Union
+
+from config import REC_AGE_BUCKET_WIDTH, REC_AGE_MAX, REC_MENU_HASH_BUCKETS, REC_ACTIVITY_HASH_BUCKETS, REC_USER_HASH_BUCKETS
+
+# LightFM feature 이름 규칙
+#   age:20-24      나이 구간 (user 나이, place 평균 방문 나이)
+#   menu#17        메뉴 이름 해시 버킷
+#   activity#3     활동 이름 해시 버킷
+#   user#512       /popular 모델에서 태그를 사용한 userId 해시 버킷
+# 값의 종류가 늘어나도 feature 수는 아래 vocabulary 크기로 고정된다.
+
+def age_feature(age: Optional[Union[int, float]]) -> Optional[str]:
+    if age is None:
+        return None
+    low = min(max(int(age), 0) // REC_AGE_BUCKET_WIDTH * REC_AGE_BUCKET_WIDTH, REC_AGE_MAX)
+    if low >= REC_AGE_MAX:
+        return f"age:{REC_AGE_MAX}+"
+    # REC_AGE_MAX가 폭의 배수가 아니면 마지막 구간은 REC_AGE_MAX - 1에서 끝난다
+    return f"age:{low}-{min(low + REC_AGE_BUCKET_WIDTH, REC_AGE_MAX) - 1}"
+
+def hashed_feature(namespace: str, value: Union[int, str], buckets: int) -> Optional[str]:
+    # 프로세스마다 달라지는 hash() 대신 crc32를 써서 worker/재시작 간에 같은 버킷이 나오게 한다.
+    if value is None:
+        return None
+    bucket = zlib.crc32(f"{namespace}:{value}".encode("utf-8")) % buckets
+    return f"{namespace}#{bucket}"
+
+def menu_feature(menu_name: Optional[str]) -> Optional[str]:
+    return hashed_feature("menu", menu_name, REC_MENU_HASH_BUCKETS)
+
+def activity_feature(activity_name: Optional[str]) -> Optional[str]:
+    return hashed_feature("activity", activity_name, REC_ACTIVITY_HASH_BUCKETS)
+
+def tag_user_feature(user_id: Optional[int]) -> Optional[str]:
+    return hashed_feature("user", user_id, REC_USER_HASH_BUCKETS)
+
+def age_vocabulary() -> List[str]:
+    # age_feature가 만들 수 있는 값 전체 (REC_AGE_MAX가 폭의 배수가 아니어도 마지막 구간 포함)
+    return [age_feature(age) for age in range(0, REC_AGE_MAX, REC_AGE_BUCKET_WIDTH)] + [f"age:{REC_AGE_MAX}+"]
+
+def user_feature_vocabulary() -> List[str]:
+    """
+    user feature 전체 목록. 데이터에 없는 버킷도 미리 넣어서 행렬 폭을 고정한다.
+    """
+    return (
+        age_vocabulary()
+        + [f"menu#{bucket}" for bucket in range(REC_MENU_HASH_BUCKETS)]
+        + [f"activity#{bucket}" for bucket in range(REC_ACTIVITY_HASH_BUCKETS)]
+    )
+
+def item_feature_vocabulary() -> List[str]:
+    return age_vocabulary()
+
+def tag_feature_vocabulary() -> List[str]:
+    return [f"user#{bucket}" for bucket in range(REC_USER_HASH_BUCKETS)]
@@ -0,0 +1,158 @@
+# geo.py
+
+import asyncio
+import datetime
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from config import REC_GEO_REFRESH, REC_GEO_MAX_CANDIDATES
+from db_connect import AsyncSessionLocal, get_place_coordinates, count_places
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8  # m
+
+def parse_coordinate(x: Optional[str], y: Optional[str]) -> Optional[Tuple[float, float]]:
+    # Place.x는 경도, Place.y는 위도 (문자열). 비어 있거나 범위를 벗어나면 None
+    try:
+        lon, lat = float(x), float(y)
+    except (TypeError, ValueError):
+        return None
+    if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+        return None
+    return lat, lon
+
+def unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # 위경도를 단위구 위의 3차원 좌표로 바꾼다. (유클리드 거리 = 현의 길이라 KD-tree로 반경 검색 가능)
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+@dataclass(frozen=True)
+class GeoSnapshot:
+    # 한 시점의 place 좌표와 KD-tree. 갱신 시 새로 만들어 참조 교체
+    place_ids: np.ndarray
+    points: np.ndarray
+    tree: Optional[cKDTree]
+    loaded_at: datetime.datetime
+
+    def __len__(self) -> int:
+        return len(self.place_ids)
+
+    def nearby(self, x: float, y: float, radius: float, limit: int = REC_GEO_MAX_CANDIDATES) -> List[int]:
+        """
+        (x=경도, y=위도)에서 radius(m) 안의 place id를 가까운 순으로 최대 limit개 반환합니다.
+        """
+        if self.tree is None or limit <= 0:
+            return []
+        query = unit_vectors(np.array([y]), np.array([x]))[0]
+        chord = 2.0 * math.sin(min(radius / EARTH_RADIUS, math.pi) / 2.0)
+        k = min(limit, len(self))
+        distances, rows = self.tree.query(query, k=k, distance_upper_bound=chord * (1 + 1e-12))
+        rows = np.atleast_1d(rows)[np.isfinite(np.atleast_1d(distances))]
+        return self.place_ids[rows].tolist()
+
+def build_geo_snapshot(coordinates: Dict[int, Tuple[float, float]]) -> GeoSnapshot:
+    place_ids = np.fromiter(coordinates.keys(), dtype=np.int64, count=len(coordinates))
+    lat_lon = np.array(list(coordinates.values()), dtype=np.float64).reshape(-1, 2)
+    points = unit_vectors(lat_lon[:, 0], lat_lon[:, 1])
+    tree = cKDTree(points) if len(place_ids) else None
+    return GeoSnapshot(place_ids, points, tree, datetime.datetime.now())
+
+class PlaceGeoIndex:
+    """
+    Place 테이블의 좌표를 메모리 KD-tree로 들고 있다가 위치+반경으로 후보 place를 찾는다.
+
+    REC_GEO_REFRESH마다 updatedAt 이후 바뀐 place만 가져와 반영하고,
+    place 수가 달라졌으면 (삭제 등) 전체를 다시 읽는다.
+    updatedAt이 watermark와 같은 place는 (같은 시각에 늦게 커밋된 것을 놓치지 않도록) 매번 다시 가져오므로,
+    좌표가 실제로 바뀐 경우에만 KD-tree를 다시 만든다.
+    """
+    def __init__(self, interval: float = REC_GEO_REFRESH):
+        self.interval = interval
+        self._current: Optional[GeoSnapshot] = None
+        self._coordinates: Dict[int, Tuple[float, float]] = {}
+        self._known_ids: set = set()  # 좌표가 없는 place 포함
+        self._watermark: Optional[datetime.datetime] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[GeoSnapshot]:
+        return self._current
+
+    def _apply(self, rows) -> bool:
+        """
+        :return: 색인할 좌표가 바뀌었는지 여부.
+        """
+        changed = False
+        for place_id, x, y, updated_at in rows:
+            self._known_ids.add(place_id)
+            coordinate = parse_coordinate(x, y)
+            if coordinate is None:
+                changed |= self._coordinates.pop(place_id, None) is not None
+            elif self._coordinates.get(place_id) != coordinate:
+                self._coordinates[place_id] = coordinate
+                changed = True
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+        return changed
+
+    async def refresh(self) -> GeoSnapshot:
+        async with self._lock:
+            async with AsyncSessionLocal() as session:
+                total = await count_places(session)
+                full = self._current is None or total != len(self._known_ids)
+                rows = await get_place_coordinates(session, None if full else self._watermark)
+            if full:
+                self._coordinates, self._known_ids, self._watermark = {}, set(), None
+            if not self._apply(rows) and not full:
+                self.last_error = None
+                return self._current
+            self._current = await asyncio.to_thread(build_geo_snapshot, dict(self._coordinates))
+            self.last_error = None
+            logger.info(f"[geo] {'loaded' if full else 'updated'} {len(rows)} places ({len(self._current)} indexed)")
+            return self._current
+
+    async def get(self) -> GeoSnapshot:
+        if self._current is None:
+            return await self.refresh()
+        return self._current
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[geo] refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            "places": len(current) if current else 0,
+            "loaded_at": current.loaded_at.isoformat() if current else None,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "last_error": self.last_error,
+        }
+
+place_geo_index = PlaceGeoIndex()
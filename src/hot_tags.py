@@ -0,0 +1,274 @@
+# hot_tags.py
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import REC_HOT_TAGS_PATH, REC_HOT_TAGS_SAVE_INTERVAL, REC_HOT_TAGS_REBUILD, REC_HOT_TAGS_BUCKET, REC_HOT_TAGS_RETENTION
+from vdb import add_count_listener, get_tag_counts
+
+logger = logging.getLogger(__name__)
+
+class IndexedMaxHeap:
+    """
+    key -> count 최대 힙. key 위치를 들고 있어서 count 변경이 O(log n)이고,
+    상위 k개는 힙을 위에서부터 best-first로 내려가며 O(k log k)로 찾는다.
+    """
+    def __init__(self):
+        self._keys: List[str] = []
+        self._counts: List[int] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _swap(self, i: int, j: int) -> None:
+        self._keys[i], self._keys[j] = self._keys[j], self._keys[i]
+        self._counts[i], self._counts[j] = self._counts[j], self._counts[i]
+        self._positions[self._keys[i]] = i
+        self._positions[self._keys[j]] = j
+
+    def _sift_up(self, i: int) -> None:
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._counts[parent] >= self._counts[i]:
+                return
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int) -> None:
+        size = len(self._keys)
+        while True:
+            largest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._counts[child] > self._counts[largest]:
+                    largest = child
+            if largest == i:
+                return
+            self._swap(i, largest)
+            i = largest
+
+    def set(self, key: str, count: int) -> None:
+        i = self._positions.get(key)
+        if i is None:
+            self._keys.append(key)
+            self._counts.append(count)
+            self._positions[key] = len(self._keys) - 1
+            self._sift_up(len(self._keys) - 1)
+            return
+        previous = self._counts[i]
+        self._counts[i] = count
+        if count > previous:
+            self._sift_up(i)
+        elif count < previous:
+            self._sift_down(i)
+
+    def remove(self, key: str) -> None:
+        i = self._positions.pop(key, None)
+        if i is None:
+            return
+        last = len(self._keys) - 1
+        if i != last:
+            self._keys[i], self._counts[i] = self._keys[last], self._counts[last]
+            self._positions[self._keys[i]] = i
+        self._keys.pop()
+        self._counts.pop()
+        if i < len(self._keys):
+            moved = self._keys[i]
+            self._sift_up(i)
+            self._sift_down(self._positions[moved])
+
+    def top(self, k: int, min_count: int = 0) -> List[Tuple[str, int]]:
+        result = []
+        frontier = [(-self._counts[0], 0)] if self._keys else []
+        while frontier and len(result) < k:
+            negative_count, i = heapq.heappop(frontier)
+            if -negative_count < min_count:
+                break
+            result.append((self._keys[i], -negative_count))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self._keys):
+                    heapq.heappush(frontier, (-self._counts[child], child))
+        return result
+
+class HotTags:
+    """
+    정규화된 해시태그 (벡터 디비 문서)별 사용 횟수의 상위 K 구조. get_best_tags의 전체 스캔을 대체한다.
+
+    - 전체 기간: sentiment별 IndexedMaxHeap (전체 + 1/0/-1)에서 O(k log k)로 조회
+    - 최근 window: REC_HOT_TAGS_BUCKET 단위 시간 버킷 카운터를 합산 (window 안에 쓰인 태그 수에 비례)
+
+    tags_valid가 count를 올릴 때마다 (vdb count listener) 갱신되고, 주기적으로 path에 저장된다.
+    시작할 때와 REC_HOT_TAGS_REBUILD마다 벡터 디비 count로 다시 맞춘다. (다른 worker가 올린 count 반영)
+    시간 버킷은 벡터 디비에 없으므로 이 worker가 본 것과 저장된 파일 기준이다.
+    """
+    def __init__(
+        self,
+        path: Optional[str] = REC_HOT_TAGS_PATH,
+        save_interval: float = REC_HOT_TAGS_SAVE_INTERVAL,
+        rebuild_interval: float = REC_HOT_TAGS_REBUILD,
+        bucket_seconds: int = REC_HOT_TAGS_BUCKET,
+        retention: float = REC_HOT_TAGS_RETENTION
+    ):
+        self.path = path
+        self.save_interval = save_interval
+        self.rebuild_interval = rebuild_interval
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self._names: Dict[str, str] = {}
+        self._counts: Dict[str, int] = {}
+        self._sentiments: Dict[str, int] = {}
+        self._heaps: Dict[Optional[int], IndexedMaxHeap] = defaultdict(IndexedMaxHeap)
+        self._buckets: Dict[int, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self.rebuilt_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        add_count_listener(self.record)
+
+    def _set(self, tag_id: str, name: str, count: int, sentiment: int) -> None:
+        previous = self._sentiments.get(tag_id)
+        if previous is not None and previous != sentiment:
+            self._heaps[previous].remove(tag_id)
+        self._names[tag_id] = name
+        self._counts[tag_id] = count
+        self._sentiments[tag_id] = sentiment
+        self._heaps[None].set(tag_id, count)
+        self._heaps[sentiment].set(tag_id, count)
+
+    def record(self, rows: Iterable[Tuple[str, str, int, int, int]], now: Optional[float] = None) -> None:
+        """
+        :param rows: (문서 id, 해시태그, 새 count, sentiment, 증가량) 리스트.
+        """
+        bucket = int((now if now is not None else time.time()) // self.bucket_seconds)
+        with self._lock:
+            for tag_id, name, count, sentiment, delta in rows:
+                self._set(tag_id, name, int(count), int(sentiment))
+                self._buckets[bucket][tag_id] += delta
+            self._dirty = True
+
+    def top(self, k: int = 10, min_count: int = 2, sentiment: Optional[int] = None, window: Optional[float] = None) -> List[str]:
+        """
+        사용 횟수 상위 k개 해시태그를 반환합니다.
+
+        :param min_count: 이 횟수 미만은 제외 (기존 get_best_tags와 같이 기본 2).
+        :param sentiment: 지정하면 이 sentiment (1/0/-1) 해시태그만.
+        :param window: 지정하면 최근 window초 동안의 사용 횟수로 순위를 매김.
+        """
+        with self._lock:
+            if window is None:
+                heap = self._heaps.get(sentiment)
+                return [self._names[tag_id] for tag_id, _ in heap.top(k, min_count)] if heap else []
+            first = int((time.time() - window) // self.bucket_seconds)
+            counts = Counter()
+            for bucket, bucket_counts in self._buckets.items():
+                if bucket >= first:
+                    counts.update(bucket_counts)
+            candidates = (
+                (tag_id, count) for tag_id, count in counts.items()
+                if count >= min_count and tag_id in self._names and (sentiment is None or self._sentiments[tag_id] == sentiment)
+            )
+            return [self._names[tag_id] for tag_id, _ in heapq.nlargest(k, candidates, key=lambda item: item[1])]
+
+    def rebuild(self) -> int:
+        """
+        벡터 디비 전체 count로 다시 만듭니다. (시작 시, 주기적으로 thread에서 실행)
+        """
+        rows = get_tag_counts()
+        with self._lock:
+            self._names, self._counts, self._sentiments = {}, {}, {}
+            self._heaps = defaultdict(IndexedMaxHeap)
+            for tag_id, name, count, sentiment in rows:
+                self._set(tag_id, name, int(count), int(sentiment))
+            self.rebuilt_at = time.time()
+        logger.info(f"[hot_tags] rebuilt {len(rows)} tags from vector db")
+        return len(rows)
+
+    def _expire(self) -> None:
+        first = int((time.time() - self.retention) // self.bucket_seconds)
+        for bucket in [bucket for bucket in self._buckets if bucket < first]:
+            del self._buckets[bucket]
+
+    def save(self) -> None:
+        with self._lock:
+            self._expire()
+            data = {
+                "saved_at": time.time(),
+                "bucket_seconds": self.bucket_seconds,
+                "tags": {tag_id: [self._names[tag_id], count, self._sentiments[tag_id]] for tag_id, count in self._counts.items()},
+                "buckets": {str(bucket): dict(counts) for bucket, counts in self._buckets.items()},
+            }
+            self._dirty = False
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self) -> bool:
+        # 저장된 파일로 바로 서빙을 시작 (count는 이후 rebuild에서 벡터 디비 값으로 맞춤)
+        if not self.path:
+            return False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            logger.error(f"[hot_tags] invalid saved file {self.path}: {e}")
+            return False
+        with self._lock:
+            for tag_id, (name, count, sentiment) in data["tags"].items():
+                self._set(tag_id, name, count, sentiment)
+            if data.get("bucket_seconds") == self.bucket_seconds:
+                for bucket, counts in data["buckets"].items():
+                    self._buckets[int(bucket)].update(counts)
+            self._expire()
+        return True
+
+    async def _run(self) -> None:
+        await asyncio.to_thread(self.load)
+        next_rebuild = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_rebuild:
+                    await asyncio.to_thread(self.rebuild)
+                    next_rebuild = time.monotonic() + self.rebuild_interval
+                if self.path and self._dirty:
+                    await asyncio.to_thread(self.save)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[hot_tags] refresh failed: {e}")
+            await asyncio.sleep(self.save_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.path and self._dirty:
+            await asyncio.to_thread(self.save)
+
+    def status(self) -> dict:
+        return {
+            "tags": len(self._counts),
+            "buckets": len(self._buckets),
+            "rebuilt_at": self.rebuilt_at,
+            "last_error": self.last_error,
+        }
+
+hot_tags = HotTags()
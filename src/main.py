@@ -1,14 +1,66 @@
 import os
-from config import AI_IP, AI_PORT
+import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends, HTTPException
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
-import uvicorn
 
-from rec import recommendation_router
+from rec import recommendation_router, ai_flight
 from tag import tag_router
-app = FastAPI()
+from rc_manager import start_model_managers, stop_model_managers
+from executor import compute_executor
+from rec_cache import recommendation_cache
+from popular import popular_rankings, popular_flight
+from geo import place_geo_index
+from cold_start import cold_start_rankings
+from similar import similar_places
+from partition import regional_models
+from embedding import embedding_service
+from db_connect import prepare_tag_sentiments
+from tag_sentiment import tag_sentiments
+from hot_tags import hot_tags
+from vdb import tag_counter
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 태그 sentiment 테이블 준비 (실패해도 학습 시 필요한 태그를 DB에서 읽어 온다)
+    try:
+        await prepare_tag_sentiments()
+    except Exception as e:
+        logger.error(f"tag sentiment preparation failed: {e}")
+    # 인기 해시태그 상위 K 구조 (벡터 디비 count로 재구성 후 증분 갱신)
+    hot_tags.start()
+    # 추천 모델 백그라운드 학습 시작
+    start_model_managers()
+    # 지역별 /get_recs/ai 모델 (REC_REGION_LEVEL 설정 시)
+    regional_models.start()
+    # /get_recs/popular 순위 사전 계산
+    popular_rankings.start()
+    # 위치 기반 후보 검색용 place 좌표 인덱스
+    place_geo_index.start()
+    # 신규 user용 segment 순위
+    cold_start_rankings.start()
+    # 비슷한 place 이웃 테이블
+    similar_places.start()
+
+    yield
+
+    await similar_places.stop()
+    await cold_start_rankings.stop()
+    await place_geo_index.stop()
+    await popular_rankings.stop()
+    await regional_models.stop()
+    await stop_model_managers()
+    await hot_tags.stop()
+    compute_executor.shutdown()
+    embedding_service.shutdown()
+    # 남은 해시태그 count 증가분 저장
+    tag_counter.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(tag_router)
 app.include_router(recommendation_router)
@@ -18,9 +70,23 @@ app.include_router(recommendation_router)
 def health_check():
     return {"status": "ok"}
 
+# 내부 상태 지표
+@app.get('/metrics')
+def metrics():
+    return {
+        "compute_executor": compute_executor.metrics(),
+        "recommendation_cache": recommendation_cache.metrics(),
+        "popular_rankings": popular_rankings.status(),
+        "place_geo_index": place_geo_index.status(),
+        "cold_start_rankings": cold_start_rankings.status(),
+        "similar_places": similar_places.status(),
+        "embedding": embedding_service.metrics(),
+        "tag_sentiments": tag_sentiments.metrics(),
+        "hot_tags": hot_tags.status(),
+        "tag_counter": tag_counter.metrics(),
+        "singleflight": {flight.name: flight.metrics() for flight in (ai_flight, popular_flight)},
+    }
+
 @app.get('/')
 def home():
     return {'message' : 'main'}
-
-if __name__ == "__main__":
-    uvicorn.run("main:app", host=AI_IP, port=AI_PORT, reload=True)
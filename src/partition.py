@@ -0,0 +1,197 @@
+# partition.py
+
+import asyncio
+import logging
+import math
+import zlib
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import REC_REGION_LEVEL, REC_REGION_GRID, REC_REGION_REFRESH, REC_PARTITION_COUNT, REC_PARTITION_INDEX
+from db_connect import AsyncSessionLocal, get_place_locations, make_region_frame, get_user_info, get_place_info, get_userplace_interactions
+from geo import parse_coordinate
+from rc_graph import ServingModel
+from rc_manager import ModelManager, ReviewEvent, TrainingData, load_user_update_data, add_review_listener, is_trainer
+from features import user_feature_vocabulary, item_feature_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# 주소 첫 단어 -> 시/도 이름
+SIDO_ALIASES = {
+    "서울특별시": "서울", "서울시": "서울",
+    "부산광역시": "부산", "대구광역시": "대구", "인천광역시": "인천", "광주광역시": "광주",
+    "대전광역시": "대전", "울산광역시": "울산", "세종특별자치시": "세종",
+    "경기도": "경기", "강원도": "강원", "강원특별자치도": "강원",
+    "충청북도": "충북", "충청남도": "충남", "전라북도": "전북", "전북특별자치도": "전북", "전라남도": "전남",
+    "경상북도": "경북", "경상남도": "경남", "제주특별자치도": "제주", "제주도": "제주",
+}
+
+def region_of(address: Optional[str], x: Optional[str], y: Optional[str], level: str = REC_REGION_LEVEL) -> Optional[str]:
+    """
+    place의 지역 이름을 정합니다. 주소(시/도, 시/군/구)를 우선 사용하고, 주소가 없으면 좌표 격자를 사용합니다.
+
+    :param level: "sido" 또는 "sigungu".
+    """
+    tokens = (address or "").split()
+    if tokens:
+        sido = SIDO_ALIASES.get(tokens[0], tokens[0])
+        if level == "sigungu" and len(tokens) > 1:
+            return f"{sido} {tokens[1]}"
+        return sido
+    coordinate = parse_coordinate(x, y)
+    if coordinate is None:
+        return None
+    lat, lon = coordinate
+    return f"grid:{math.floor(lat / REC_REGION_GRID) * REC_REGION_GRID:g},{math.floor(lon / REC_REGION_GRID) * REC_REGION_GRID:g}"
+
+def partition_of(region: str) -> int:
+    # 노드마다 같은 결과가 나오도록 crc32 사용
+    return zlib.crc32(region.encode("utf-8")) % REC_PARTITION_COUNT
+
+def owns(region: str) -> bool:
+    return partition_of(region) == REC_PARTITION_INDEX
+
+class RegionNotServed(Exception):
+    # 다른 노드가 맡는 지역에 대한 요청
+    def __init__(self, region: str):
+        super().__init__(f"region {region} is served by partition {partition_of(region)}")
+        self.region = region
+        self.partition = partition_of(region)
+
+def region_training_loader(regional_models: "RegionalModels", region: str) -> Callable[[AsyncSession], Awaitable[TrainingData]]:
+    # 지역에 속한 place와 그 place를 리뷰한 user만으로 학습 데이터를 만든다.
+    async def load(session: AsyncSession) -> TrainingData:
+        user_list, place_list = await make_region_frame(session, regional_models.places_in(region))
+        userfeature = await get_user_info(session, user_list)
+        placefeature = await get_place_info(session, place_list)
+        interactions = await get_userplace_interactions(session, user_list, place_list)
+        return userfeature, placefeature, interactions
+    return load
+
+class RegionalModels:
+    """
+    /get_recs/ai 모델을 지역별로 나눠 학습하고 서빙한다. (REC_REGION_LEVEL이 설정된 경우)
+
+    place마다 지역을 정하고, 이 노드가 맡는 지역(crc32(지역) % REC_PARTITION_COUNT == REC_PARTITION_INDEX)마다
+    ModelManager를 하나씩 둔다. 학습 데이터가 그 지역 place로 한정되므로 학습 메모리와 시간은 지역 크기에 비례한다.
+    요청은 후보 place가 가장 많이 속한 지역의 모델로 보낸다.
+    """
+    def __init__(self, interval: float = REC_REGION_REFRESH):
+        self.interval = interval
+        self.enabled = bool(REC_REGION_LEVEL)
+        self._place_region: Dict[int, str] = {}
+        self._places_by_region: Dict[str, List[int]] = {}
+        self._managers: Dict[str, ModelManager] = {}
+        self._swap_listeners: List[Callable[[ServingModel], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._started = False
+        self.last_error: Optional[str] = None
+        if self.enabled:
+            add_review_listener(self.enqueue)
+
+    def places_in(self, region: str) -> List[int]:
+        return self._places_by_region.get(region, [])
+
+    def region_for(self, place_ids: List[int]) -> Optional[str]:
+        # 후보 place가 가장 많이 속한 지역
+        counts = Counter(self._place_region[place_id] for place_id in place_ids if place_id in self._place_region)
+        if not counts:
+            return None
+        return counts.most_common(1)[0][0]
+
+    def manager(self, region: Optional[str]) -> Optional[ModelManager]:
+        """
+        지역 모델을 반환합니다. 다른 노드가 맡는 지역이면 RegionNotServed를 던집니다.
+        """
+        if region is None:
+            return None
+        if not owns(region):
+            raise RegionNotServed(region)
+        return self._managers.get(region)
+
+    def add_swap_listener(self, listener: Callable[[ServingModel], None]) -> None:
+        self._swap_listeners.append(listener)
+        for manager in self._managers.values():
+            manager.add_swap_listener(listener)
+
+    def enqueue(self, event: ReviewEvent) -> None:
+        manager = self._managers.get(self._place_region.get(event.place_id))
+        if manager is not None:
+            manager.enqueue(event)
+
+    async def refresh(self) -> None:
+        async with AsyncSessionLocal() as session:
+            rows = await get_place_locations(session)
+
+        place_region = {}
+        places_by_region = defaultdict(list)
+        for place_id, address, x, y in rows:
+            region = region_of(address, x, y)
+            if region is None:
+                continue
+            place_region[place_id] = region
+            places_by_region[region].append(place_id)
+        self._place_region = place_region
+        self._places_by_region = dict(places_by_region)
+
+        # 새로 생긴 (이 노드가 맡는) 지역의 모델 추가
+        for region in sorted(self._places_by_region):
+            if not owns(region) or region in self._managers:
+                continue
+            manager = ModelManager(
+                f"ai-{region}", region_training_loader(self, region), load_user_update_data,
+                user_vocabulary=user_feature_vocabulary(), item_vocabulary=item_feature_vocabulary()
+            )
+            for listener in self._swap_listeners:
+                manager.add_swap_listener(listener)
+            self._managers[region] = manager
+            if self._started:
+                manager.start(is_trainer())
+        self.last_error = None
+        logger.info(f"[regions] {len(place_region)} places in {len(self._places_by_region)} regions, serving {len(self._managers)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[regions] refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._started = True
+        for manager in self._managers.values():
+            manager.start(is_trainer())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._started = False
+        for manager in self._managers.values():
+            await manager.stop()
+
+    def managers(self) -> List[ModelManager]:
+        return list(self._managers.values())
+
+    def served(self) -> Dict[str, ModelManager]:
+        # 이 노드가 맡는 지역 -> 모델
+        return dict(self._managers)
+
+    def partitions(self) -> Dict[str, dict]:
+        return {
+            region: {"partition": partition_of(region), "places": len(place_ids), "served": region in self._managers}
+            for region, place_ids in self._places_by_region.items()
+        }
+
+regional_models = RegionalModels()
@@ -0,0 +1,222 @@
+# popular.py
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import REC_POPULAR_INTERVAL, REC_POPULAR_PATH
+from db_connect import AsyncSessionLocal, get_top_tags_vdb
+from executor import compute_executor
+from rc_graph import ServingModel
+from rc_manager import tag_model_manager
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PopularSnapshot:
+    # 인기 해시태그별 전체 place 순위 (모델이 모르는 tag는 None)
+    version: Optional[str]
+    refreshed_at: datetime.datetime
+    tags: Tuple[int, ...]
+    rankings: Tuple[Optional[Tuple[int, ...]], ...]
+    positions: Tuple[Optional[Dict[int, int]], ...]
+
+    @classmethod
+    def build(
+        cls,
+        version: Optional[str],
+        refreshed_at: datetime.datetime,
+        tags: List[int],
+        rankings: List[Optional[List[int]]]
+    ) -> "PopularSnapshot":
+        return cls(
+            version=version,
+            refreshed_at=refreshed_at,
+            tags=tuple(tags),
+            rankings=tuple(tuple(ranking) if ranking is not None else None for ranking in rankings),
+            positions=tuple(
+                {place_id: pos for pos, place_id in enumerate(ranking)} if ranking is not None else None
+                for ranking in rankings
+            ),
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "version": self.version,
+            "refreshed_at": self.refreshed_at.isoformat(),
+            "tags": list(self.tags),
+            "rankings": [list(ranking) if ranking is not None else None for ranking in self.rankings],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "PopularSnapshot":
+        return cls.build(
+            data["version"],
+            datetime.datetime.fromisoformat(data["refreshed_at"]),
+            data["tags"],
+            data["rankings"],
+        )
+
+    def filter(self, place_ids: List[int], top_k: Optional[int] = None) -> Tuple[List[str], List[List[str]]]:
+        """
+        사전 계산된 순위에서 요청한 place_ids만 골라 정렬합니다.
+        순위에 없는 place는 요청 순서대로 뒤에 붙고, 모델이 모르는 tag는 요청 순서를 그대로 반환합니다.
+        """
+        cafe_list = []
+        for position in self.positions:
+            if position is None:
+                cafe_list.append(list(map(str, place_ids[:top_k])))
+                continue
+            known = sorted({place_id for place_id in place_ids if place_id in position}, key=position.__getitem__)
+            ranked = set(known)
+            no_matching_item = [place_id for place_id in place_ids if place_id not in ranked]
+            cafe_list.append(list(map(str, (known + no_matching_item)[:top_k])))
+        return list(map(str, self.tags)), cafe_list
+
+def rank_catalogue(model_version: Optional[ServingModel], tag_ids: List[int]) -> List[Optional[List[int]]]:
+    """
+    tag마다 모델이 아는 전체 place를 점수순으로 정렬합니다. (user bias는 순위에 영향이 없어 제외)
+    """
+    if model_version is None:
+        return [None] * len(tag_ids)
+
+    tag_internal_ids = model_version.user_indices(tag_ids)
+    known_tags = tag_internal_ids >= 0
+    place_ids, item_biases, item_repr = model_version.item_catalogue()
+
+    rankings: List[Optional[List[int]]] = [None] * len(tag_ids)
+    if known_tags.any() and len(place_ids):
+        _, tag_repr = model_version.user_representations(tag_internal_ids[known_tags])
+        scores = np.asarray(tag_repr) @ np.asarray(item_repr).T + np.asarray(item_biases)[None, :]
+        orders = np.argsort(-scores, axis=1, kind='stable')
+        for row, idx in enumerate(np.flatnonzero(known_tags)):
+            rankings[idx] = place_ids[orders[row]].tolist()
+    return rankings
+
+# /popular 첫 계산 동시 요청 합치기
+popular_flight = SingleFlight("popular")
+
+class PopularRankings:
+    """
+    /get_recs/popular용 인기 해시태그 x 전체 place 순위를 백그라운드에서 주기적으로 계산해 둔다.
+    해시태그 목록은 모든 요청에 같으므로 요청에서는 place_ids로 거르기만 한다.
+
+    tag 모델 버전이 바뀌면 바로 다시 계산하고, 결과는 path에 저장해서
+    재시작 직후나 갱신이 실패했을 때 마지막 결과를 사용한다.
+    """
+    def __init__(self, path: Optional[str] = REC_POPULAR_PATH, interval: float = REC_POPULAR_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._current: Optional[PopularSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        # tag 모델이 교체되면 다음 갱신을 앞당긴다
+        tag_model_manager.add_swap_listener(lambda model_version: self._wakeup.set())
+
+    @property
+    def current(self) -> Optional[PopularSnapshot]:
+        return self._current
+
+    async def refresh(self) -> PopularSnapshot:
+        """
+        인기 해시태그를 다시 조회하고 현재 tag 모델로 전체 순위를 계산해 교체합니다.
+        """
+        async with self._lock:
+            model_version = tag_model_manager.current
+            async with AsyncSessionLocal() as session:
+                tags = list(await get_top_tags_vdb(session))
+            rankings = await compute_executor.run_local(rank_catalogue, model_version, tags)
+            snapshot = PopularSnapshot.build(
+                model_version.version if model_version else None,
+                datetime.datetime.now(),
+                tags,
+                rankings,
+            )
+            self._current = snapshot
+            self.last_error = None
+            if self.path:
+                await asyncio.to_thread(self._save, snapshot)
+            logger.info(f"[popular] refreshed {len(tags)} tags (model {snapshot.version})")
+            return snapshot
+
+    async def get(self) -> PopularSnapshot:
+        # 아직 계산된 결과가 없으면 (첫 요청) 한 번 계산해서 반환
+        if self._current is None:
+            try:
+                # 동시에 들어온 첫 요청들은 한 번의 계산을 같이 기다린다
+                return await popular_flight.do("refresh", self.refresh)
+            except Exception as e:
+                self.last_error = str(e)
+                snapshot = self._current or await asyncio.to_thread(self._load)
+                if snapshot is None:
+                    raise
+                self._current = snapshot
+        return self._current
+
+    def _save(self, snapshot: PopularSnapshot) -> None:
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot.to_json(), f)
+        os.replace(tmp, self.path)
+
+    def _load(self) -> Optional[PopularSnapshot]:
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as f:
+                return PopularSnapshot.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.error(f"[popular] invalid saved rankings {self.path}: {e}")
+            return None
+
+    async def _run(self) -> None:
+        # 재시작 직후에는 저장된 결과부터 서빙
+        if self._current is None:
+            self._current = await asyncio.to_thread(self._load)
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                # 실패하면 이전 결과를 그대로 서빙
+                self.last_error = str(e)
+                logger.error(f"[popular] refresh failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            "version": current.version if current else None,
+            "refreshed_at": current.refreshed_at.isoformat() if current else None,
+            "tags": len(current.tags) if current else 0,
+            "last_error": self.last_error,
+        }
+
+popular_rankings = PopularRankings()
@@ -1,153 +1,631 @@
-import pandas as pd
+import copy
+import datetime
+import json
+import os
+import sys
+import time
 import numpy as np
 from collections import defaultdict
-from typing import List, Tuple, Union
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+from scipy.sparse import coo_matrix, csr_matrix, diags
 from lightfm import LightFM
 from lightfm.data import Dataset
+from lightfm.evaluation import auc_score
 
-dataset = Dataset()
+# ------------------------------
+# 학습/추론 분리
+# 요청마다 모델을 새로 학습하지 않고, 학습된 모델 버전을 받아서 predict만 수행한다.
 
-async def recommend_cafe(
+def _feature_name(feature: Union[int, float, str]) -> str:
+    # lightfm feature 이름은 문자열로 통일
+    if isinstance(feature, (int, float)):
+        return str(feature)
+    return feature
+
+def _group_features(rows: List[Union[int, str]]) -> List[Tuple[int, List[str]]]:
+    grouped_features = defaultdict(list)
+    for entity_id, feature in rows:
+        if feature is None:
+            continue
+        grouped_features[entity_id].append(_feature_name(feature))
+    return sorted(grouped_features.items(), key=lambda x: x[0])
+
+_MODEL_ARRAYS = tuple(
+    f'{prefix}_{name}'
+    for prefix in ('user', 'item')
+    for name in ('embeddings', 'embedding_gradients', 'embedding_momentum', 'biases', 'bias_gradients', 'bias_momentum')
+)
+
+@dataclass(frozen=True)
+class TrainingSet:
+    dataset: Dataset
+    user_feature_matrix: csr_matrix
+    item_feature_matrix: csr_matrix
+    interactions: coo_matrix
+    weights: coo_matrix
+
+@dataclass(frozen=True)
+class ModelVersion:
+    """
+    학습이 끝난 모델과 그 모델의 Dataset mapping을 묶은 불변 객체.
+    교체는 ModelManager가 참조를 바꾸는 방식으로만 일어난다.
+    """
+    version: str
+    model: LightFM
+    dataset: Dataset
+    user_feature_matrix: csr_matrix
+    item_feature_matrix: csr_matrix
+    trained_at: datetime.datetime
+    num_interactions: int
+    partial_updates: int = 0
+    training_report: Optional[dict] = None  # threads, epochs_run, best_epoch, validation_auc, fit_seconds
+
+    def memory_report(self) -> dict:
+        # 이 버전이 붙잡고 있는 메모리 (모델 파라미터 + feature 행렬 + id/feature mapping)
+        model_bytes = sum(getattr(self.model, name).nbytes for name in _MODEL_ARRAYS)
+        matrix_bytes = sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in (self.user_feature_matrix, self.item_feature_matrix)
+        )
+        mapping_bytes = sum(sys.getsizeof(id_map) for id_map in self.dataset.mapping())
+        return {
+            "users": self.user_feature_matrix.shape[0],
+            "items": self.item_feature_matrix.shape[0],
+            "user_features": self.user_feature_matrix.shape[1],
+            "item_features": self.item_feature_matrix.shape[1],
+            "heap_bytes": model_bytes + matrix_bytes + mapping_bytes,
+            "mapped_bytes": 0,
+        }
+
+    def user_indices(self, user_ids: List[int]) -> np.ndarray:
+        # 모르는 user는 -1
+        user_id_map = self.dataset.mapping()[0]
+        return np.array([user_id_map.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+
+    def item_indices(self, place_ids: List[int]) -> np.ndarray:
+        # 모르는 place는 -1
+        item_id_map = self.dataset.mapping()[2]
+        return np.array([item_id_map.get(place_id, -1) for place_id in place_ids], dtype=np.int64)
+
+    def score_matrix(self, user_internal_ids: np.ndarray, item_internal_ids: np.ndarray) -> np.ndarray:
+        # 필요한 행의 feature만 잘라서 representation을 만들고 한 번의 행렬곱으로 점수 계산 (predict와 같은 값)
+        user_biases, user_repr = self.model.get_user_representations(self.user_feature_matrix[user_internal_ids])
+        item_biases, item_repr = self.model.get_item_representations(self.item_feature_matrix[item_internal_ids])
+        return user_repr @ item_repr.T + user_biases[:, None] + item_biases[None, :]
+
+    def user_representations(self, user_internal_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self.model.get_user_representations(self.user_feature_matrix[user_internal_ids])
+
+    def item_catalogue(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (내부 index 순서의 place id, item bias, item representation)
+        item_id_map = self.dataset.mapping()[2]
+        place_ids = np.empty(len(item_id_map), dtype=np.int64)
+        place_ids[list(item_id_map.values())] = list(item_id_map.keys())
+        item_biases, item_repr = self.model.get_item_representations(self.item_feature_matrix)
+        return place_ids, item_biases, item_repr
+
+@dataclass(frozen=True)
+class SnapshotVersion:
+    """
+    save_snapshot으로 저장된 모델을 mmap으로 읽은 서빙 전용 버전.
+    배열은 모두 read-only memmap이라 여러 worker 프로세스가 같은 물리 페이지를 공유한다.
+    id 조회도 dict 대신 정렬된 id 배열의 searchsorted로 해서 worker당 메모리가 늘지 않는다.
+    """
+    version: str
+    trained_at: datetime.datetime
+    num_interactions: int
+    partial_updates: int
+    user_ids: np.ndarray        # 정렬된 외부 user id
+    user_rows: np.ndarray       # user_ids 순서에 대응하는 내부 index
+    item_ids: np.ndarray
+    item_rows: np.ndarray
+    user_repr: np.ndarray       # 내부 index 순서의 user representation (feature embedding 합)
+    user_repr_biases: np.ndarray
+    item_repr: np.ndarray
+    item_repr_biases: np.ndarray
+
+    @staticmethod
+    def _lookup(sorted_ids: np.ndarray, rows: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(sorted_ids) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(sorted_ids, keys), 0, len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == keys, rows[pos], -1).astype(np.int64)
+
+    def memory_report(self) -> dict:
+        # mmap 배열은 프로세스 간 공유되는 page cache라 heap과 따로 보고
+        return {
+            "users": len(self.user_ids),
+            "items": len(self.item_ids),
+            "user_features": None,
+            "item_features": None,
+            "heap_bytes": 0,
+            "mapped_bytes": sum(getattr(self, name).nbytes for name in _SNAPSHOT_ARRAYS),
+        }
+
+    def user_indices(self, user_ids: List[int]) -> np.ndarray:
+        return self._lookup(self.user_ids, self.user_rows, np.array(user_ids, dtype=np.int64))
+
+    def item_indices(self, place_ids: List[int]) -> np.ndarray:
+        return self._lookup(self.item_ids, self.item_rows, np.array(place_ids, dtype=np.int64))
+
+    def score_matrix(self, user_internal_ids: np.ndarray, item_internal_ids: np.ndarray) -> np.ndarray:
+        return (
+            self.user_repr[user_internal_ids] @ self.item_repr[item_internal_ids].T
+            + self.user_repr_biases[user_internal_ids][:, None]
+            + self.item_repr_biases[item_internal_ids][None, :]
+        )
+
+    def user_representations(self, user_internal_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self.user_repr_biases[user_internal_ids], self.user_repr[user_internal_ids]
+
+    def item_catalogue(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # representation은 mmap 그대로 두고 id 배열만 내부 index 순서로 만든다.
+        place_ids = np.empty(len(self.item_ids), dtype=np.int64)
+        place_ids[self.item_rows] = self.item_ids
+        return place_ids, self.item_repr_biases, self.item_repr
+
+ServingModel = Union[ModelVersion, SnapshotVersion]
+
+@dataclass(frozen=True)
+class TrainingPayload:
+    """
+    executor로 넘기는 학습 데이터. DB Row 리스트 대신 numpy 배열과 문자열 튜플로 압축한다.
+    """
+    user_ids: np.ndarray                # user feature 행의 user id
+    user_feature_names: Tuple[str, ...]
+    item_ids: np.ndarray                # item feature 행의 place id
+    item_feature_names: Tuple[str, ...]
+    interactions: np.ndarray            # (n, 2) user id, place id
+    weights: np.ndarray
+    user_vocabulary: Tuple[str, ...] = ()
+    item_vocabulary: Tuple[str, ...] = ()
+
+    def unpack(self) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]], List[Tuple[int, int, float]]]:
+        user_features = list(zip(self.user_ids.tolist(), self.user_feature_names))
+        item_features = list(zip(self.item_ids.tolist(), self.item_feature_names))
+        interactions = [
+            (user_id, item_id, weight)
+            for (user_id, item_id), weight in zip(self.interactions.tolist(), self.weights.tolist())
+        ]
+        return user_features, item_features, interactions
+
+def pack_training_data(
     user_features: List[Union[int, str]],
     item_features: List[Union[int, str]],
     user_item_interactions: List[Union[int, str]],
-    user_id_list: List[int],
-    place_ids_list: List[List[int]]
-) -> List[List[str]]:
-    # print(user_features)
-    # print(item_features)
-    # print(user_item_interactions)
-
-    userF1 = set()
-    userF2 = set()
-    itemF1 = set()
-    itemF2 = set()
-
-    for user in user_features:
-        userF1.add(user[0])
-        # userF2.add(user[1])
-        if isinstance(user[1], int):
-            userF2.add(str(user[1]))
-        else:
-            userF2.add(user[1])
-    for item in item_features:
-        itemF1.add(item[0])
-        if isinstance(item[1], int):
-            itemF2.add(str(item[1]))
-        elif isinstance(item[1], float):
-            itemF2.add(str(item[1]))
-        else:
-            itemF2.add(item[1])
-
-    dataset.fit(
-        users=userF1,
-        items=itemF1,
-        user_features=userF2,
-        item_features=itemF2
+    user_vocabulary: Iterable[str] = (),
+    item_vocabulary: Iterable[str] = ()
+) -> TrainingPayload:
+    user_rows = [(user_id, _feature_name(feature)) for user_id, feature in user_features if feature is not None]
+    item_rows = [(item_id, _feature_name(feature)) for item_id, feature in item_features if feature is not None]
+    return TrainingPayload(
+        user_ids=np.array([row[0] for row in user_rows], dtype=np.int64),
+        user_feature_names=tuple(row[1] for row in user_rows),
+        item_ids=np.array([row[0] for row in item_rows], dtype=np.int64),
+        item_feature_names=tuple(row[1] for row in item_rows),
+        interactions=np.array([(row[0], row[1]) for row in user_item_interactions], dtype=np.int64).reshape(-1, 2),
+        weights=np.array([row[2] for row in user_item_interactions], dtype=np.float32),
+        user_vocabulary=tuple(user_vocabulary),
+        item_vocabulary=tuple(item_vocabulary)
     )
 
-    print("user_id_list\n", user_id_list)
-    print("place_ids_list\n", place_ids_list)
-    print("dataset fit users\n", userF1)
-    print("dataset fit items\n", itemF1)
-    print("dataset fit user_features\n", userF2)
-    print("dataset fit item_features\n", itemF2)
-    print("interactions\n", user_item_interactions)
-
-    if not user_item_interactions:
-        return user_id_list, [[str(place_id) for place_id in place_ids] for place_ids in place_ids_list]
+def build_training_set(
+    user_features: List[Union[int, str]],
+    item_features: List[Union[int, str]],
+    user_item_interactions: List[Union[int, str]],
+    user_vocabulary: Iterable[str] = (),
+    item_vocabulary: Iterable[str] = ()
+) -> TrainingSet:
     """
-    user_feature_matrix = dataset.build_user_features([
-    (row['user_id'], [tag.lstrip('#') for tag in row['user_tags']]) for idx, row in users_df.iterrows()
-    ])
+    전체 feature/interaction으로 새 Dataset을 만들고 학습용 행렬을 생성합니다.
+
+    :param user_features: (user_id, feature) 리스트.
+    :param item_features: (place_id, feature) 리스트.
+    :param user_item_interactions: (user_id, place_id, weight) 리스트.
+    :param user_vocabulary: 데이터에 없어도 미리 등록할 user feature (features.py의 고정 vocabulary).
+    :param item_vocabulary: 데이터에 없어도 미리 등록할 item feature.
+    :return: Dataset과 feature/interaction 행렬.
     """
+    user_res = _group_features(user_features)
+    item_res = _group_features(item_features)
 
-    grouped_features = defaultdict(list)
-    for user_id, feature in user_features:
-        if isinstance(feature, int):
-            feature = str(feature)
-        grouped_features[user_id].append(feature)
-    user_res = [(key, value) for key, value in grouped_features.items()]
-    # print("user_res\n\n", user_res)
+    users = {user_id for user_id, _ in user_res} | {row[0] for row in user_item_interactions}
+    items = {item_id for item_id, _ in item_res} | {row[1] for row in user_item_interactions}
+
+    new_dataset = Dataset()
+    new_dataset.fit(
+        users=users,
+        items=items,
+        user_features=list(dict.fromkeys(list(user_vocabulary) + [feature for _, features in user_res for feature in features])),
+        item_features=list(dict.fromkeys(list(item_vocabulary) + [feature for _, features in item_res for feature in features]))
+    )
 
-    grouped_features = defaultdict(list)
-    for item_id, feature in item_features:
-        if isinstance(feature, int):
-            feature = str(feature)
-        elif isinstance(feature, float):
-            feature = str(feature)
-        grouped_features[item_id].append(feature)
-    item_res = [(key, value) for key, value in grouped_features.items()]
-    # print("item_res\n\n", item_res)
-            
-    user_res = sorted(user_res, key=lambda x: x[0])
-    item_res = sorted(item_res, key=lambda x: x[0])
     user_item_interactions = sorted(user_item_interactions, key=lambda x: (x[0], x[1]))
-    # print("interactions\n", user_item_interactions)
+    (interactions, weights_matrix) = new_dataset.build_interactions(user_item_interactions)
 
-    user_feature_matrix = dataset.build_user_features(user_res)
-    item_feature_matrix = dataset.build_item_features(item_res)
-    (interactions, weights_matrix) = dataset.build_interactions(user_item_interactions)
+    return TrainingSet(
+        dataset=new_dataset,
+        user_feature_matrix=new_dataset.build_user_features(user_res),
+        item_feature_matrix=new_dataset.build_item_features(item_res),
+        interactions=interactions,
+        weights=weights_matrix
+    )
+
+def _split_interactions(
+    interactions: coo_matrix,
+    weights: coo_matrix,
+    validation_fraction: float,
+    random_state: int = 42
+) -> Tuple[coo_matrix, coo_matrix, coo_matrix, coo_matrix]:
+    # interaction과 weight를 같은 index로 나눈다 (학습용 interaction/weight, 검증용 interaction/weight)
+    interactions = interactions.tocoo()
+    weights = weights.tocoo()
+    held_out = np.random.RandomState(random_state).rand(interactions.nnz) < validation_fraction
+    train = ~held_out
+
+    def _subset(matrix: coo_matrix, mask: np.ndarray) -> coo_matrix:
+        return coo_matrix((matrix.data[mask], (matrix.row[mask], matrix.col[mask])), shape=matrix.shape)
 
-    model = LightFM(loss='warp', learning_rate=0.05, no_components=30, item_alpha=1e-6, user_alpha=1e-6)
-    model.fit(
+    return (
+        _subset(interactions, train), _subset(weights, train),
+        _subset(interactions, held_out), _subset(weights, held_out)
+    )
+
+def train_model(
+    training_set: TrainingSet,
+    version: str,
+    epochs: int = 30,
+    no_components: int = 30,
+    num_threads: int = 1,
+    validation_fraction: float = 0.0,
+    patience: int = 3
+) -> ModelVersion:
+    """
+    LightFM 모델을 학습합니다.
+
+    validation_fraction > 0이면 interaction 일부를 검증용으로 떼어 epoch마다 AUC를 재고,
+    patience epoch 동안 좋아지지 않으면 멈춘 뒤 가장 좋았던 epoch의 파라미터로 되돌립니다.
+    떼어 둔 interaction은 마지막에 한 epoch fit_partial로 모델에 반영합니다.
+
+    :param num_threads: LightFM Hogwild 학습 thread 수.
+    :param epochs: 최대 epoch 수.
+    """
+    started = time.perf_counter()
+    model = LightFM(loss='warp', learning_rate=0.05, no_components=no_components, item_alpha=1e-6, user_alpha=1e-6)
+    fit_args = dict(
+        user_features=training_set.user_feature_matrix,
+        item_features=training_set.item_feature_matrix,
+        num_threads=num_threads
+    )
+
+    train_interactions, train_weights, validation, validation_weights = _split_interactions(
+        training_set.interactions, training_set.weights, validation_fraction
+    )
+    report = {"threads": num_threads, "epochs_run": epochs, "best_epoch": epochs, "validation_auc": None}
+
+    if validation_fraction <= 0 or validation.nnz == 0 or train_interactions.nnz == 0:
+        model.fit(interactions=training_set.interactions, sample_weight=training_set.weights, epochs=epochs, **fit_args)
+    else:
+        best_auc = -1.0
+        best_params = None
+        for epoch in range(1, epochs + 1):
+            model.fit_partial(interactions=train_interactions, sample_weight=train_weights, epochs=1, **fit_args)
+            auc = float(auc_score(model, validation, train_interactions=train_interactions, **fit_args).mean())
+            report["epochs_run"] = epoch
+            if auc > best_auc:
+                best_auc = auc
+                best_params = {name: getattr(model, name).copy() for name in _MODEL_ARRAYS}
+                report["best_epoch"] = epoch
+            elif epoch - report["best_epoch"] >= patience:
+                break
+
+        for name, value in best_params.items():
+            setattr(model, name, value)
+        report["validation_auc"] = best_auc
+
+        # 검증용으로 뗀 interaction도 모델에 반영
+        model.fit_partial(interactions=validation, sample_weight=validation_weights, epochs=1, **fit_args)
+
+    report["fit_seconds"] = time.perf_counter() - started
+    return ModelVersion(
+        version=version,
+        model=model,
+        dataset=training_set.dataset,
+        user_feature_matrix=training_set.user_feature_matrix,
+        item_feature_matrix=training_set.item_feature_matrix,
+        trained_at=datetime.datetime.now(),
+        num_interactions=training_set.interactions.nnz,
+        training_report=report
+    )
+
+def _expand_embeddings(model: LightFM, no_user_features: int, no_item_features: int) -> None:
+    # 새로 생긴 user/item/feature 만큼 embedding을 LightFM 초기화 방식 그대로 늘린다.
+    grad_init = 1.0 if model.learning_schedule == 'adagrad' else 0.0
+    for prefix, no_features in (('user', no_user_features), ('item', no_item_features)):
+        embeddings = getattr(model, f'{prefix}_embeddings')
+        extra = no_features - embeddings.shape[0]
+        if extra <= 0:
+            continue
+        new_embeddings = ((model.random_state.rand(extra, model.no_components) - 0.5) / model.no_components).astype(np.float32)
+        setattr(model, f'{prefix}_embeddings', np.vstack([embeddings, new_embeddings]))
+        setattr(model, f'{prefix}_embedding_gradients', np.vstack([
+            getattr(model, f'{prefix}_embedding_gradients'),
+            np.full((extra, model.no_components), grad_init, dtype=np.float32)
+        ]))
+        setattr(model, f'{prefix}_embedding_momentum', np.vstack([
+            getattr(model, f'{prefix}_embedding_momentum'),
+            np.zeros((extra, model.no_components), dtype=np.float32)
+        ]))
+        setattr(model, f'{prefix}_biases', np.concatenate([getattr(model, f'{prefix}_biases'), np.zeros(extra, dtype=np.float32)]))
+        setattr(model, f'{prefix}_bias_gradients', np.concatenate([
+            getattr(model, f'{prefix}_bias_gradients'),
+            np.full(extra, grad_init, dtype=np.float32)
+        ]))
+        setattr(model, f'{prefix}_bias_momentum', np.concatenate([getattr(model, f'{prefix}_bias_momentum'), np.zeros(extra, dtype=np.float32)]))
+
+def _merge_feature_matrix(old: csr_matrix, built: csr_matrix, replace_rows: set) -> csr_matrix:
+    # 기존 행렬을 새 shape로 늘리고, 갱신된 행만 새로 만든 행렬의 행으로 교체
+    old = old.tocsr(copy=True)
+    old.resize(built.shape)
+    mask = np.zeros(built.shape[0], dtype=np.float32)
+    mask[list(replace_rows)] = 1.0
+    return (diags(1.0 - mask) @ old + diags(mask) @ built).tocsr()
+
+def partial_fit_model(
+    model_version: ModelVersion,
+    user_features: List[Union[int, str]],
+    item_features: List[Union[int, str]],
+    user_item_interactions: List[Union[int, str]],
+    version: str,
+    epochs: int = 5,
+    num_threads: int = 1
+) -> ModelVersion:
+    """
+    새 interaction만으로 fit_partial을 수행한 새 ModelVersion을 만듭니다.
+    기존 버전은 그대로 두고 (copy-on-write), mapping은 필요한 만큼 확장합니다.
+
+    :param model_version: 현재 서빙 중인 버전.
+    :param user_features: 갱신된 user의 전체 feature (user_id, feature) 리스트.
+    :param item_features: 갱신된 place의 전체 feature (place_id, feature) 리스트.
+    :param user_item_interactions: 새 (user_id, place_id, weight) 리스트.
+    :param version: 새 버전 이름.
+    :param epochs: fit_partial epoch 수.
+    :return: 증분 학습된 ModelVersion.
+    """
+    user_res = _group_features(user_features)
+    item_res = _group_features(item_features)
+
+    new_dataset = copy.deepcopy(model_version.dataset)
+    old_users = new_dataset.interactions_shape()[0]
+    old_items = new_dataset.interactions_shape()[1]
+    new_dataset.fit_partial(
+        users={user_id for user_id, _ in user_res} | {row[0] for row in user_item_interactions},
+        items={item_id for item_id, _ in item_res} | {row[1] for row in user_item_interactions},
+        user_features={feature for _, features in user_res for feature in features},
+        item_features={feature for _, features in item_res for feature in features}
+    )
+    user_id_map, _, item_id_map, _ = new_dataset.mapping()
+
+    user_feature_matrix = _merge_feature_matrix(
+        model_version.user_feature_matrix,
+        new_dataset.build_user_features(user_res),
+        {user_id_map[user_id] for user_id, _ in user_res} | set(range(old_users, len(user_id_map)))
+    )
+    item_feature_matrix = _merge_feature_matrix(
+        model_version.item_feature_matrix,
+        new_dataset.build_item_features(item_res),
+        {item_id_map[item_id] for item_id, _ in item_res} | set(range(old_items, len(item_id_map)))
+    )
+
+    model = copy.deepcopy(model_version.model)
+    _expand_embeddings(model, user_feature_matrix.shape[1], item_feature_matrix.shape[1])
+
+    user_item_interactions = sorted(user_item_interactions, key=lambda x: (x[0], x[1]))
+    (interactions, weights_matrix) = new_dataset.build_interactions(user_item_interactions)
+    model.fit_partial(
         interactions=interactions,
         sample_weight=weights_matrix,
         user_features=user_feature_matrix,
         item_features=item_feature_matrix,
-        epochs=30
-        # num_threads=2 # aws core 수를 모름
+        epochs=epochs,
+        num_threads=num_threads
     )
-    # print("interactions\n", interactions)
-    # print("weights_matrix\n", weights_matrix)
-    # print("user_feature_matrix\n", user_feature_matrix)
-    # print("item_feature_matrix\n", item_feature_matrix)
-    # print('\n\n\n\n')
 
-    ret_list = []
-    no_matching_item = []
-    for user_id, place_ids in zip(user_id_list, place_ids_list):
-        user_internal_id = dataset.mapping()[0][user_id]
-        item_internal_id = []
-        new_place_ids = []
-        for item in place_ids:
-            try:
-                item_internal_id.append(dataset.mapping()[2][item])
-                new_place_ids.append(item)
-            except KeyError:
-                no_matching_item.append(item)
-        item_internal_id = np.array(item_internal_id)
-
-        score = model.predict(
-            user_ids=user_internal_id,
-            item_ids=item_internal_id,
-            user_features=user_feature_matrix,
-            item_features=item_feature_matrix
-        )
+    return ModelVersion(
+        version=version,
+        model=model,
+        dataset=new_dataset,
+        user_feature_matrix=user_feature_matrix,
+        item_feature_matrix=item_feature_matrix,
+        trained_at=datetime.datetime.now(),
+        num_interactions=model_version.num_interactions + interactions.nnz,
+        partial_updates=model_version.partial_updates + 1,
+        training_report=model_version.training_report
+    )
 
-        # print("scores user\n", user_internal_id)
-        # print("scores all items\n", item_internal_id)
-        # print("scores user_features\n", user_feature_matrix)
-        # print("scores item_features\n", item_feature_matrix)
+def partial_fit_payload(
+    model_version: ModelVersion,
+    payload: TrainingPayload,
+    version: str,
+    epochs: int,
+    num_threads: int = 1
+) -> ModelVersion:
+    # 증분 학습 작업. 현재 모델 전체가 필요하므로 같은 프로세스 (compute_executor.run_local)에서 실행
+    return partial_fit_model(model_version, *payload.unpack(), version=version, epochs=epochs, num_threads=num_threads)
 
-        # print("user_id\n", user_id)
-        # print("score\n\n",score)
+def _rank_order(scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    # 점수 내림차순 index. top_k가 작으면 argpartition으로 상위 k개만 정렬
+    if top_k is not None and top_k < len(scores):
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return top[np.argsort(-scores[top], kind='stable')]
+    return np.argsort(-scores, kind='stable')
 
-        scores_df = pd.DataFrame({
-            'item_id': list(new_place_ids),
-            'score': list(score)
-        })
+def rank_known(
+    model_version: Optional[ServingModel],
+    user_id_list: List[int],
+    place_ids_list: List[List[int]],
+    top_k: Optional[int] = None
+) -> List[Optional[List[int]]]:
+    """
+    user마다 모델이 아는 place만 점수순으로 정렬해서 반환합니다.
+    모든 user(/popular에서는 tag) x 후보 place 점수를 한 번의 행렬곱으로 계산합니다.
+    모델이 없거나 모델이 모르는 user는 None입니다.
 
-        scores_df = scores_df.sort_values(by='score', ascending=False)
-        recommend_place_ids = scores_df['item_id'].tolist()
-        if no_matching_item:
-            recommend_place_ids += no_matching_item
-        recommend_place_ids = list(map(str, recommend_place_ids))
+    :param top_k: 지정하면 user마다 상위 top_k개만 반환합니다.
+    """
+    if model_version is None:
+        return [None] * len(user_id_list)
+
+    user_internal_ids = model_version.user_indices(user_id_list)
+    known_users = user_internal_ids >= 0
 
-        # print("recommend_place_ids\n\n", recommend_place_ids)
+    # 전체 후보 place를 한 번에 조회
+    candidates = list(dict.fromkeys(place_id for place_ids in place_ids_list for place_id in place_ids))
+    item_internal_ids = model_version.item_indices(candidates)
+    known_items = item_internal_ids >= 0
+    column = {place_id: col for col, place_id in enumerate(np.array(candidates, dtype=np.int64)[known_items].tolist())}
 
+    scores = None
+    if known_users.any() and known_items.any():
+        scores = model_version.score_matrix(user_internal_ids[known_users], item_internal_ids[known_items])
+    score_row = np.cumsum(known_users) - 1
+
+    ret_list = []
+    for idx, place_ids in enumerate(place_ids_list):
+        if not known_users[idx]:
+            ret_list.append(None)
+            continue
+
+        new_place_ids = list(dict.fromkeys(place_id for place_id in place_ids if place_id in column))
+        recommend_place_ids = []
+        if new_place_ids:
+            row = scores[score_row[idx], [column[place_id] for place_id in new_place_ids]]
+            recommend_place_ids = [new_place_ids[order] for order in _rank_order(row, top_k)]
         ret_list.append(recommend_place_ids)
-    user_id_list = list(map(str, user_id_list))
-    
 
-    return user_id_list, ret_list
\ No newline at end of file
+    return ret_list
+
+def merge_ranking(
+    ranked_place_ids: Optional[List[int]],
+    place_ids: List[int],
+    top_k: Optional[int] = None
+) -> List[str]:
+    # 정렬된 place 뒤에 모델이 모르는 place를 요청 순서대로 붙인다. (user를 모르면 요청 순서 그대로)
+    ranked_place_ids = ranked_place_ids or []
+    ranked = set(ranked_place_ids)
+    no_matching_item = [place_id for place_id in place_ids if place_id not in ranked]
+    return list(map(str, (ranked_place_ids + no_matching_item)[:top_k]))
+
+def rank_places(
+    model_version: Optional[ServingModel],
+    user_id_list: List[int],
+    place_ids_list: List[List[int]],
+    top_k: Optional[int] = None
+) -> Tuple[List[str], List[List[str]]]:
+    """
+    학습된 모델로 place_ids를 점수순으로 정렬합니다.
+    모델이 없거나 모델이 모르는 user는 입력 순서를 그대로 반환하고,
+    모델이 모르는 place는 뒤에 붙입니다.
+
+    :param top_k: 지정하면 user마다 앞에서부터 top_k개만 반환합니다.
+    """
+    rankings = rank_known(model_version, user_id_list, place_ids_list, top_k)
+    ret_list = [merge_ranking(ranked, place_ids, top_k) for ranked, place_ids in zip(rankings, place_ids_list)]
+    return list(map(str, user_id_list)), ret_list
+
+# ------------------------------
+# 모델 스냅샷 (.npy/.npz)
+# <directory>/meta.json                       버전 정보
+# <directory>/{user,item}_embeddings.npy      feature embedding (LightFM 파라미터)
+# <directory>/{user,item}_biases.npy
+# <directory>/{user,item}_repr.npy            id별 representation (서빙용)
+# <directory>/{user,item}_repr_biases.npy
+# <directory>/{user,item}_ids.npy             정렬된 외부 id
+# <directory>/{user,item}_rows.npy            정렬된 외부 id의 내부 index
+# <directory>/feature_mapping.npz             feature 이름 테이블
+
+_SNAPSHOT_ARRAYS = (
+    'user_ids', 'user_rows', 'item_ids', 'item_rows',
+    'user_repr', 'user_repr_biases', 'item_repr', 'item_repr_biases'
+)
+
+def _sorted_id_table(id_map: dict) -> Tuple[np.ndarray, np.ndarray]:
+    ids = np.array(list(id_map.keys()), dtype=np.int64)
+    rows = np.array(list(id_map.values()), dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    return ids[order], rows[order]
+
+def _feature_table(feature_map: dict) -> np.ndarray:
+    names = [''] * len(feature_map)
+    for name, idx in feature_map.items():
+        names[idx] = str(name)
+    return np.array(names, dtype=str)
+
+def save_snapshot(model_version: ModelVersion, directory: str) -> None:
+    """
+    ModelVersion을 mmap으로 읽을 수 있는 .npy/.npz 파일로 저장합니다.
+
+    :param model_version: 저장할 모델 버전.
+    :param directory: 저장할 디렉토리. 없으면 생성합니다.
+    """
+    os.makedirs(directory, exist_ok=True)
+    user_id_map, user_feature_map, item_id_map, item_feature_map = model_version.dataset.mapping()
+    model = model_version.model
+
+    user_repr_biases, user_repr = model.get_user_representations(model_version.user_feature_matrix)
+    item_repr_biases, item_repr = model.get_item_representations(model_version.item_feature_matrix)
+    user_ids, user_rows = _sorted_id_table(user_id_map)
+    item_ids, item_rows = _sorted_id_table(item_id_map)
+
+    float_arrays = {
+        'user_embeddings': model.user_embeddings,
+        'user_biases': model.user_biases,
+        'item_embeddings': model.item_embeddings,
+        'item_biases': model.item_biases,
+        'user_repr': user_repr,
+        'user_repr_biases': user_repr_biases,
+        'item_repr': item_repr,
+        'item_repr_biases': item_repr_biases,
+    }
+    id_arrays = {
+        'user_ids': user_ids,
+        'user_rows': user_rows,
+        'item_ids': item_ids,
+        'item_rows': item_rows,
+    }
+    for name, array in float_arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array, dtype=np.float32))
+    for name, array in id_arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array, dtype=np.int64))
+    np.savez(
+        os.path.join(directory, 'feature_mapping.npz'),
+        user_features=_feature_table(user_feature_map),
+        item_features=_feature_table(item_feature_map)
+    )
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({
+            'version': model_version.version,
+            'trained_at': model_version.trained_at.isoformat(),
+            'num_interactions': model_version.num_interactions,
+            'partial_updates': model_version.partial_updates,
+            'no_components': model.no_components,
+        }, f)
+
+def load_snapshot(directory: str) -> SnapshotVersion:
+    """
+    save_snapshot으로 저장된 스냅샷을 mmap_mode='r'로 읽습니다.
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in _SNAPSHOT_ARRAYS}
+    return SnapshotVersion(
+        version=meta['version'],
+        trained_at=datetime.datetime.fromisoformat(meta['trained_at']),
+        num_interactions=meta['num_interactions'],
+        partial_updates=meta['partial_updates'],
+        **arrays
+    )
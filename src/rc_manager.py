@@ -0,0 +1,533 @@
+# rc_manager.py
+
+import asyncio
+import datetime
+import fcntl
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import REC_TRAIN_INTERVAL, REC_EPOCHS, REC_NO_COMPONENTS, REC_PARTIAL_INTERVAL, REC_PARTIAL_EPOCHS, REC_PARTIAL_MAX_UPDATES, REC_SNAPSHOT_DIR, REC_SNAPSHOT_POLL, REC_SNAPSHOT_KEEP, REC_TASK_TIMEOUT, REC_TRAIN_TIMEOUT, REC_TRAIN_THREADS, REC_VALIDATION_FRACTION, REC_EARLY_STOP_PATIENCE, REC_REGION_LEVEL
+from db_connect import AsyncSessionLocal, make_full_frame, get_user_info, get_place_info, get_userplace_interactions, get_all_tag_features, get_all_tagplace_interactions, get_tag_users
+from executor import compute_executor, usable_cpu_count
+from retrieval import ItemIndex, build_item_index, retrieve_places
+from rc_graph import ModelVersion, ServingModel, pack_training_data, partial_fit_payload, save_snapshot, load_snapshot, rank_known, merge_ranking
+from rec_tasks import fit_payload, rank_snapshot
+from vdb import sentiment_weight
+from features import user_feature_vocabulary, item_feature_vocabulary, tag_feature_vocabulary
+
+logger = logging.getLogger(__name__)
+
+TrainingData = Tuple[List[Union[int, str]], List[Union[int, str]], List[Union[int, str]]]
+
+@dataclass(frozen=True)
+class ReviewEvent:
+    # /gen_tags 한 번으로 생긴 interaction. tags는 (tagId, sentiment) 리스트
+    user_id: int
+    place_id: int
+    tags: Tuple[Tuple[int, int], ...]
+
+def train_threads() -> int:
+    return REC_TRAIN_THREADS or usable_cpu_count()
+
+class ModelManager:
+    """
+    추천 모델을 주기적으로(또는 요청 시) 전체 데이터로 학습하고,
+    학습이 끝난 ModelVersion을 참조 교체로 원자적으로 서빙에 반영한다.
+    엔드포인트는 current로 얻은 버전에 대해 predict만 수행한다.
+
+    REC_SNAPSHOT_DIR이 설정되어 있으면 학습 담당(trainer) worker 하나만 학습하고
+    새 버전을 스냅샷으로 저장하며, 나머지 worker(reader)는 스냅샷을 mmap으로 따라간다.
+    """
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[AsyncSession], Awaitable[TrainingData]],
+        update_loader: Callable[[AsyncSession, List[ReviewEvent]], Awaitable[TrainingData]],
+        user_vocabulary: List[str],
+        item_vocabulary: List[str],
+        interval: int = REC_TRAIN_INTERVAL
+    ):
+        self.name = name
+        self._user_vocabulary = tuple(user_vocabulary)
+        self._item_vocabulary = tuple(item_vocabulary)
+        self._loader = loader
+        self._update_loader = update_loader
+        self._interval = interval
+        self._pending: List[ReviewEvent] = []
+        self._partial_task: Optional[asyncio.Task] = None
+        self._current: Optional[ServingModel] = None
+        self._snapshot_dir = os.path.join(REC_SNAPSHOT_DIR, name) if REC_SNAPSHOT_DIR else None
+        self._is_trainer = True
+        self._index: Optional[ItemIndex] = None
+        # 교체된 버전 중 아직 (진행 중인 요청 등에서) 참조가 남아 있는 것. 참조가 끊기면 자동으로 빠진다.
+        self._retired = weakref.WeakValueDictionary()
+        self._swap_listeners: List[Callable[[ServingModel], None]] = []
+        self._index_lock = asyncio.Lock()
+        self._seq = itertools.count(1)
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[ServingModel]:
+        return self._current
+
+    def _replace_current(self, new_version: ServingModel) -> None:
+        # 참조 교체 (요청 처리 중인 이전 버전은 그대로 끝까지 사용되고, 끝나면 GC된다)
+        old_version, self._current = self._current, new_version
+        if old_version is not None:
+            self._retired[old_version.version] = old_version
+        # 이전 버전의 검색 인덱스도 같이 놓는다 (다음 retrieve에서 새로 생성)
+        self._index = None
+        for listener in self._swap_listeners:
+            listener(new_version)
+
+    def add_swap_listener(self, listener: Callable[[ServingModel], None]) -> None:
+        """
+        새 버전이 교체될 때마다 호출할 함수를 등록합니다 (캐시 무효화 등).
+        """
+        self._swap_listeners.append(listener)
+
+    async def _swap(self, new_version: ModelVersion) -> None:
+        # 스냅샷을 먼저 쓰고 참조 교체
+        if self._snapshot_dir:
+            await asyncio.to_thread(self._publish, new_version)
+        self._replace_current(new_version)
+
+    def _snapshot_path(self, model_version: ServingModel) -> Optional[str]:
+        if not self._snapshot_dir:
+            return None
+        return os.path.join(self._snapshot_dir, model_version.version)
+
+    async def rank_known(
+        self,
+        user_id_list: List[int],
+        place_ids_list: List[List[int]],
+        top_k: Optional[int] = None
+    ) -> Tuple[Optional[str], List[Optional[List[int]]]]:
+        """
+        현재 버전으로 모델이 아는 place만 정렬합니다 (rc_graph.rank_known). 연산은 compute_executor에서 실행됩니다.
+
+        :return: (모델 버전, user별 정렬된 place id 리스트 또는 None)
+        """
+        current = self._current
+        if current is None:
+            return None, [None] * len(user_id_list)
+
+        snapshot_path = self._snapshot_path(current)
+        if compute_executor.kind == "process" and snapshot_path:
+            # process pool에는 모델 대신 스냅샷 경로만 넘긴다.
+            try:
+                rankings = await compute_executor.run(rank_snapshot, snapshot_path, user_id_list, place_ids_list, top_k)
+            except FileNotFoundError:
+                # 이미 정리된 스냅샷: 이 프로세스가 들고 있는 버전으로 계산
+                logger.warning(f"[{self.name}] snapshot {snapshot_path} is gone, ranking in-process")
+                rankings = await compute_executor.run_local(rank_known, current, user_id_list, place_ids_list, top_k)
+        else:
+            rankings = await compute_executor.run_local(rank_known, current, user_id_list, place_ids_list, top_k)
+        return current.version, rankings
+
+    async def rank(
+        self,
+        user_id_list: List[int],
+        place_ids_list: List[List[int]],
+        top_k: Optional[int] = None
+    ) -> Tuple[Optional[str], List[str], List[List[str]]]:
+        """
+        현재 버전으로 place_ids를 정렬합니다. 모델이 모르는 place는 요청 순서대로 뒤에 붙습니다.
+
+        :return: (모델 버전, user id 리스트, 정렬된 place id 리스트)
+        """
+        version, rankings = await self.rank_known(user_id_list, place_ids_list, top_k)
+        cafe_list = [merge_ranking(ranked, place_ids, top_k) for ranked, place_ids in zip(rankings, place_ids_list)]
+        return version, list(map(str, user_id_list)), cafe_list
+
+    def _publish(self, model_version: ModelVersion) -> None:
+        # 임시 디렉토리에 저장한 뒤 rename, CURRENT 포인터도 rename으로 교체
+        target = os.path.join(self._snapshot_dir, model_version.version)
+        tmp = f"{target}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        save_snapshot(model_version, tmp)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+
+        pointer = os.path.join(self._snapshot_dir, "CURRENT")
+        with open(f"{pointer}.tmp", "w") as f:
+            f.write(model_version.version)
+        os.replace(f"{pointer}.tmp", pointer)
+
+        # 오래된 스냅샷 정리 (이미 mmap한 reader는 unlink 후에도 계속 읽을 수 있음)
+        # process pool 작업은 경로만 들고 있다가 나중에 읽으므로, 다음 버전으로 교체된 뒤
+        # 작업 timeout의 두 배가 지나기 전까지는 (REC_SNAPSHOT_KEEP를 넘어도) 지우지 않는다.
+        versions = sorted(
+            ((entry.stat().st_mtime, entry.name, entry.path) for entry in os.scandir(self._snapshot_dir)
+             if entry.is_dir() and not entry.name.endswith(".tmp")),
+            reverse=True
+        )
+        grace_deadline = time.time() - 2 * REC_TASK_TIMEOUT
+        for (replaced_at, _, _), (_, name, path) in zip(versions[REC_SNAPSHOT_KEEP - 1:], versions[REC_SNAPSHOT_KEEP:]):
+            if name != model_version.version and replaced_at < grace_deadline:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _read_pointer(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self._snapshot_dir, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    async def load_latest_snapshot(self) -> Optional[ServingModel]:
+        """
+        CURRENT가 가리키는 스냅샷이 지금 서빙 중인 버전과 다르면 mmap으로 읽어 교체합니다.
+        """
+        if not self._snapshot_dir:
+            return self._current
+        version = self._read_pointer()
+        if version is None or (self._current is not None and self._current.version == version):
+            return self._current
+        snapshot = await asyncio.to_thread(load_snapshot, os.path.join(self._snapshot_dir, version))
+        self._replace_current(snapshot)
+        logger.info(f"[{self.name}] loaded snapshot {version}")
+        return snapshot
+
+    async def _follow(self) -> None:
+        while True:
+            try:
+                await self.load_latest_snapshot()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[{self.name}] snapshot load failed: {e}")
+            await asyncio.sleep(REC_SNAPSHOT_POLL)
+
+    async def _item_index(self, model_version: ServingModel) -> ItemIndex:
+        # 버전마다 한 번만 만든다. 이전 버전 인덱스는 참조가 끊기면서 정리됨
+        index = self._index
+        if index is not None and index.version == model_version.version:
+            return index
+        async with self._index_lock:
+            if self._index is None or self._index.version != model_version.version:
+                self._index = await compute_executor.run_local(build_item_index, model_version, timeout=REC_TRAIN_TIMEOUT)
+            return self._index
+
+    async def retrieve(
+        self,
+        user_id: int,
+        k: int,
+        exclude_place_ids: Optional[List[int]] = None
+    ) -> Tuple[Optional[str], List[int]]:
+        """
+        요청 place_ids 없이 모델이 아는 전체 place 중 상위 k개를 반환합니다.
+
+        :return: (모델 버전, place id 리스트)
+        """
+        current = self._current
+        if current is None:
+            return None, []
+        index = await self._item_index(current)
+        place_ids = await compute_executor.run_local(retrieve_places, current, index, user_id, k, exclude_place_ids)
+        return current.version, place_ids
+
+    async def retrain(self) -> Optional[ModelVersion]:
+        # 학습은 한 번에 하나만 수행
+        async with self._lock:
+            # 여기까지 쌓인 리뷰는 DB에 이미 저장되어 있으므로 이번 전체 학습에 포함된다
+            covered = len(self._pending)
+            async with AsyncSessionLocal() as session:
+                data = await self._loader(session)
+
+            if not data[2]:
+                logger.warning(f"[{self.name}] no interactions, keep current model")
+                return self._current
+
+            version = f"{self.name}-{datetime.datetime.now():%Y%m%d%H%M%S}-{next(self._seq)}"
+            payload = pack_training_data(*data, self._user_vocabulary, self._item_vocabulary)
+            new_version = await compute_executor.run(
+                fit_payload, payload, version, REC_EPOCHS, REC_NO_COMPONENTS,
+                train_threads(), REC_VALIDATION_FRACTION, REC_EARLY_STOP_PATIENCE,
+                timeout=REC_TRAIN_TIMEOUT
+            )
+
+            await self._swap(new_version)
+            del self._pending[:covered]
+            self.last_error = None
+            logger.info(f"[{self.name}] swapped in model {version} ({new_version.num_interactions} interactions, {new_version.training_report})")
+            return new_version
+
+    def enqueue(self, event: ReviewEvent) -> None:
+        # 신규 리뷰는 모아서 REC_PARTIAL_INTERVAL 마다 한 번에 fit_partial
+        self._pending.append(event)
+
+    async def apply_pending(self) -> Optional[ModelVersion]:
+        async with self._lock:
+            current = self._current
+            # 학습된 모델이 아직 없으면 (스냅샷만 서빙 중이어도) 리뷰는 그대로 두고,
+            # 다음 전체 학습이 끝날 때 그 학습에 포함된 만큼 비운다 (retrain)
+            if not self._pending or not isinstance(current, ModelVersion):
+                return current
+            events, self._pending = self._pending, []
+
+            try:
+                async with AsyncSessionLocal() as session:
+                    data = await self._update_loader(session, events)
+
+                version = f"{current.version.split('.p')[0]}.p{current.partial_updates + 1}"
+                payload = pack_training_data(*data)
+                # 현재 모델 전체를 process pool로 pickle하지 않도록 같은 프로세스에서 실행 (fit_partial은 GIL을 놓음)
+                new_version = await compute_executor.run_local(
+                    partial_fit_payload, current, payload, version, REC_PARTIAL_EPOCHS, train_threads(),
+                    timeout=REC_TRAIN_TIMEOUT
+                )
+            except BaseException:
+                # 실패(timeout, 취소 포함)하면 다음 주기에 다시 반영하도록 대기열 앞에 되돌린다
+                self._pending[:0] = events
+                raise
+            await self._swap(new_version)
+            logger.info(f"[{self.name}] applied {len(events)} reviews, swapped in model {version}")
+
+        # 증분 학습이 누적되면 drift를 막기 위해 전체 재학습
+        if new_version.partial_updates >= REC_PARTIAL_MAX_UPDATES:
+            self.trigger()
+        return new_version
+
+    async def _run_partial(self) -> None:
+        while True:
+            await asyncio.sleep(REC_PARTIAL_INTERVAL)
+            try:
+                await self.apply_pending()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[{self.name}] partial update failed: {e}")
+
+    def trigger(self) -> bool:
+        """
+        백그라운드 재학습을 요청합니다. 이미 학습 중이면 무시합니다.
+        """
+        if self._lock.locked():
+            return False
+        asyncio.create_task(self._retrain_safely())
+        return True
+
+    async def _retrain_safely(self) -> None:
+        try:
+            await self.retrain()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"[{self.name}] training failed: {e}")
+
+    async def _run(self) -> None:
+        # 재시작 시 학습이 끝나기 전까지는 마지막 스냅샷으로 서빙
+        try:
+            await self.load_latest_snapshot()
+        except Exception as e:
+            logger.error(f"[{self.name}] snapshot load failed: {e}")
+        while True:
+            await self._retrain_safely()
+            await asyncio.sleep(self._interval)
+
+    def start(self, is_trainer: bool = True) -> None:
+        self._is_trainer = is_trainer
+        if not is_trainer:
+            # reader는 학습하지 않고 스냅샷만 따라감
+            if self._task is None:
+                self._task = asyncio.create_task(self._follow())
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if self._partial_task is None:
+            self._partial_task = asyncio.create_task(self._run_partial())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._partial_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._partial_task = None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            "name": self.name,
+            "role": "trainer" if self._is_trainer else "reader",
+            "version": current.version if current else None,
+            "trained_at": current.trained_at.isoformat() if current else None,
+            "num_interactions": current.num_interactions if current else 0,
+            "partial_updates": current.partial_updates if current else 0,
+            "pending_reviews": len(self._pending),
+            # 학습된 모델이 없어 증분 학습을 못 하고 다음 전체 학습을 기다리는 리뷰 수
+            "pending_waiting_for_model": 0 if isinstance(current, ModelVersion) else len(self._pending),
+            "training": self._lock.locked(),
+            "last_error": self.last_error,
+            "memory": current.memory_report() if current else None,
+            "training_report": getattr(current, "training_report", None),
+            "retired_alive": list(self._retired.keys()),
+        }
+
+# ------------------------------
+# 학습 데이터 로더
+
+async def load_user_training_data(session: AsyncSession) -> TrainingData:
+    user_list, place_list = await make_full_frame(session)
+    userfeature = await get_user_info(session, user_list)
+    placefeature = await get_place_info(session, place_list)
+    interactions = await get_userplace_interactions(session, user_list, place_list)
+    return userfeature, placefeature, interactions
+
+async def load_tag_training_data(session: AsyncSession) -> TrainingData:
+    _, place_list = await make_full_frame(session)
+    tagfeature = await get_all_tag_features(session)
+    placefeature = await get_place_info(session, place_list)
+    interactions = await get_all_tagplace_interactions(session)
+    return tagfeature, placefeature, interactions
+
+async def load_user_update_data(session: AsyncSession, events: List[ReviewEvent]) -> TrainingData:
+    # 리뷰 하나의 (user, place) score는 태그 sentiment 가중치의 합 (get_userplace_interactions와 동일)
+    scores = defaultdict(float)
+    for event in events:
+        for _, sentiment in event.tags:
+            scores[(event.user_id, event.place_id)] += sentiment_weight(sentiment)
+    userfeature = await get_user_info(session, list({event.user_id for event in events}))
+    placefeature = await get_place_info(session, list({event.place_id for event in events}))
+    interactions = [(user_id, place_id, score) for (user_id, place_id), score in scores.items()]
+    return userfeature, placefeature, interactions
+
+async def load_tag_update_data(session: AsyncSession, events: List[ReviewEvent]) -> TrainingData:
+    # tag - place score는 사용 횟수 (get_all_tagplace_interactions와 동일)
+    counts = defaultdict(int)
+    for event in events:
+        for tag_id, _ in event.tags:
+            counts[(tag_id, event.place_id)] += 1
+    tagfeature = await get_tag_users(session, list({tag_id for tag_id, _ in counts}))
+    placefeature = await get_place_info(session, list({event.place_id for event in events}))
+    interactions = [[tag_id, place_id, count] for (tag_id, place_id), count in counts.items()]
+    return tagfeature, placefeature, interactions
+
+# /get_recs/ai : user - place 모델
+user_model_manager = ModelManager(
+    "ai", load_user_training_data, load_user_update_data,
+    user_vocabulary=user_feature_vocabulary(), item_vocabulary=item_feature_vocabulary()
+)
+# /get_recs/popular : tag - place 모델
+tag_model_manager = ModelManager(
+    "popular", load_tag_training_data, load_tag_update_data,
+    user_vocabulary=tag_feature_vocabulary(), item_vocabulary=item_feature_vocabulary()
+)
+
+_trainer_lock_file = None
+
+def _acquire_trainer_lock() -> bool:
+    # 스냅샷 디렉토리의 파일 락을 잡은 worker 하나만 학습을 담당
+    global _trainer_lock_file
+    if not REC_SNAPSHOT_DIR:
+        return True
+    if _trainer_lock_file is not None:
+        return True
+    os.makedirs(REC_SNAPSHOT_DIR, exist_ok=True)
+    lock_file = open(os.path.join(REC_SNAPSHOT_DIR, "trainer.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _trainer_lock_file = lock_file
+    return True
+
+def _event_dir() -> str:
+    return os.path.join(REC_SNAPSHOT_DIR, "events")
+
+def _spool_event(event: ReviewEvent) -> None:
+    # reader worker에서 들어온 리뷰는 파일로 남겨 trainer가 가져가게 한다.
+    os.makedirs(_event_dir(), exist_ok=True)
+    path = os.path.join(_event_dir(), f"{datetime.datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"user_id": event.user_id, "place_id": event.place_id, "tags": event.tags}, f)
+    os.replace(f"{path}.tmp", path)
+
+def _read_spooled_events() -> List[ReviewEvent]:
+    events = []
+    if not os.path.isdir(_event_dir()):
+        return events
+    for name in sorted(os.listdir(_event_dir())):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(_event_dir(), name)
+        with open(path) as f:
+            data = json.load(f)
+        os.remove(path)
+        events.append(ReviewEvent(user_id=data["user_id"], place_id=data["place_id"], tags=tuple(tuple(tag) for tag in data["tags"])))
+    return events
+
+async def _drain_spooled_events() -> None:
+    while True:
+        try:
+            for event in await asyncio.to_thread(_read_spooled_events):
+                _enqueue(event)
+        except Exception as e:
+            logger.error(f"spooled review read failed: {e}")
+        await asyncio.sleep(REC_PARTIAL_INTERVAL)
+
+_is_trainer = True
+_drain_task: Optional[asyncio.Task] = None
+# 리뷰를 받을 모델 (지역별 모델 등은 add_review_listener로 추가)
+_review_listeners: List[Callable[[ReviewEvent], None]] = [tag_model_manager.enqueue]
+if not REC_REGION_LEVEL:
+    _review_listeners.append(user_model_manager.enqueue)
+
+def add_review_listener(listener: Callable[[ReviewEvent], None]) -> None:
+    _review_listeners.append(listener)
+
+def is_trainer() -> bool:
+    return _is_trainer
+
+def _enqueue(event: ReviewEvent) -> None:
+    for listener in _review_listeners:
+        listener(event)
+
+def record_review(user_id: int, place_id: int, tags: List[Tuple[int, int]]) -> None:
+    """
+    /gen_tags로 저장된 리뷰를 추천 모델의 증분 학습 대기열에 넣습니다.
+    trainer가 아닌 worker에서는 스냅샷 디렉토리에 남겨 trainer로 전달합니다.
+
+    :param user_id: 리뷰 작성자 ID.
+    :param place_id: 장소 ID.
+    :param tags: (tagId, sentiment) 리스트. sentiment는 1/0/-1.
+    """
+    if not tags:
+        return
+    event = ReviewEvent(user_id=user_id, place_id=place_id, tags=tuple(tags))
+    if not _is_trainer:
+        _spool_event(event)
+        return
+    _enqueue(event)
+
+def start_model_managers() -> None:
+    global _is_trainer, _drain_task
+    _is_trainer = _acquire_trainer_lock()
+    # 지역별 모델을 쓰면 전체 user 모델은 학습하지 않는다 (partition.py)
+    if not REC_REGION_LEVEL:
+        user_model_manager.start(_is_trainer)
+    tag_model_manager.start(_is_trainer)
+    if _is_trainer and REC_SNAPSHOT_DIR and _drain_task is None:
+        _drain_task = asyncio.create_task(_drain_spooled_events())
+
+async def stop_model_managers() -> None:
+    global _drain_task
+    if _drain_task is not None:
+        _drain_task.cancel()
+        _drain_task = None
+    await user_model_manager.stop()
+    await tag_model_manager.stop()
@@ -1,76 +1,224 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
-from typing import List, Optional
-from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, HTTPException
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 
-from db_connect import get_db_session, get_tag_feature, get_tagplace_interactions, make_frame, get_user_info, get_place_info, get_userplace_interactions, get_top_tags, get_top_tags_vdb
-from rc_graph import recommend_cafe
-from vdb import get_best_tags
+from executor import ComputeQueueFull, ComputeTimeout
+from rc_manager import ModelManager, user_model_manager, tag_model_manager
+from rc_graph import merge_ranking
+from rec_cache import recommendation_cache, normalize_place_ids
+from popular import popular_rankings
+from singleflight import SingleFlight
+from geo import place_geo_index
+from cold_start import cold_start_rankings
+from similar import similar_places
+from partition import regional_models, RegionNotServed
+from config import REC_GEO_DEFAULT_RADIUS, REC_GEO_MAX_RADIUS
 
 # 장소 추천 라우터
 recommendation_router = APIRouter(prefix="/get_recs", tags=["Place Recommendation"])
 
+# /ai 동시 요청 합치기
+ai_flight = SingleFlight("ai")
+
+# 새 모델 버전이 교체되면 /ai 결과 캐시 비우기
+user_model_manager.add_swap_listener(lambda model_version: recommendation_cache.clear())
+regional_models.add_swap_listener(lambda model_version: recommendation_cache.clear())
+
 # 추천 알고리즘 함수
 # 장소 추천 요청 및 응답 모델
 class Rec_Request(BaseModel):
     user_id: int
-    place_ids: List[int]
+    place_ids: List[int] = []  # 비어 있으면 x, y, radius로 주변 place를 후보로 사용
+    top_k: Optional[int] = Field(None, ge=1)  # 지정하면 상위 top_k개만 반환
+    x: Optional[float] = None  # 경도
+    y: Optional[float] = None  # 위도
+    radius: float = REC_GEO_DEFAULT_RADIUS  # m
+
+class Retrieve_Request(BaseModel):
+    user_id: int
+    k: int = Field(20, ge=1)
+    exclude_place_ids: List[int] = []
+    region: Optional[str] = None  # 지역별 모델을 쓰는 경우 필수 (GET /get_recs/partitions)
+
+class Similar_Request(BaseModel):
+    place_id: int
+    n: int = Field(10, ge=1)
+    exclude_place_ids: List[int] = []
+
+class Similar_Response(BaseModel):
+    place_id: int
+    cafe_list: List[int]
+    scores: List[float]
+    version: Optional[str] = None
 
 class Rec_Response_AI(BaseModel):
     cafe_list: List[int]
+    model_version: Optional[str] = None
 
 class Rec_Response_Popular(BaseModel):
     hashtags: List[str]
     cafe_list: List[List[str]]
+    model_version: Optional[str] = None
+
+class Model_Status(BaseModel):
+    name: str
+    role: str = "trainer"
+    version: Optional[str] = None
+    trained_at: Optional[str] = None
+    num_interactions: int = 0
+    partial_updates: int = 0
+    pending_reviews: int = 0
+    training: bool = False
+    last_error: Optional[str] = None
+    memory: Optional[Dict[str, Optional[int]]] = None  # 버전별 shape, heap/mmap 메모리
+    training_report: Optional[Dict[str, Optional[float]]] = None  # 학습 thread 수, epoch, 검증 AUC, 학습 시간
+    retired_alive: List[str] = []  # 교체됐지만 아직 참조가 남은 버전
+
+class Model_Status_Response(BaseModel):
+    models: List[Model_Status]
+
+async def candidate_place_ids(request: Rec_Request) -> List[int]:
+    # place_ids가 없으면 위치 기준 반경 안의 place를 가까운 순으로 후보로 사용
+    if request.place_ids:
+        return request.place_ids
+    if request.x is None or request.y is None:
+        raise HTTPException(status_code=400, detail="place_ids or x, y is required")
+    if not 0 < request.radius <= REC_GEO_MAX_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be in (0, {REC_GEO_MAX_RADIUS}]")
+    try:
+        geo = await place_geo_index.get()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Place index not ready: {e}")
+    return geo.nearby(request.x, request.y, request.radius)
+
+def ai_model_manager(region: Optional[str]) -> Optional[ModelManager]:
+    # 지역별 모델을 쓰면 해당 지역 모델, 아니면 전체 모델
+    if not regional_models.enabled:
+        return user_model_manager
+    try:
+        return regional_models.manager(region)
+    except RegionNotServed as e:
+        # 다른 노드가 맡는 지역. 앞단에서 X-Partition으로 다시 라우팅
+        raise HTTPException(status_code=421, detail=str(e), headers={"X-Partition": str(e.partition)})
 
 # 장소 추천 엔드포인트
 @recommendation_router.post("/ai", response_model=Rec_Response_AI)
 async def get_recommendations(
-    request: Rec_Request,
-    session: AsyncSession = Depends(get_db_session)
+    request: Rec_Request
 ):
-    # hashtags = await get_tag_feature(session, request.user_id, request.place_ids)
-    # print(f"hashtags : {hashtags}")
-    returned_frame = await make_frame(session, request.user_id, request.place_ids)
-    print(returned_frame)
-    userframe = returned_frame[0]
-    placeframe = returned_frame[1]
-
-    userfeature = await get_user_info(session, userframe)
-    print(userfeature)
-    placefeature = await get_place_info(session, placeframe)
-    print(placefeature)
-    interactions = await get_userplace_interactions(session, userframe, placeframe)
-    print(interactions)
-    # print(userframe)
-    # print(placeframe)
-
-    users, cafe_list = await recommend_cafe(userfeature, placefeature, interactions, [request.user_id], [request.place_ids])
-    
-    cafe_list = list(map(int, cafe_list[0]))
-
-    return Rec_Response_AI(cafe_list=cafe_list)
+    # 학습은 rc_manager에서 백그라운드로 수행하고, 요청에서는 현재 버전으로 predict만 한다.
+    # 같은 user, 같은 place 집합, 같은 모델 버전이면 캐시된 순위를 사용 (모르는 place는 요청 순서대로 뒤에 붙임)
+    place_ids = await candidate_place_ids(request)
+    manager = ai_model_manager(regional_models.region_for(place_ids))
+    current = manager.current if manager else None
+    # 모델이 모르거나 리뷰가 적은 user는 모델 대신 미리 계산된 segment 순위 사용
+    if cold_start_rankings.is_cold(request.user_id, current):
+        model_version, cafe_list = await cold_start_rankings.rank(request.user_id, place_ids, request.top_k)
+        return Rec_Response_AI(cafe_list=cafe_list, model_version=model_version)
+
+    place_key = normalize_place_ids(place_ids)
+    cache_key = (request.user_id, place_key, request.top_k, current.version if current else None)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        model_version, ranked = cached
+    else:
+        async def compute():
+            model_version, rankings = await manager.rank_known([request.user_id], [list(place_key)], request.top_k)
+            if model_version is not None:
+                recommendation_cache.set(
+                    (request.user_id, place_key, request.top_k, model_version),
+                    request.user_id,
+                    (model_version, rankings[0])
+                )
+            return model_version, rankings[0]
+
+        # 동시에 들어온 같은 요청은 한 번만 계산
+        try:
+            model_version, ranked = await ai_flight.do(cache_key, compute)
+        except ComputeQueueFull as e:
+            raise HTTPException(status_code=503, detail=f"Recommendation busy: {e}")
+        except ComputeTimeout as e:
+            raise HTTPException(status_code=504, detail=f"Recommendation timeout: {e}")
+
+    cafe_list = list(map(int, merge_ranking(ranked, place_ids, request.top_k)))
+
+    return Rec_Response_AI(cafe_list=cafe_list, model_version=model_version)
 
 @recommendation_router.post("/popular", response_model=Rec_Response_Popular)
 async def get_recommendations(
-    request: Rec_Request,
-    session: AsyncSession = Depends(get_db_session)
+    request: Rec_Request
 ):
-    tagfeature = await get_tag_feature(session, request.user_id, request.place_ids)
-    print("rec.py tagfeature : ",tagfeature)
-    placefeature = await get_place_info(session, request.place_ids)
-    print("rec.py placefeature : ", placefeature)
-    interactions = await get_tagplace_interactions(session, user_id=request.user_id, place_ids=request.place_ids)
-    print("rec.py interactions : ", interactions)
-
-    # 전체
-    best_tags = await get_top_tags_vdb(session)
+    # 전체 인기 해시태그 x place 순위는 popular.py에서 백그라운드로 미리 계산하고, 요청에서는 place_ids로 거르기만 한다.
     # 개인화
     # best_tags = await get_top_tags(session, request.user_id)
-    place_ids_list = [request.place_ids] * len(best_tags)
+    try:
+        popular = await popular_rankings.get()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Popular rankings not ready: {e}")
+    place_ids = await candidate_place_ids(request)
+    tags, cafe_list = popular.filter(place_ids, request.top_k)
+
+    return Rec_Response_Popular(hashtags=tags, cafe_list=cafe_list, model_version=popular.version)
+
+# 전체 place 대상 top-K 추천 (place_ids 없이 후보 생성)
+@recommendation_router.post("/retrieve", response_model=Rec_Response_AI)
+async def retrieve_recommendations(
+    request: Retrieve_Request
+):
+    if regional_models.enabled and request.region is None:
+        raise HTTPException(status_code=400, detail="region is required")
+    manager = ai_model_manager(request.region)
+    if manager is None:
+        return Rec_Response_AI(cafe_list=[], model_version=None)
+    try:
+        model_version, cafe_list = await manager.retrieve(request.user_id, request.k, request.exclude_place_ids)
+    except ComputeQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Recommendation busy: {e}")
+    except ComputeTimeout as e:
+        raise HTTPException(status_code=504, detail=f"Recommendation timeout: {e}")
+
+    return Rec_Response_AI(cafe_list=cafe_list, model_version=model_version)
+
+# 비슷한 place 추천 (미리 계산된 이웃 테이블 조회)
+@recommendation_router.post("/similar", response_model=Similar_Response)
+async def similar_recommendations(
+    request: Similar_Request
+):
+    try:
+        table = await similar_places.get()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Similar places not ready: {e}")
+    neighbours = table.similar(request.place_id, request.n, set(request.exclude_place_ids))
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail=f"Place {request.place_id} has no tags")
+
+    return Similar_Response(
+        place_id=request.place_id,
+        cafe_list=[place_id for place_id, _ in neighbours],
+        scores=[score for _, score in neighbours],
+        version=table.version
+    )
+
+def ai_model_managers() -> List[ModelManager]:
+    return regional_models.managers() if regional_models.enabled else [user_model_manager]
+
+def model_statuses() -> List[dict]:
+    return [manager.status() for manager in ai_model_managers()] + [tag_model_manager.status()]
+
+# 모델 상태 조회
+@recommendation_router.get("/models", response_model=Model_Status_Response)
+async def get_model_status():
+    return Model_Status_Response(models=model_statuses())
 
-    tags, cafe_list = await recommend_cafe(tagfeature, placefeature, interactions, best_tags, place_ids_list)
-    print("rec.py tags : ", tags)
-    print("rec.py cafe_list : ", cafe_list)
+# 모델 재학습 요청 (백그라운드)
+@recommendation_router.post("/models/train", response_model=Model_Status_Response)
+async def train_models():
+    for manager in ai_model_managers():
+        manager.trigger()
+    tag_model_manager.trigger()
+    return Model_Status_Response(models=model_statuses())
 
-    return Rec_Response_Popular(hashtags=tags, cafe_list=cafe_list)
+# 지역 -> 담당 partition (앞단 라우팅용)
+@recommendation_router.get("/partitions")
+async def get_partitions():
+    return {"enabled": regional_models.enabled, "regions": regional_models.partitions()}
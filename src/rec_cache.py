@@ -0,0 +1,86 @@
+# rec_cache.py
+
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from config import REC_CACHE_SIZE, REC_CACHE_TTL
+
+def normalize_place_ids(place_ids: List[int]) -> Tuple[int, ...]:
+    # 순서와 중복에 상관없이 같은 place 집합이면 같은 key
+    return tuple(sorted(set(place_ids)))
+
+class RecommendationCache:
+    """
+    (user, place 집합, 모델 버전, ...) -> 추천 결과 캐시.
+    TTL이 지나거나 max_entries를 넘으면 오래 안 쓴 것부터 지운다 (LRU).
+    user별 key 목록을 따로 들고 있어서 해당 user의 항목만 정확히 지울 수 있다.
+
+    event loop에서만 접근하므로 lock 없이 사용한다.
+    """
+    def __init__(self, max_entries: int = REC_CACHE_SIZE, ttl: float = REC_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._keys_by_user = defaultdict(set)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, user_id, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def set(self, key: Hashable, user_id: int, value: Any) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, user_id, value)
+        self._keys_by_user[user_id].add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        # 새 리뷰를 쓴 user의 항목만 삭제
+        for key in list(self._keys_by_user.get(user_id, ())):
+            self._remove(key)
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        # 새 모델 버전이 교체되면 전체 삭제
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
+
+# /get_recs/ai 결과 캐시
+recommendation_cache = RecommendationCache()
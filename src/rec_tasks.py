@@ -0,0 +1,44 @@
+# rec_tasks.py
+#
+# compute_executor process pool (REC_EXECUTOR=process)에서 실행되는 작업 함수.
+# spawn worker는 이 모듈을 import해서 함수를 찾으므로, 여기서는 rc_graph (numpy/scipy/lightfm)만 import하고
+# DB 엔진, 벡터 디비, LLM graph 같은 부작용이 있는 모듈은 import하지 않는다.
+
+from typing import List, Optional
+
+from rc_graph import ModelVersion, TrainingPayload, build_training_set, train_model, load_snapshot, rank_known
+
+def fit_payload(
+    payload: TrainingPayload,
+    version: str,
+    epochs: int,
+    no_components: int,
+    num_threads: int = 1,
+    validation_fraction: float = 0.0,
+    patience: int = 3
+) -> ModelVersion:
+    # executor에서 실행되는 전체 학습 작업
+    training_set = build_training_set(*payload.unpack(), payload.user_vocabulary, payload.item_vocabulary)
+    return train_model(
+        training_set, version=version, epochs=epochs, no_components=no_components,
+        num_threads=num_threads, validation_fraction=validation_fraction, patience=patience
+    )
+
+# process pool worker에서 스냅샷을 버전마다 한 번만 mmap하도록 캐시
+_snapshot_cache = {}
+
+def rank_snapshot(
+    directory: str,
+    user_id_list: List[int],
+    place_ids_list: List[List[int]],
+    top_k: Optional[int] = None
+) -> List[Optional[List[int]]]:
+    """
+    스냅샷 경로만 받아서 rank_known 결과를 반환합니다. process pool에서 모델을 pickle하지 않고 쓰기 위한 함수입니다.
+    """
+    snapshot = _snapshot_cache.get(directory)
+    if snapshot is None:
+        snapshot = load_snapshot(directory)
+        _snapshot_cache.clear()
+        _snapshot_cache[directory] = snapshot
+    return rank_known(snapshot, user_id_list, place_ids_list, top_k)
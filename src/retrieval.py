@@ -0,0 +1,97 @@
+# retrieval.py
+
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from config import REC_ANN_MIN_ITEMS, REC_ANN_M, REC_ANN_EF
+from rc_graph import ServingModel
+
+logger = logging.getLogger(__name__)
+
+try:
+    # chromadb 의존성으로 설치되는 hnswlib. 없으면 exact 검색만 사용
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+class ItemIndex:
+    """
+    모델 버전 하나의 전체 place representation을 담은 top-K 검색용 인덱스.
+
+    점수는 predict와 같은 user·item + item bias (user bias는 순위에 영향 없음)이고,
+    place 수가 REC_ANN_MIN_ITEMS 이상이면 [item, bias] · [user, 1] 내적 공간의
+    hnswlib 인덱스로 근사 검색한다.
+    """
+    def __init__(self, model_version: ServingModel):
+        self.version = model_version.version
+        self.place_ids, item_biases, item_repr = model_version.item_catalogue()
+        # 스냅샷은 mmap을 그대로 사용하고, 메모리 모델은 연속된 float32 배열로 복사
+        self.item_repr = np.ascontiguousarray(item_repr, dtype=np.float32)
+        self.item_biases = np.ascontiguousarray(item_biases, dtype=np.float32)
+        self._row_of = {place_id: row for row, place_id in enumerate(self.place_ids.tolist())}
+
+        self.ann = None
+        if hnswlib is not None and len(self.place_ids) >= REC_ANN_MIN_ITEMS:
+            dim = self.item_repr.shape[1] + 1
+            self.ann = hnswlib.Index(space='ip', dim=dim)
+            self.ann.init_index(max_elements=len(self.place_ids), M=REC_ANN_M, ef_construction=REC_ANN_EF)
+            self.ann.add_items(np.hstack([self.item_repr, self.item_biases[:, None]]), np.arange(len(self.place_ids)))
+            self.ann.set_ef(REC_ANN_EF)
+
+    def __len__(self) -> int:
+        return len(self.place_ids)
+
+    def top_k(
+        self,
+        user_repr: Optional[np.ndarray],
+        k: int,
+        exclude_place_ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """
+        user representation 기준 상위 k개 place id를 반환합니다.
+
+        :param user_repr: user representation. None이면 item bias(인기도)만으로 정렬합니다.
+        :param k: 반환할 place 수.
+        :param exclude_place_ids: 결과에서 제외할 place id.
+        """
+        exclude_rows = {self._row_of[place_id] for place_id in exclude_place_ids or [] if place_id in self._row_of}
+        k = min(k, len(self) - len(exclude_rows))
+        if k <= 0:
+            return []
+
+        if self.ann is not None and user_repr is not None:
+            query = np.append(np.asarray(user_repr, dtype=np.float32), np.float32(1.0))
+            fetch = min(len(self), k + len(exclude_rows))
+            # 공유 인덱스의 ef는 생성할 때 한 번만 정한다 (hnswlib은 검색 폭으로 max(ef, k)를 쓰므로 요청마다 바꾸지 않음)
+            labels, _ = self.ann.knn_query(query, k=fetch)
+            rows = [row for row in labels[0].tolist() if row not in exclude_rows][:k]
+        else:
+            scores = self.item_biases.copy()
+            if user_repr is not None:
+                scores += self.item_repr @ np.asarray(user_repr, dtype=np.float32)
+            if exclude_rows:
+                scores[list(exclude_rows)] = -np.inf
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows = top[np.argsort(-scores[top], kind='stable')].tolist()
+
+        return self.place_ids[rows].tolist()
+
+def build_item_index(model_version: ServingModel) -> ItemIndex:
+    return ItemIndex(model_version)
+
+def retrieve_places(
+    model_version: ServingModel,
+    index: ItemIndex,
+    user_id: int,
+    k: int,
+    exclude_place_ids: Optional[List[int]] = None
+) -> List[int]:
+    # 모델이 모르는 user는 item bias(인기도) 순으로
+    user_internal_ids = model_version.user_indices([user_id])
+    user_repr = None
+    if user_internal_ids[0] >= 0:
+        _, user_reprs = model_version.user_representations(user_internal_ids)
+        user_repr = np.asarray(user_reprs)[0]
+    return index.top_k(user_repr, k, exclude_place_ids)
@@ -0,0 +1,11 @@
+# run.py
+#
+# 서버 실행 스크립트. compute_executor의 spawn process worker는 실행한 스크립트 (__main__)를 다시 import하므로
+# main.py 대신 이 파일을 실행한다. 여기서는 설정과 uvicorn만 import한다.
+
+import uvicorn
+
+from config import AI_IP, AI_PORT
+
+if __name__ == "__main__":
+    uvicorn.run("main:app", host=AI_IP, port=AI_PORT, reload=True)
@@ -1,6 +1,6 @@
 # schemas.py
 
-from sqlalchemy import Column, BigInteger, Integer, Float, ForeignKey, String, DateTime, Boolean, UniqueConstraint, func
+from sqlalchemy import Column, BigInteger, Integer, SmallInteger, Float, ForeignKey, String, DateTime, Boolean, UniqueConstraint, func
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -109,4 +109,11 @@ class UserActivity(Base):
     userId = Column(BigInteger, ForeignKey('User.id'), primary_key=True)
     activityName = Column(String(100), primary_key=True)
     
-    user = relationship("User", back_populates="user_activities")
\ No newline at end of file
+    user = relationship("User", back_populates="user_activities")
+
+# 태그 sentiment (리뷰 저장 시 한 번 기록, 1/0/-1)
+class TagSentiment(Base):
+    __tablename__ = 'tagSentiment'
+
+    tagId = Column(BigInteger, ForeignKey('Tag.id', ondelete='CASCADE'), primary_key=True)
+    sentiment = Column(SmallInteger, nullable=False)
@@ -0,0 +1,328 @@
+# similar.py
+
+import asyncio
+import datetime
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from config import REC_SIMILAR_REFRESH, REC_SIMILAR_FULL_REBUILD, REC_SIMILAR_TOP_N, REC_SIMILAR_CHUNK, REC_SIMILAR_REPRESENTATIVE_BOOST, REC_SIMILAR_EMBEDDING_WEIGHT
+from db_connect import AsyncSessionLocal, get_place_tag_profiles
+from rc_graph import ServingModel
+from rc_manager import user_model_manager
+from partition import regional_models
+
+logger = logging.getLogger(__name__)
+
+# place id -> ((이웃 place id, 유사도), ...) 유사도 내림차순
+Neighbours = Tuple[Tuple[int, float], ...]
+# place id -> {tag id: 가중치 tagCount (대표 tag는 REC_SIMILAR_REPRESENTATIVE_BOOST배)}
+Profiles = Dict[int, Dict[int, float]]
+
+def tag_profiles(rows: List[Tuple[int, int, int, bool]]) -> Profiles:
+    profiles: Profiles = defaultdict(dict)
+    for place_id, tag_id, tag_count, is_representative in rows:
+        weight = float(tag_count or 0) * (REC_SIMILAR_REPRESENTATIVE_BOOST if is_representative else 1.0)
+        if weight > 0:
+            profiles[place_id][tag_id] = weight
+    return dict(profiles)
+
+def inverse_document_frequency(profiles: Profiles) -> Dict[int, float]:
+    document_frequency = defaultdict(int)
+    for tags in profiles.values():
+        for tag_id in tags:
+            document_frequency[tag_id] += 1
+    num_places = len(profiles)
+    return {tag_id: math.log((1 + num_places) / (1 + df)) + 1.0 for tag_id, df in document_frequency.items()}
+
+def tfidf_matrix(place_ids: List[int], profiles: Profiles, idf: Dict[int, float], tag_columns: Dict[int, int]) -> csr_matrix:
+    """
+    place x tag TF-IDF 행렬을 만들고 행을 L2 정규화합니다. (행끼리 내적 = 코사인 유사도)
+    idf에 없는 (마지막 전체 재계산 이후 생긴) tag는 가장 희귀한 tag로 취급하고 tag_columns에 열을 추가합니다.
+    """
+    default_idf = max(idf.values(), default=1.0)
+    rows, cols, values = [], [], []
+    for row, place_id in enumerate(place_ids):
+        for tag_id, weight in profiles.get(place_id, {}).items():
+            col = tag_columns.setdefault(tag_id, len(tag_columns))
+            rows.append(row)
+            cols.append(col)
+            values.append(math.log1p(weight) * idf.get(tag_id, default_idf))
+    matrix = csr_matrix((values, (rows, cols)), shape=(len(place_ids), len(tag_columns)), dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return diags(1.0 / norms) @ matrix
+
+def top_neighbours(similarity: csr_matrix, row_place_ids: np.ndarray, col_place_ids: np.ndarray, top_n: int) -> Dict[int, Neighbours]:
+    # 희소 유사도 행렬의 행마다 자기 자신을 빼고 상위 top_n개
+    similarity = similarity.tocsr()
+    table = {}
+    for row, place_id in enumerate(row_place_ids.tolist()):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        neighbour_ids = col_place_ids[similarity.indices[start:end]]
+        scores = similarity.data[start:end]
+        keep = (neighbour_ids != place_id) & (scores > 0)
+        neighbour_ids, scores = neighbour_ids[keep], scores[keep]
+        if len(scores) > top_n:
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+            neighbour_ids, scores = neighbour_ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        table[place_id] = tuple(zip(neighbour_ids[order].tolist(), scores[order].astype(float).tolist()))
+    return table
+
+def blend_embeddings(
+    table: Dict[int, Neighbours],
+    place_ids: List[int],
+    model_version: Optional[ServingModel],
+    weight: float = REC_SIMILAR_EMBEDDING_WEIGHT
+) -> Dict[int, Neighbours]:
+    """
+    tag 유사도 이웃 후보를 LightFM item embedding 코사인 유사도와 섞어 다시 정렬합니다.
+    둘 중 하나라도 모델이 모르는 place 쌍은 tag 유사도를 그대로 사용합니다.
+    """
+    if model_version is None or weight <= 0:
+        return {place_id: table[place_id] for place_id in place_ids if place_id in table}
+
+    catalogue_ids, _, item_repr = model_version.item_catalogue()
+    embeddings = np.asarray(item_repr, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = embeddings / norms
+    row_of = {place_id: row for row, place_id in enumerate(catalogue_ids.tolist())}
+
+    blended = {}
+    for place_id in place_ids:
+        neighbours = table.get(place_id)
+        if neighbours is None:
+            continue
+        row = row_of.get(place_id)
+        if row is None or not neighbours:
+            blended[place_id] = neighbours
+            continue
+        neighbour_ids = [neighbour_id for neighbour_id, _ in neighbours]
+        scores = np.array([score for _, score in neighbours], dtype=np.float32)
+        rows = np.array([row_of.get(neighbour_id, -1) for neighbour_id in neighbour_ids])
+        known = rows >= 0
+        scores[known] = (1 - weight) * scores[known] + weight * (embeddings[rows[known]] @ embeddings[row])
+        order = np.argsort(-scores, kind='stable')
+        blended[place_id] = tuple((neighbour_ids[idx], float(scores[idx])) for idx in order)
+    return blended
+
+@dataclass(frozen=True)
+class SimilarTable:
+    version: str
+    built_at: datetime.datetime
+    neighbours: Dict[int, Neighbours]
+
+    def similar(self, place_id: int, n: int, exclude_place_ids: Set[int] = frozenset()) -> Optional[Neighbours]:
+        # dict 조회 한 번 (place를 모르면 None)
+        neighbours = self.neighbours.get(place_id)
+        if neighbours is None:
+            return None
+        if exclude_place_ids:
+            neighbours = tuple(item for item in neighbours if item[0] not in exclude_place_ids)
+        return neighbours[:n]
+
+class SimilarPlaces:
+    """
+    placeTag TF-IDF 코사인 유사도로 place마다 비슷한 place 상위 REC_SIMILAR_TOP_N개를 미리 계산해 둔다.
+
+    REC_SIMILAR_REFRESH마다 tag 구성이 바뀐 place만 다시 계산하고, 그 place와 유사도가
+    생기거나 없어진 place의 이웃 목록도 고친다. IDF는 REC_SIMILAR_FULL_REBUILD마다
+    전체 재계산할 때만 갱신하고, user 모델이 바뀌면 tag 이웃은 그대로 두고 embedding만 다시 섞는다.
+    지역별 모델 모드 (REC_REGION_LEVEL)에서는 place마다 그 지역 모델의 embedding을 쓰고,
+    이 노드가 맡지 않거나 아직 학습되지 않은 지역의 place는 tag 유사도만 쓴다.
+    """
+    def __init__(self, interval: float = REC_SIMILAR_REFRESH, full_interval: float = REC_SIMILAR_FULL_REBUILD, top_n: int = REC_SIMILAR_TOP_N, chunk: int = REC_SIMILAR_CHUNK):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.top_n = top_n
+        self.chunk = chunk
+        self._current: Optional[SimilarTable] = None
+        self._profiles: Profiles = {}
+        self._idf: Dict[int, float] = {}
+        self._tag_columns: Dict[int, int] = {}
+        self._place_ids: List[int] = []
+        self._matrix: Optional[csr_matrix] = None
+        self._tag_table: Dict[int, Neighbours] = {}  # embedding을 섞기 전 tag 유사도 이웃
+        self._last_full = 0.0
+        self._model_version: tuple = ()  # 마지막으로 섞은 모델 버전 ((지역, 버전), ...)
+        self._embedding_models = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[SimilarTable]:
+        return self._current
+
+    def _rebuild_all(self, profiles: Profiles) -> None:
+        self._profiles = profiles
+        self._idf = inverse_document_frequency(profiles)
+        self._tag_columns = {}
+        self._place_ids = sorted(profiles)
+        self._matrix = tfidf_matrix(self._place_ids, profiles, self._idf, self._tag_columns)
+        ids = np.array(self._place_ids, dtype=np.int64)
+        self._tag_table = self._top_neighbours_rows(ids, ids, list(range(len(ids))))
+
+    def _top_neighbours_rows(self, ids: np.ndarray, row_place_ids: np.ndarray, rows: List[int]) -> Dict[int, Neighbours]:
+        # 전체 N x N 유사도 대신 chunk개 행씩 계산해 행마다 상위 top_n만 남긴다
+        table = {}
+        for start in range(0, len(rows), self.chunk):
+            block = self._matrix[rows[start:start + self.chunk]] @ self._matrix.T
+            table.update(top_neighbours(block, row_place_ids[start:start + self.chunk], ids, self.top_n))
+        return table
+
+    def _rebuild_changed(self, profiles: Profiles, changed: Set[int]) -> Set[int]:
+        # tag 이웃 목록을 고치고 목록이 바뀐 place id를 반환
+        old_ids = np.array(self._place_ids, dtype=np.int64)
+        old_row = {place_id: row for row, place_id in enumerate(self._place_ids)}
+        old_changed = [old_row[place_id] for place_id in changed if place_id in old_row]
+        # 바뀌기 전 벡터로 이 place들과 유사도가 있던 place (목록에서 빼야 할 수 있음)
+        before = self._matrix[old_changed] @ self._matrix.T if old_changed else None
+
+        self._profiles = profiles
+        self._place_ids = sorted(profiles)
+        self._matrix = tfidf_matrix(self._place_ids, profiles, self._idf, self._tag_columns)
+        ids = np.array(self._place_ids, dtype=np.int64)
+        row_of = {place_id: row for row, place_id in enumerate(self._place_ids)}
+        changed_ids = np.array(sorted(place_id for place_id in changed if place_id in row_of), dtype=np.int64)
+        after = self._matrix[[row_of[place_id] for place_id in changed_ids.tolist()]] @ self._matrix.T
+
+        table = {place_id: neighbours for place_id, neighbours in self._tag_table.items() if place_id in row_of}
+        table.update(top_neighbours(after, changed_ids, ids, self.top_n))
+
+        # 바뀐 place와 (전이든 후든) 유사도가 있는 나머지 place의 목록 수정
+        new_scores = defaultdict(dict)
+        after_coo = after.tocoo()
+        for row, col, score in zip(after_coo.row.tolist(), after_coo.col.tolist(), after_coo.data.tolist()):
+            new_scores[int(ids[col])][int(changed_ids[row])] = score
+        affected = set(new_scores)
+        if before is not None:
+            affected.update(int(old_ids[col]) for col in before.tocoo().col.tolist())
+        affected = (affected & row_of.keys()) - changed
+
+        refill = []
+        for place_id in affected:
+            previous = table.get(place_id, ())
+            merged = [item for item in previous if item[0] not in changed]
+            merged += [(neighbour_id, score) for neighbour_id, score in new_scores.get(place_id, {}).items() if score > 0 and neighbour_id != place_id]
+            merged.sort(key=lambda item: -item[1])
+            table[place_id] = tuple(merged[:self.top_n])
+            if len(merged) < self.top_n <= len(previous):
+                # 목록에서 빠진 자리에 들어갈 다음 이웃은 알 수 없으므로 그 행만 다시 계산
+                refill.append(place_id)
+        if refill:
+            refill_ids = np.array(sorted(refill), dtype=np.int64)
+            table.update(self._top_neighbours_rows(ids, refill_ids, [row_of[place_id] for place_id in refill_ids.tolist()]))
+
+        self._tag_table = table
+        return affected | set(changed_ids.tolist())
+
+    @staticmethod
+    def _serving_models() -> Dict[Optional[str], ServingModel]:
+        # embedding을 가져올 모델. 지역별 모델 모드면 지역 -> 지역 모델, 아니면 None -> user 모델
+        if not regional_models.enabled:
+            current = user_model_manager.current
+            return {None: current} if current is not None else {}
+        return {region: manager.current for region, manager in regional_models.served().items() if manager.current is not None}
+
+    def _blend_places(self, place_ids: List[int], models: Dict[Optional[str], ServingModel]) -> Dict[int, Neighbours]:
+        if None in models:
+            return blend_embeddings(self._tag_table, place_ids, models[None])
+        # 모델이 없는 지역의 place는 tag 유사도 그대로
+        blended = blend_embeddings(self._tag_table, place_ids, None)
+        for region, model_version in models.items():
+            in_region = set(regional_models.places_in(region))
+            blended.update(blend_embeddings(self._tag_table, [place_id for place_id in place_ids if place_id in in_region], model_version))
+        return blended
+
+    def _blend(self, updated: Optional[Set[int]], models: Dict[Optional[str], ServingModel]) -> Dict[int, Neighbours]:
+        # updated가 None이면 전체를 다시 섞는다
+        if updated is None or self._current is None:
+            return self._blend_places(self._place_ids, models)
+        neighbours = {place_id: value for place_id, value in self._current.neighbours.items() if place_id in self._tag_table}
+        neighbours.update(self._blend_places(sorted(updated), models))
+        return neighbours
+
+    async def refresh(self) -> SimilarTable:
+        async with self._lock:
+            async with AsyncSessionLocal() as session:
+                profiles = tag_profiles(await get_place_tag_profiles(session))
+            models = self._serving_models()
+            model_key = tuple(sorted((region or "", model_version.version) for region, model_version in models.items()))
+
+            if self._current is None or time.monotonic() - self._last_full >= self.full_interval:
+                await asyncio.to_thread(self._rebuild_all, profiles)
+                self._last_full = time.monotonic()
+                updated = None
+                logger.info(f"[similar] rebuilt {len(self._place_ids)} places")
+            else:
+                changed = {
+                    place_id for place_id in profiles.keys() | self._profiles.keys()
+                    if profiles.get(place_id) != self._profiles.get(place_id)
+                }
+                if not changed and model_key == self._model_version:
+                    return self._current
+                updated = await asyncio.to_thread(self._rebuild_changed, profiles, changed) if changed else set()
+                if model_key != self._model_version:
+                    updated = None
+                logger.info(f"[similar] updated {len(changed)} changed places")
+
+            neighbours = await asyncio.to_thread(self._blend, updated, models)
+            self._model_version = model_key
+            self._embedding_models = len(models)
+            built_at = datetime.datetime.now()
+            self._current = SimilarTable(
+                version=f"similar-{built_at.strftime('%Y%m%d%H%M%S')}",
+                built_at=built_at,
+                neighbours=neighbours,
+            )
+            self.last_error = None
+            return self._current
+
+    async def get(self) -> SimilarTable:
+        if self._current is None:
+            return await self.refresh()
+        return self._current
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"[similar] refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            "version": current.version if current else None,
+            "places": len(current.neighbours) if current else 0,
+            # 섞을 모델이 없으면 (지역별 모델이 아직 학습되지 않은 경우 등) tag 유사도만 사용
+            "embedding_models": self._embedding_models,
+            "embedding_weight_effective": REC_SIMILAR_EMBEDDING_WEIGHT if self._embedding_models else 0.0,
+            "last_error": self.last_error,
+        }
+
+similar_places = SimilarPlaces()
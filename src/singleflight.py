@@ -0,0 +1,68 @@
+# singleflight.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    같은 key로 동시에 들어온 요청은 진행 중인 연산 하나를 같이 기다리고 결과(또는 예외)를 공유한다.
+
+    연산은 별도 task로 실행되므로 기다리던 요청 하나가 취소되어도 나머지 요청에는 영향이 없고,
+    기다리는 요청이 모두 취소되었을 때만 연산도 취소한다.
+    event loop에서만 접근하므로 lock 없이 사용한다.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._executed = 0
+        self._coalesced = 0
+        self._cancelled = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        key에 대해 진행 중인 연산이 있으면 그 결과를 기다리고, 없으면 fn()을 실행합니다.
+
+        :param key: 정규화된 요청 key (같은 결과를 내는 요청은 같은 key).
+        :param fn: 실제 연산 (coroutine function).
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self._executed += 1
+        else:
+            self._coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key) == 1:
+                # 마지막으로 기다리던 요청이 취소되면 연산도 취소
+                task.cancel()
+                self._cancelled += 1
+            raise
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"[{self.name}] {key} failed: {task.exception()}")
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executed": self._executed,
+            "coalesced": self._coalesced,
+            "cancelled": self._cancelled,
+        }
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI, APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
@@ -5,8 +6,10 @@ from typing import List, Optional, Tuple
 from pydantic import BaseModel
 
 from lm_graph import graph
-from db_connect import add_tags_and_place_tags, get_db_session, add_user_tags
-from vdb import tag_valid
+from db_connect import add_tags_and_place_tags, get_db_session, add_user_tags, add_tag_sentiments
+from vdb import normalize_tags
+from rc_manager import record_review
+from rec_cache import recommendation_cache
 
 # 태그 생성 라우터
 tag_router = APIRouter(prefix="/gen_tags", tags=["Tag Generation"])
@@ -61,8 +64,13 @@ async def create_tags(request: Tag_Request, session: AsyncSession = Depends(get_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
     
-    # 벡터 디비 업로드
-    res = tag_valid(positive_res, 1) + tag_valid(neutral_res, 0) + tag_valid(negative_res, -1)
+    # 벡터 디비 업로드 (리뷰의 태그 전체를 한 번에 정규화)
+    tagged = [(tag, 1) for tag in positive_res] + [(tag, 0) for tag in neutral_res] + [(tag, -1) for tag in negative_res]
+    # encode/Chroma 호출은 thread에서 (encode는 다른 요청과 micro-batch로 묶임)
+    normalized = await asyncio.to_thread(normalize_tags, tagged)
+    res = [hashtag for hashtag, _ in normalized]
+    # 기존 해시태그로 합쳐졌으면 입력 태그가 아니라 그 해시태그의 sentiment를 기록
+    sentiments = [sentiment for _, sentiment in normalized]
     
     """
     userTag 테이블 채우기 ( db_connect에 함수 추가 ),
@@ -75,4 +83,15 @@ async def create_tags(request: Tag_Request, session: AsyncSession = Depends(get_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error for usertag: {e}")
 
+    # 태그 sentiment 기록 (추천 시점에는 이 값을 그대로 사용)
+    tagged_ids = [(ut.tagId, sentiment) for ut, sentiment in zip(user_tags, sentiments)]
+    try:
+        stored = await add_tag_sentiments(session, tagged_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error for tag sentiment: {e}")
+
+    # 추천 모델 증분 학습 대기열에 추가 (전체 학습과 같도록 테이블에 저장된 sentiment 사용)
+    record_review(request.user_id, request.place_id, [(tag_id, stored.get(tag_id, sentiment)) for tag_id, sentiment in tagged_ids])
+    recommendation_cache.invalidate_user(request.user_id)
+
     return Tag_Response(isGened=True)
\ No newline at end of file
@@ -0,0 +1,132 @@
+# tag_counter.py
+
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from config import TAG_COUNT_FLUSH_INTERVAL, TAG_COUNT_FLUSH_DELTA
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindCounter:
+    """
+    해시태그 사용 횟수 증가분을 메모리에 모았다가 한 번에 저장하는 write-behind 카운터.
+
+    add()는 lock 안에서 증가분만 더하므로 동시에 들어온 리뷰의 증가분이 사라지지 않는다.
+    전용 thread가 flush_interval마다, 또는 모인 증가분이 flush_delta를 넘으면 바로
+    key별로 합친 증가분을 flush(deltas) 한 번으로 저장한다. 저장에 실패하면 다음 flush에 다시 포함한다.
+    저장 중인 증가분은 _in_flight에 남겨 두므로 pending()은 저장이 끝날 때까지 그 값도 포함한다.
+    """
+    def __init__(self, flush: Callable[[Dict[str, int]], None], flush_interval: float = TAG_COUNT_FLUSH_INTERVAL, flush_delta: int = TAG_COUNT_FLUSH_DELTA):
+        self._flush = flush
+        self.flush_interval = flush_interval
+        self.flush_delta = flush_delta
+        self._pending: Counter = Counter()
+        self._pending_total = 0
+        self._in_flight: Counter = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._increments = 0
+        self._flushes = 0
+        self._flushed_keys = 0
+        self._failed = 0
+        self._last_flush: Optional[float] = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._worker, name="tag-counter", daemon=True)
+                self._thread.start()
+
+    def add(self, key: str, delta: int = 1) -> int:
+        """
+        :return: 아직 저장되지 않은 key의 증가분 (저장된 값 + 이 값이 현재 횟수).
+        """
+        self._ensure_started()
+        with self._lock:
+            self._pending[key] += delta
+            self._pending_total += delta
+            self._increments += delta
+            pending = self._pending[key] + self._in_flight.get(key, 0)
+            full = self._pending_total >= self.flush_delta
+        if full:
+            self._wakeup.set()
+        return pending
+
+    def pending(self, key: str) -> int:
+        with self._lock:
+            return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+
+    def pending_all(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._pending + self._in_flight)
+
+    def flush(self) -> int:
+        """
+        모인 증가분을 저장합니다.
+
+        :return: 저장한 key 수.
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas = self._pending
+                self._in_flight = deltas
+                self._pending = Counter()
+                self._pending_total = 0
+            if not deltas:
+                return 0
+            try:
+                self._flush(dict(deltas))
+            except Exception as e:
+                # 다음 flush에 다시 포함
+                with self._lock:
+                    self._in_flight = Counter()
+                    self._pending.update(deltas)
+                    self._pending_total += sum(deltas.values())
+                self._failed += 1
+                logger.error(f"tag count flush of {len(deltas)} tags failed: {e}")
+                return 0
+            with self._lock:
+                self._in_flight = Counter()
+            self._flushes += 1
+            self._flushed_keys += len(deltas)
+            self._last_flush = time.time()
+            return len(deltas)
+
+    def _worker(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def shutdown(self) -> None:
+        # 종료 전에 남은 증가분 저장
+        if self._thread is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "pending_keys": len(self._pending),
+            "pending_total": self._pending_total,
+            "in_flight_keys": len(self._in_flight),
+            "increments": self._increments,
+            "flushes": self._flushes,
+            "flushed_keys": self._flushed_keys,
+            "failed_flushes": self._failed,
+            "last_flush": self._last_flush,
+            "flush_interval": self.flush_interval,
+            "flush_delta": self.flush_delta,
+        }
@@ -0,0 +1,62 @@
+# tag_sentiment.py
+
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from vdb import sentiment_weight
+
+class TagSentimentTable:
+    """
+    tagId -> sentiment 가중치 배열. (tagSentiment 테이블의 메모리 사본)
+
+    sentiment는 리뷰를 받을 때 (/gen_tags) 한 번 정해져 tagSentiment 테이블에 기록되고,
+    추천/학습 시점에는 weights로 tagId 배열을 한 번에 가중치로 바꾼다.
+    모르는 tagId의 가중치는 0 이다.
+    """
+    def __init__(self):
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._known = np.zeros(0, dtype=bool)
+        self._lock = threading.Lock()
+
+    def update(self, rows: Iterable[Tuple[int, int]]) -> None:
+        """
+        :param rows: (tagId, sentiment) 리스트. sentiment는 1/0/-1.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        tag_ids = np.array([tag_id for tag_id, _ in rows], dtype=np.int64)
+        weights = np.array([sentiment_weight(sentiment) for _, sentiment in rows], dtype=np.float32)
+        with self._lock:
+            size = int(tag_ids.max()) + 1
+            if size > len(self._weights):
+                # 자주 다시 할당하지 않도록 여유 있게 키운다
+                size = max(size, 2 * len(self._weights))
+                self._weights = np.concatenate([self._weights, np.zeros(size - len(self._weights), dtype=np.float32)])
+                self._known = np.concatenate([self._known, np.zeros(size - len(self._known), dtype=bool)])
+            self._weights[tag_ids] = weights
+            self._known[tag_ids] = True
+
+    def missing(self, tag_ids: Iterable[int]) -> List[int]:
+        # 메모리에 없는 tagId (DB에서 읽어 와야 하는 것)
+        tag_ids = np.unique(np.asarray(list(tag_ids), dtype=np.int64))
+        known = self._known
+        inside = tag_ids < len(known)
+        found = np.zeros(len(tag_ids), dtype=bool)
+        found[inside] = known[tag_ids[inside]]
+        return tag_ids[~found].tolist()
+
+    def weights(self, tag_ids: np.ndarray) -> np.ndarray:
+        tag_ids = np.asarray(tag_ids, dtype=np.int64)
+        weights = self._weights
+        inside = tag_ids < len(weights)
+        result = np.zeros(len(tag_ids), dtype=np.float32)
+        result[inside] = weights[tag_ids[inside]]
+        return result
+
+    def metrics(self) -> dict:
+        return {"tags": int(self._known.sum()), "capacity": len(self._known)}
+
+tag_sentiments = TagSentimentTable()
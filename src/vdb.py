@@ -2,23 +2,18 @@ from openai import OpenAI
 import base64
 import os
 from pydantic import BaseModel
-import chromadb
 import uuid
-from typing import List, Tuple
-# from chromadb.utils.embedding_functions import EmbeddingFunction
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from typing import Callable, Iterable, List, Tuple
 
-from config import OPENAI_KEY, VDB_PATH
+from config import OPENAI_KEY
+from embedding import embedding_service
+from tag_counter import WriteBehindCounter
+from vector_store import open_collection, increment_counts
 os.environ['OPENAI_API_KEY'] = OPENAI_KEY
 
-chroma_client = chromadb.PersistentClient(path=VDB_PATH, settings=Settings(anonymized_telemetry=False))
-db = chroma_client.get_or_create_collection(
-    name="hashtag_embeddings",
-    metadata={"hnsw:space": "cosine"}
-    )
-
-embedding_model = SentenceTransformer(model_name_or_path='snunlp/KR-SBERT-V40K-klueNLI-augSTS', device='cpu')
+# 해시태그 벡터 저장소 (VDB_BACKEND: chroma 또는 numpy, vector_store.py)
+db = open_collection()
 
 class Tag_Response(BaseModel):
     tags: list[str]
@@ -37,7 +32,8 @@ def embed_hashtags(hashtags):
         raise ValueError("All elements of hashtags must be strings")
 
     if len(hashtags) > 0:
-        return embedding_model.encode(hashtags)
+        # 동시에 들어온 다른 요청과 함께 micro-batch로 encode (embedding.py)
+        return embedding_service.encode_sync(hashtags)
     else:
         print("Hashtags list is empty after processing.")
         return []
@@ -89,56 +85,139 @@ def print_db_contents():
     else:
         print("DB가 비어있습니다.")
 
+# 이 cosine distance 미만이면 같은 해시태그로 본다
+SIMILAR_DISTANCE = 0.2
+
+# count가 바뀐 해시태그를 받는 함수들 (hot_tags 등). (문서 id, 해시태그, 새 count, sentiment, 증가량) 리스트
+_count_listeners: List[Callable[[Iterable[Tuple[str, str, int, int, int]]], None]] = []
+
+def add_count_listener(listener: Callable[[Iterable[Tuple[str, str, int, int, int]]], None]) -> None:
+    _count_listeners.append(listener)
+
+def flush_tag_counts(deltas: dict[str, int]) -> None:
+    # 문서별로 모인 count 증가분을 lock 안에서 get 1번, update 1번으로 저장 (다른 worker의 flush와 겹쳐도 안전)
+    increment_counts(db, deltas)
+
+# 해시태그 사용 횟수 증가분은 메모리에 모았다가 주기적으로 저장 (write-behind)
+tag_counter = WriteBehindCounter(flush_tag_counts)
+
+def normalize_tags(
+    tagged : List[Tuple[str, int]]
+) -> List[Tuple[str, int]]:
+    """
+    리뷰 하나의 해시태그를 한 번에 기존 해시태그로 정규화합니다.
+    encode 1번, query 1번, 신규 add 1번으로 처리하고, 기존 해시태그의 count 증가분은 tag_counter에 모읍니다.
+
+    :param tagged: (해시태그, sentiment) 리스트. sentiment는 1/0/-1.
+    :return: 입력 순서대로 (정규화된 해시태그, 그 해시태그에 저장된 sentiment) 리스트.
+    """
+    if not tagged:
+        return []
+    hashtags = [hashtag for hashtag, _ in tagged]
+    embeddings = np.asarray(embed_hashtags(hashtags=hashtags), dtype=np.float32)
+
+    matches = [None] * len(tagged)
+    if db.count() > 0:
+        results = db.query(query_embeddings=embeddings.tolist(), n_results=1)
+        for idx in range(len(tagged)):
+            if results['ids'][idx] and results['distances'][idx][0] < SIMILAR_DISTANCE:
+                matches[idx] = (results['ids'][idx][0], results['documents'][idx][0], results['metadatas'][idx][0])
+
+    # 같은 리뷰 안에서 먼저 나온 신규 해시태그와 비슷하면 그 해시태그로 합친다 (하나씩 처리할 때와 같은 결과)
+    normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    new_rows: List[int] = []
+    new_counts = {}
+    updates = {}
+    new_tag = []
+    for idx, (hashtag, sentiment) in enumerate(tagged):
+        if matches[idx] is not None:
+            similar_id, similar_hashtag, metadata = matches[idx]
+            # 현재 count = 저장된 count + 아직 저장되지 않은 증가분
+            count = int(metadata['count']) + tag_counter.add(similar_id)
+            delta = updates[similar_id][3] + 1 if similar_id in updates else 1
+            updates[similar_id] = (similar_hashtag, count, metadata['sentiment'], delta)
+            new_tag.append((similar_hashtag, int(metadata['sentiment'])))
+            continue
+        if new_rows:
+            distances = 1.0 - normalized[new_rows] @ normalized[idx]
+            nearest = int(np.argmin(distances))
+            if distances[nearest] < SIMILAR_DISTANCE:
+                new_counts[new_rows[nearest]] += 1
+                new_tag.append((hashtags[new_rows[nearest]], tagged[new_rows[nearest]][1]))
+                continue
+        new_rows.append(idx)
+        new_counts[idx] = 1
+        new_tag.append((hashtag, sentiment))
+
+    new_ids = [str(uuid.uuid4()) for _ in new_rows]
+    if new_rows:
+        db.add(
+            ids=new_ids,
+            documents=[hashtags[idx] for idx in new_rows],
+            embeddings=embeddings[new_rows].tolist(),
+            metadatas=[{"count": new_counts[idx], "sentiment": tagged[idx][1]} for idx in new_rows]
+        )
+
+    changed = [
+        (similar_id, similar_hashtag, count, sentiment, delta)
+        for similar_id, (similar_hashtag, count, sentiment, delta) in updates.items()
+    ] + [
+        (new_id, hashtags[idx], new_counts[idx], tagged[idx][1], new_counts[idx])
+        for new_id, idx in zip(new_ids, new_rows)
+    ]
+    for listener in _count_listeners:
+        listener(changed)
+
+    return new_tag
+
+def tags_valid(
+    tagged : List[Tuple[str, int]]
+) -> list[str]:
+    # 정규화된 해시태그 이름만 (normalize_tags)
+    return [hashtag for hashtag, _ in normalize_tags(tagged)]
+
 def tag_valid(
     hashtags : list[str],
     sentiment : int
 ) -> list[str]:
-    embeddings = embed_hashtags(hashtags=hashtags)
-
-    new_tag = []
+    return tags_valid([(hashtag, sentiment) for hashtag in hashtags])
 
-    for hashtag, embedding in zip(hashtags, embeddings):
-        similar_id, similar_hashtag, distance, similar_count, similar_sentiment = find_similar_hashtag(new_embedding=embedding)
-        # print(f"for문 안 id: {similar_id}, distance: {distance}, count: {similar_count}")
-        if similar_hashtag and distance[0] < 0.2:
-            new_tag.append(similar_hashtag[0])
-            # vdb +=count
-            db.update(ids=similar_id, metadatas=[{"count": int(similar_count) + 1, "sentiment": similar_sentiment}])
-            # print(f"'{hashtag}' is similar to existing hashtag '{similar_hashtag}' and will be replaced.")
-        else:
-            store_hashtags_in_db(hashtags=[hashtag], embeddings=[embedding], sentiment=sentiment)
-            new_tag.append(hashtag)
-            # print(f"Stored new hashtag: {hashtag}")
-
-    return new_tag
+def sentiment_weight(sentiment: int) -> int:
+    # 긍정 2, 중립 1, 부정 -1 가중치로 interaction score를 만든다.
+    if sentiment == -1:
+        return -1
+    elif sentiment == 1:
+        return 2
+    return 1
 
 def get_tag_sentiment(
-    tag_ids = list[str]
+    tag_names : list[str]
 ) -> dict[str, int]:
+    """
+    해시태그 이름으로 벡터 디비에 저장된 sentiment (1/0/-1)를 찾습니다.
+    tagSentiment 테이블이 생기기 전의 태그를 채울 때만 사용합니다. (db_connect.backfill_tag_sentiments)
+    """
     sentiments = {}
-    embeddings = embed_hashtags(hashtags=tag_ids)
-    for tag, embedding in zip(tag_ids, embeddings):
-        db_results = db.query(query_embeddings=[embedding], n_results=1)
-        sentiment_value = db_results['metadatas'][0][0]['sentiment']
-        if sentiment_value == -1:
-            sentiments[tag] = -1
-        elif sentiment_value == 1:
-            sentiments[tag] = 2
-        else:
-            sentiments[tag] = 1
-        # print(f"Sentiment for tag '{tag}': {db_results['documents'][0]} {sentiments[tag]}")
-    
-    return sentiments
+    if not tag_names or db.count() == 0:
+        return sentiments
+    embeddings = embed_hashtags(hashtags=tag_names)
+    db_results = db.query(query_embeddings=np.asarray(embeddings).tolist(), n_results=1)
+    for tag, metadatas in zip(tag_names, db_results['metadatas']):
+        sentiments[tag] = int(metadatas[0]['sentiment'])
 
-def get_best_tags() -> list[str]:
-    docus = db.get(where={"count": {"$gt": 1}}, include=['documents', 'metadatas'])
-    
-    combined = sorted(zip(docus['documents'], [meta['count'] for meta in docus['metadatas']]), key=lambda x: x[1], reverse=True)
-    # print(combined)
-    ret = [doc for doc, count in combined]
-    ret = ret[:10]
+    return sentiments
 
-    return ret
+def get_tag_counts() -> List[Tuple[str, str, int, int]]:
+    """
+    벡터 디비 전체 해시태그의 (문서 id, 해시태그, count, sentiment)를 가져옵니다.
+    상위 해시태그는 hot_tags가 들고 있으므로 시작 시와 주기적인 재구성에만 사용합니다.
+    """
+    docus = db.get(include=['documents', 'metadatas'])
+    pending = tag_counter.pending_all()
+    return [
+        (tag_id, doc, int(meta['count']) + pending.get(tag_id, 0), int(meta['sentiment']))
+        for tag_id, doc, meta in zip(docus['ids'], docus['documents'], docus['metadatas'])
+    ]
 
 if __name__ == "__main__":
     example_review = "백다방 에스프레소 맛있어요. 직원들이 불친절해서 나빠요."
@@ -0,0 +1,305 @@
+# vector_store.py
+#
+# 해시태그 벡터 저장소 backend. vdb는 아래 VectorCollection 메서드만 사용한다.
+#
+#   VDB_BACKEND=chroma : chromadb PersistentClient (SQLite + HNSW)
+#   VDB_BACKEND=numpy  : 정규화된 float32 embedding 행렬 (mmap .npy) + id/metadata 파일, 정확한 cosine 검색
+#
+#   python vector_store.py migrate   (chroma 컬렉션을 numpy 저장소로 복사)
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from config import VDB_PATH, VDB_BACKEND, VDB_NUMPY_PATH, VDB_NUMPY_COMPACT_LINES
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "hashtag_embeddings"
+
+class VectorCollection(Protocol):
+    # chromadb Collection과 같은 호출 방식/반환 모양 (vdb가 쓰는 부분만)
+    def count(self) -> int: ...
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[dict]) -> None: ...
+    def update(self, ids: List[str], metadatas: List[dict]) -> None: ...
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]: ...
+    def query(self, query_embeddings: List[List[float]], n_results: int = 1) -> Dict[str, Any]: ...
+
+def open_chroma_collection(path: str = VDB_PATH, hnsw: Optional[Dict[str, int]] = None) -> VectorCollection:
+    """
+    :param hnsw: 새 컬렉션의 HNSW 설정 (예: {"hnsw:M": 16, "hnsw:search_ef": 10}). 이미 있는 컬렉션에는 적용되지 않습니다.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    chroma_client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    return chroma_client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine", **(hnsw or {})}
+    )
+
+class NumpyCollection:
+    """
+    정규화된 embedding을 연속된 float32 행렬 하나에 두고, 여러 query를 행렬 곱 한 번으로 찾는 저장소.
+    정규 해시태그는 수천 개 수준이라 HNSW 없이 정확한 cosine distance (1 - cos)로 충분히 빠르다.
+
+    embedding은 path/embeddings.npy에 여유 capacity를 두고 mmap으로 쓰고 (추가는 해당 행만 기록),
+    id/문서/metadata 변경은 path/log.jsonl에 한 줄씩 append한다. 로그가 compact_lines줄을 넘으면
+    path/index.json으로 합치고 로그를 비운다.
+
+    여러 worker 프로세스가 같은 저장소를 연다. 모든 연산은 path/.lock flock 안에서 하고 (쓰기는 LOCK_EX),
+    연산 전에 다른 프로세스가 남긴 변경 (로그 뒷부분, 새 index.json, 커진 embeddings.npy)을 반영한다.
+    """
+    def __init__(self, path: str = VDB_NUMPY_PATH, compact_lines: int = VDB_NUMPY_COMPACT_LINES):
+        self.path = path
+        self.compact_lines = compact_lines
+        self._matrix_path = os.path.join(path, "embeddings.npy")
+        self._index_path = os.path.join(path, "index.json")
+        self._log_path = os.path.join(path, "log.jsonl")
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._index_stamp: Optional[Tuple[int, int]] = None
+        self._matrix_stamp: Optional[Tuple[int, int]] = None
+        self._log_offset = 0
+        self._log_lines = 0
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, ".lock"), "a")
+        with self._locked():
+            pass
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int]]:
+        # 파일이 교체 (os.replace)되거나 다시 쓰였는지 비교하는 값
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._sync()
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        index_stamp = self._stamp(self._index_path)
+        if index_stamp != self._index_stamp:
+            # 다른 프로세스가 로그를 index.json으로 합쳤으면 처음부터 다시 읽는다
+            self._load_index()
+            self._index_stamp = index_stamp
+        self._replay()
+        matrix_stamp = self._stamp(self._matrix_path)
+        if matrix_stamp is not None and matrix_stamp[0] != (self._matrix_stamp or (None,))[0]:
+            self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+        self._matrix_stamp = matrix_stamp
+
+    def _load_index(self) -> None:
+        self._ids, self._documents, self._metadatas = [], [], []
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                index = json.load(f)
+            self._ids = index["ids"]
+            self._documents = index["documents"]
+            self._metadatas = index["metadatas"]
+        self._rows = {tag_id: row for row, tag_id in enumerate(self._ids)}
+        self._log_offset = 0
+        self._log_lines = 0
+
+    def _replay(self) -> None:
+        # 로그에서 아직 반영하지 않은 줄을 적용 (끝이 잘린 줄은 건너뜀)
+        try:
+            with open(self._log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            self._apply(json.loads(line))
+            self._log_offset += len(line)
+            self._log_lines += 1
+
+    def _apply(self, entry: dict) -> None:
+        if entry["op"] == "add":
+            for offset, tag_id in enumerate(entry["ids"]):
+                self._rows[tag_id] = entry["start"] + offset
+            self._ids.extend(entry["ids"])
+            self._documents.extend(entry["documents"])
+            self._metadatas.extend(entry["metadatas"])
+        elif entry["op"] == "update":
+            for tag_id, metadata in zip(entry["ids"], entry["metadatas"]):
+                row = self._rows.get(tag_id)
+                if row is not None:
+                    self._metadatas[row] = {**self._metadatas[row], **metadata}
+
+    def _append(self, entry: dict) -> None:
+        # LOCK_EX 안에서만 호출. 이전에 끝이 잘린 줄이 남아 있으면 지우고 한 줄을 추가한다
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode()
+        with open(self._log_path, "ab") as f:
+            if f.tell() > self._log_offset:
+                f.truncate(self._log_offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(entry)
+        self._log_offset += len(line)
+        self._log_lines += 1
+        if self._log_lines >= self.compact_lines:
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, f, ensure_ascii=False)
+        os.replace(tmp, self._index_path)
+        with open(self._log_path, "wb"):
+            pass
+        self._index_stamp = self._stamp(self._index_path)
+        self._log_offset = 0
+        self._log_lines = 0
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        # capacity가 모자라면 두 배로 늘린 새 mmap 파일로 옮긴다 (다른 프로세스는 _sync에서 다시 연다)
+        if self._matrix is not None and self._matrix.shape[0] >= rows:
+            return
+        capacity = max(rows, 2 * (self._matrix.shape[0] if self._matrix is not None else 0), 1024)
+        tmp = f"{self._matrix_path}.{os.getpid()}.tmp"
+        matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(capacity, dim))
+        if self._matrix is not None and len(self._ids):
+            matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        matrix.flush()
+        del matrix
+        os.replace(tmp, self._matrix_path)
+        self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+        self._matrix_stamp = self._stamp(self._matrix_path)
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    def count(self) -> int:
+        with self._locked():
+            return len(self._ids)
+
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[dict]) -> None:
+        embeddings = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._locked(exclusive=True):
+            # 행을 먼저 쓰고 로그를 남긴다 (중간에 죽으면 capacity 안의 쓰이지 않는 행으로 남음)
+            start = len(self._ids)
+            self._reserve(start + len(ids), embeddings.shape[1])
+            self._matrix[start:start + len(ids)] = embeddings
+            self._matrix.flush()
+            self._append({"op": "add", "start": start, "ids": list(ids), "documents": list(documents), "metadatas": [dict(metadata) for metadata in metadatas]})
+
+    def update(self, ids: List[str], metadatas: List[dict]) -> None:
+        with self._locked(exclusive=True):
+            self._append({"op": "update", "ids": list(ids), "metadatas": [dict(metadata) for metadata in metadatas]})
+
+    def increment(self, deltas: Dict[str, int], key: str = "count") -> None:
+        # 저장된 값에 더하는 것까지 LOCK_EX 안에서 하므로 여러 worker의 증가분이 사라지지 않는다
+        with self._locked(exclusive=True):
+            ids = [tag_id for tag_id in deltas if tag_id in self._rows]
+            if ids:
+                metadatas = [{key: int(self._metadatas[self._rows[tag_id]][key]) + deltas[tag_id]} for tag_id in ids]
+                self._append({"op": "update", "ids": ids, "metadatas": metadatas})
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        with self._locked():
+            rows = list(range(len(self._ids))) if ids is None else [self._rows[tag_id] for tag_id in ids if tag_id in self._rows]
+            result = {"ids": [self._ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self._documents[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._metadatas[row]) for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = np.array(self._matrix[rows]) if rows else np.empty((0, 0), dtype=np.float32)
+            return result
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 1) -> Dict[str, Any]:
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        with self._locked():
+            size = len(self._ids)
+            result = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+            if size == 0:
+                for _ in range(len(queries)):
+                    for key in result:
+                        result[key].append([])
+                return result
+            distances = 1.0 - queries @ self._matrix[:size].T
+            k = min(n_results, size)
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            for row, candidates in enumerate(nearest):
+                candidates = candidates[np.argsort(distances[row, candidates], kind="stable")]
+                result["ids"].append([self._ids[idx] for idx in candidates])
+                result["distances"].append(distances[row, candidates].tolist())
+                result["documents"].append([self._documents[idx] for idx in candidates])
+                result["metadatas"].append([dict(self._metadatas[idx]) for idx in candidates])
+            return result
+
+def open_collection(backend: str = VDB_BACKEND) -> VectorCollection:
+    if backend == "numpy":
+        return NumpyCollection()
+    if backend == "chroma":
+        return open_chroma_collection()
+    raise ValueError(f"unknown VDB_BACKEND: {backend}")
+
+def increment_counts(collection: VectorCollection, deltas: Dict[str, int], key: str = "count", lock_path: str = os.path.join(VDB_PATH, "count.lock")) -> None:
+    """
+    문서 metadata의 key 값에 증가분을 더합니다. 여러 worker가 같은 문서를 동시에 올려도 증가분이 사라지지 않도록
+    numpy backend는 저장소 lock 안에서, chroma는 lock_path flock 안에서 읽고 더해 씁니다.
+    """
+    if isinstance(collection, NumpyCollection):
+        collection.increment(deltas, key)
+        return
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        stored = collection.get(ids=list(deltas), include=["metadatas"])
+        if stored["ids"]:
+            collection.update(
+                ids=stored["ids"],
+                metadatas=[{**meta, key: int(meta[key]) + deltas[tag_id]} for tag_id, meta in zip(stored["ids"], stored["metadatas"])]
+            )
+
+def migrate_from_chroma(batch_size: int = 1000) -> int:
+    """
+    chroma 컬렉션 전체를 numpy 저장소로 복사합니다. (이미 있는 id는 건너뜀)
+
+    :return: 복사한 해시태그 수.
+    """
+    source = open_chroma_collection()
+    target = NumpyCollection()
+    stored = source.get(include=["documents", "metadatas", "embeddings"])
+    rows = [idx for idx, tag_id in enumerate(stored["ids"]) if tag_id not in target._rows]
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        target.add(
+            ids=[stored["ids"][idx] for idx in batch],
+            documents=[stored["documents"][idx] for idx in batch],
+            embeddings=[stored["embeddings"][idx] for idx in batch],
+            metadatas=[stored["metadatas"][idx] for idx in batch],
+        )
+    return len(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="해시태그 벡터 저장소 관리")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    print(json.dumps({"migrated": migrate_from_chroma(), "path": VDB_NUMPY_PATH}))
@@ -0,0 +1,16 @@
+# conftest.py
+
+import os
+import sys
+import tempfile
+
+# src/ 모듈은 서로 flat import (from config import ...) 하므로 src를 import 경로에 넣는다
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# import 시 열리는 저장소(vdb, hot_tags)가 실제 데이터 위치를 건드리지 않도록 임시 디렉토리 사용
+_data_dir = tempfile.mkdtemp(prefix="pinpung-test-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("VDB_BACKEND", "numpy")
+os.environ.setdefault("VDB_PATH", os.path.join(_data_dir, "vectordb"))
+os.environ.setdefault("VDB_NUMPY_PATH", os.path.join(_data_dir, "vectordb_numpy"))
+os.environ.setdefault("REC_HOT_TAGS_PATH", os.path.join(_data_dir, "hot_tags.json"))
@@ -0,0 +1,39 @@
+# test_features.py
+
+from config import REC_AGE_BUCKET_WIDTH, REC_AGE_MAX
+import features
+from features import age_feature, age_vocabulary, hashed_feature, user_feature_vocabulary, item_feature_vocabulary
+
+def test_age_feature_buckets():
+    assert age_feature(None) is None
+    assert age_feature(0) == f"age:0-{REC_AGE_BUCKET_WIDTH - 1}"
+    assert age_feature(REC_AGE_BUCKET_WIDTH) == f"age:{REC_AGE_BUCKET_WIDTH}-{2 * REC_AGE_BUCKET_WIDTH - 1}"
+    assert age_feature(-3) == age_feature(0)
+    assert age_feature(23.9) == age_feature(23)
+    assert age_feature(REC_AGE_MAX) == f"age:{REC_AGE_MAX}+"
+    assert age_feature(REC_AGE_MAX + 40) == f"age:{REC_AGE_MAX}+"
+
+def test_age_vocabulary_covers_every_age():
+    vocabulary = age_vocabulary()
+    assert len(vocabulary) == len(set(vocabulary))
+    assert {age_feature(age) for age in range(-5, REC_AGE_MAX + 20)} == set(vocabulary)
+
+def test_age_vocabulary_when_max_is_not_a_multiple_of_width(monkeypatch):
+    # 마지막 구간이 REC_AGE_MAX - 1에서 끝나고 REC_AGE_MAX+ 구간도 vocabulary에 있어야 한다
+    monkeypatch.setattr(features, "REC_AGE_BUCKET_WIDTH", 5)
+    monkeypatch.setattr(features, "REC_AGE_MAX", 82)
+    vocabulary = age_vocabulary()
+    assert "age:80-81" in vocabulary
+    assert "age:82+" in vocabulary
+    assert {age_feature(age) for age in range(0, 120)} == set(vocabulary)
+
+def test_hashed_feature_is_stable_and_bounded():
+    assert hashed_feature("menu", None, 8) is None
+    assert hashed_feature("menu", "라떼", 8) == hashed_feature("menu", "라떼", 8)
+    for value in ["라떼", "아메리카노", 17, ""]:
+        name, bucket = hashed_feature("menu", value, 8).split("#")
+        assert name == "menu" and 0 <= int(bucket) < 8
+
+def test_vocabularies_are_unique():
+    for vocabulary in (user_feature_vocabulary(), item_feature_vocabulary()):
+        assert len(vocabulary) == len(set(vocabulary))
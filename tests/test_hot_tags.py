@@ -0,0 +1,82 @@
+# test_hot_tags.py
+
+import random
+
+import pytest
+
+# hot_tags는 vdb(openai)의 count listener를 import 한다
+pytest.importorskip("openai")
+
+from hot_tags import IndexedMaxHeap
+
+def expected_top(counts, k, min_count=0):
+    return sorted((count for count in counts.values() if count >= min_count), reverse=True)[:k]
+
+def check(heap, counts):
+    assert len(heap) == len(counts)
+    for k in (0, 1, 3, len(counts), len(counts) + 5):
+        top = heap.top(k)
+        assert [count for _, count in top] == expected_top(counts, k)
+        assert all(counts[key] == count for key, count in top)
+        assert len({key for key, _ in top}) == len(top)
+
+def test_empty_heap():
+    heap = IndexedMaxHeap()
+    assert len(heap) == 0
+    assert heap.top(5) == []
+    heap.remove("missing")
+    assert len(heap) == 0
+
+def test_set_and_top():
+    heap = IndexedMaxHeap()
+    for key, count in {"a": 3, "b": 10, "c": 1, "d": 7}.items():
+        heap.set(key, count)
+    assert heap.top(2) == [("b", 10), ("d", 7)]
+    assert heap.top(10) == [("b", 10), ("d", 7), ("a", 3), ("c", 1)]
+
+def test_update_moves_key_up_and_down():
+    heap = IndexedMaxHeap()
+    counts = {"a": 3, "b": 10, "c": 1, "d": 7}
+    for key, count in counts.items():
+        heap.set(key, count)
+    heap.set("c", 20)
+    heap.set("b", 2)
+    heap.set("d", 7)
+    assert heap.top(4) == [("c", 20), ("d", 7), ("a", 3), ("b", 2)]
+
+def test_top_stops_below_min_count():
+    heap = IndexedMaxHeap()
+    for key, count in {"a": 5, "b": 1, "c": 3}.items():
+        heap.set(key, count)
+    assert heap.top(10, min_count=3) == [("a", 5), ("c", 3)]
+    assert heap.top(10, min_count=6) == []
+
+def test_remove():
+    heap = IndexedMaxHeap()
+    counts = {"a": 5, "b": 1, "c": 3, "d": 9, "e": 4}
+    for key, count in counts.items():
+        heap.set(key, count)
+    heap.remove("d")
+    del counts["d"]
+    check(heap, counts)
+    heap.remove("b")
+    del counts["b"]
+    check(heap, counts)
+    heap.set("d", 2)
+    counts["d"] = 2
+    check(heap, counts)
+
+def test_random_operations_match_sorted_counts():
+    generator = random.Random(7)
+    heap = IndexedMaxHeap()
+    counts = {}
+    for _ in range(2000):
+        key = f"tag{generator.randrange(60)}"
+        if counts and generator.random() < 0.2:
+            heap.remove(key)
+            counts.pop(key, None)
+        else:
+            count = generator.randrange(100)
+            heap.set(key, count)
+            counts[key] = count
+    check(heap, counts)
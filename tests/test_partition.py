@@ -0,0 +1,50 @@
+# test_partition.py
+
+import zlib
+
+import pytest
+
+# partition은 추천 모델(lightfm), DB engine(aiomysql), 벡터 디비(openai)를 함께 import 한다
+pytest.importorskip("lightfm")
+pytest.importorskip("aiomysql")
+pytest.importorskip("openai")
+
+import partition
+from partition import region_of, partition_of, owns
+
+def test_region_of_uses_address_first():
+    assert region_of("서울특별시 강남구 테헤란로 1", "127.0", "37.5", level="sido") == "서울"
+    assert region_of("서울특별시 강남구 테헤란로 1", "127.0", "37.5", level="sigungu") == "서울 강남구"
+    assert region_of("경기도 성남시 분당구", None, None, level="sigungu") == "경기 성남시"
+    # 별칭이 없는 시/도 이름은 그대로
+    assert region_of("서울 마포구", None, None, level="sido") == "서울"
+    # 시/군/구가 없으면 시/도
+    assert region_of("제주특별자치도", None, None, level="sigungu") == "제주"
+
+def test_region_of_falls_back_to_coordinate_grid(monkeypatch):
+    monkeypatch.setattr(partition, "REC_REGION_GRID", 0.5)
+    assert region_of(None, "127.03", "37.49", level="sido") == "grid:37,127"
+    assert region_of("  ", "127.6", "37.51", level="sido") == "grid:37.5,127.5"
+    assert region_of("", "-0.2", "-0.2", level="sido") == "grid:-0.5,-0.5"
+
+def test_region_of_without_address_or_coordinate():
+    assert region_of(None, None, None) is None
+    assert region_of("", "abc", "37.5") is None
+    assert region_of("", "200", "37.5") is None
+
+def test_partition_of_is_stable_and_in_range(monkeypatch):
+    monkeypatch.setattr(partition, "REC_PARTITION_COUNT", 4)
+    regions = ["서울", "경기", "부산", "서울 강남구", "grid:37,127"]
+    for region in regions:
+        assert partition_of(region) == zlib.crc32(region.encode("utf-8")) % 4
+        assert 0 <= partition_of(region) < 4
+
+def test_owns_matches_partition_index(monkeypatch):
+    monkeypatch.setattr(partition, "REC_PARTITION_COUNT", 4)
+    for index in range(4):
+        monkeypatch.setattr(partition, "REC_PARTITION_INDEX", index)
+        assert owns("서울") == (partition_of("서울") == index)
+    # 노드가 하나면 모든 지역을 맡는다
+    monkeypatch.setattr(partition, "REC_PARTITION_COUNT", 1)
+    monkeypatch.setattr(partition, "REC_PARTITION_INDEX", 0)
+    assert all(owns(region) for region in ["서울", "부산", "grid:37,127"])
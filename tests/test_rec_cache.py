@@ -0,0 +1,79 @@
+# test_rec_cache.py
+
+import pytest
+
+import rec_cache
+from rec_cache import RecommendationCache, normalize_place_ids
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rec_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_normalize_place_ids():
+    assert normalize_place_ids([3, 1, 3, 2]) == (1, 2, 3)
+    assert normalize_place_ids([]) == ()
+
+def test_get_and_set(clock):
+    cache = RecommendationCache(max_entries=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1, [10, 20])
+    assert cache.get("a") == [10, 20]
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["entries"]) == (1, 1, 1)
+
+def test_entry_expires_after_ttl(clock):
+    cache = RecommendationCache(max_entries=10, ttl=60)
+    cache.set("a", 1, "value")
+    clock[0] += 60
+    assert cache.get("a") == "value"
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    assert cache.metrics()["entries"] == 0
+    # 만료로 지운 항목은 user 목록에서도 빠져야 한다
+    cache.invalidate_user(1)
+    assert cache.metrics()["invalidations"] == 0
+
+def test_set_again_refreshes_ttl(clock):
+    cache = RecommendationCache(max_entries=10, ttl=60)
+    cache.set("a", 1, "old")
+    clock[0] += 50
+    cache.set("a", 1, "new")
+    clock[0] += 50
+    assert cache.get("a") == "new"
+
+def test_evicts_least_recently_used(clock):
+    cache = RecommendationCache(max_entries=2, ttl=60)
+    cache.set("a", 1, "a")
+    cache.set("b", 2, "b")
+    assert cache.get("a") == "a"  # b가 가장 오래 안 쓴 항목이 된다
+    cache.set("c", 3, "c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.metrics()["evictions"] == 1
+
+def test_invalidate_user_removes_only_that_user(clock):
+    cache = RecommendationCache(max_entries=10, ttl=60)
+    cache.set(("u1", 1), 1, "x")
+    cache.set(("u1", 2), 1, "y")
+    cache.set(("u2", 1), 2, "z")
+    cache.invalidate_user(1)
+    assert cache.get(("u1", 1)) is None
+    assert cache.get(("u1", 2)) is None
+    assert cache.get(("u2", 1)) == "z"
+    assert cache.metrics()["invalidations"] == 2
+    cache.invalidate_user(99)
+    assert cache.metrics()["invalidations"] == 2
+
+def test_clear(clock):
+    cache = RecommendationCache(max_entries=10, ttl=60)
+    cache.set("a", 1, "a")
+    cache.set("b", 2, "b")
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.metrics()["entries"] == 0
+    assert cache.metrics()["invalidations"] == 2
+    cache.set("a", 1, "a")
+    assert cache.get("a") == "a"
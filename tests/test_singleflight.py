@@ -0,0 +1,122 @@
+# test_singleflight.py
+
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == [1]
+    assert results == ["result"] * 3
+    assert flight.metrics() == {"in_flight": 0, "executed": 1, "coalesced": 2, "cancelled": 0}
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def work(value):
+            await asyncio.sleep(0)
+            return value
+
+        return flight, await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b")))
+
+    flight, results = asyncio.run(scenario())
+    assert results == ["a", "b"]
+    assert flight.metrics()["executed"] == 2
+
+def test_exception_is_shared_and_key_is_forgotten():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError("boom")
+
+        waiters = [asyncio.create_task(flight.do("key", fail)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        # 끝난 연산은 잊혀서 다음 요청은 새로 실행된다
+        async def succeed():
+            return "ok"
+        return flight, results, await flight.do("key", succeed)
+
+    flight, results, retried = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == "ok"
+    assert flight.metrics()["executed"] == 2
+
+def test_cancelling_one_waiter_keeps_the_call_for_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        finished = []
+
+        async def work():
+            await release.wait()
+            finished.append(1)
+            return "result"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return flight, finished, result
+
+    flight, finished, result = asyncio.run(scenario())
+    assert result == "result"
+    assert finished == [1]
+    assert flight.metrics()["cancelled"] == 0
+    assert flight.metrics()["in_flight"] == 0
+
+def test_cancelling_every_waiter_cancels_the_call():
+    async def scenario():
+        flight = SingleFlight("test")
+        started = asyncio.Event()
+        cancelled = []
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight, cancelled
+
+    flight, cancelled = asyncio.run(scenario())
+    assert cancelled == [1]
+    assert flight.metrics()["cancelled"] == 1
+    assert flight.metrics()["in_flight"] == 0
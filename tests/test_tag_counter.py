@@ -0,0 +1,119 @@
+# test_tag_counter.py
+
+import threading
+
+import pytest
+
+from tag_counter import WriteBehindCounter
+
+@pytest.fixture
+def flushed():
+    return []
+
+@pytest.fixture
+def counter(flushed):
+    # 주기 flush가 끼어들지 않도록 interval/delta를 크게 둔다
+    counter = WriteBehindCounter(flushed.append, flush_interval=3600, flush_delta=10**9)
+    yield counter
+    counter.shutdown()
+
+def test_add_accumulates_until_flush(counter, flushed):
+    assert counter.add("a") == 1
+    assert counter.add("a", 2) == 3
+    assert counter.add("b") == 1
+    assert counter.pending("a") == 3
+    assert counter.pending_all() == {"a": 3, "b": 1}
+    assert flushed == []
+
+    assert counter.flush() == 2
+    assert flushed == [{"a": 3, "b": 1}]
+    assert counter.pending("a") == 0
+    assert counter.pending_all() == {}
+    assert counter.flush() == 0
+    assert len(flushed) == 1
+
+def test_in_flight_deltas_stay_pending_until_saved(flushed):
+    seen = []
+    counter = None
+
+    def flush(deltas):
+        # 저장 중에도 증가분이 사라지지 않아야 한다 (저장된 값 + pending이 현재 횟수)
+        seen.append((counter.pending("a"), counter.add("a"), counter.pending_all()))
+        flushed.append(deltas)
+
+    counter = WriteBehindCounter(flush, flush_interval=3600, flush_delta=10**9)
+    try:
+        counter.add("a", 2)
+        counter.flush()
+        assert seen == [(2, 3, {"a": 3})]
+        assert flushed == [{"a": 2}]
+        # 저장 중에 들어온 증가분은 다음 flush에서 저장
+        assert counter.pending_all() == {"a": 1}
+        assert counter.metrics()["in_flight_keys"] == 0
+    finally:
+        counter.shutdown()
+
+def test_failed_flush_is_retried(flushed):
+    fail = [True]
+
+    def flush(deltas):
+        if fail[0]:
+            raise RuntimeError("db down")
+        flushed.append(deltas)
+
+    counter = WriteBehindCounter(flush, flush_interval=3600, flush_delta=10**9)
+    try:
+        counter.add("a", 2)
+        assert counter.flush() == 0
+        assert counter.pending("a") == 2
+        counter.add("a")
+        counter.add("b")
+        fail[0] = False
+        assert counter.flush() == 2
+        assert flushed == [{"a": 3, "b": 1}]
+        metrics = counter.metrics()
+        assert (metrics["failed_flushes"], metrics["flushes"], metrics["pending_total"], metrics["in_flight_keys"]) == (1, 1, 0, 0)
+    finally:
+        counter.shutdown()
+
+def test_flush_delta_wakes_the_worker():
+    done = threading.Event()
+    flushed = []
+
+    def flush(deltas):
+        flushed.append(deltas)
+        done.set()
+
+    counter = WriteBehindCounter(flush, flush_interval=3600, flush_delta=3)
+    try:
+        counter.add("a")
+        counter.add("b")
+        assert not done.wait(0.1)
+        counter.add("a")
+        assert done.wait(5)
+        assert flushed == [{"a": 2, "b": 1}]
+    finally:
+        counter.shutdown()
+
+def test_shutdown_flushes_remaining(flushed):
+    counter = WriteBehindCounter(flushed.append, flush_interval=3600, flush_delta=10**9)
+    counter.add("a")
+    counter.shutdown()
+    assert flushed == [{"a": 1}]
+    # shutdown 후 add하면 worker를 다시 시작한다
+    counter.add("b")
+    counter.shutdown()
+    assert flushed == [{"a": 1}, {"b": 1}]
+
+def test_concurrent_adds_are_not_lost(counter, flushed):
+    def work():
+        for _ in range(1000):
+            counter.add("a")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.flush()
+    assert flushed == [{"a": 4000}]